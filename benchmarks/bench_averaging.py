@@ -0,0 +1,93 @@
+'''
+Time the flag-aware averaging kernels of `quicklook_sma.averaging` on a
+block of SMA shape: all baselines of a few integrations with 16384 channels
+and 2 correlations (complex64).
+
+    python benchmarks/bench_averaging.py --num-ant 8 --num-times 10 --num-chan 16384
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+from quicklook_sma.averaging import (channel_sums, scalar_channel_sums, time_bin_ids,
+                                     baseline_sums, vector_amp_phase)
+
+
+def make_block(num_ant, num_times, num_chan, num_corr, flag_frac, seed=0):
+    '''
+    (row, chan, corr) visibilities and unflagged mask, with the row times
+    and scans. Rows are all baselines of each integration.
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    num_bl = num_ant * (num_ant - 1) // 2
+    num_rows = num_bl * num_times
+
+    shape = (num_rows, num_chan, num_corr)
+
+    vis = (rng.standard_normal(shape, dtype=np.float32) +
+           1j * rng.standard_normal(shape, dtype=np.float32)).astype(np.complex64)
+    good = rng.random(shape, dtype=np.float32) >= flag_frac
+
+    times = np.repeat(np.arange(num_times) * 30., num_bl)
+    # Two integrations per scan.
+    scans = 1 + np.repeat(np.arange(num_times) // 2, num_bl)
+
+    return vis, good, times, scans
+
+
+def _time(func, repeat):
+    '''
+    Best wall time (s) of `repeat` calls.
+    '''
+
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-ant", type=int, default=8)
+    parser.add_argument("--num-times", type=int, default=10)
+    parser.add_argument("--num-chan", type=int, default=16384)
+    parser.add_argument("--num-corr", type=int, default=2)
+    parser.add_argument("--flag-frac", type=float, default=0.05)
+    parser.add_argument("--chanavg", type=int, nargs="+", default=[16384, 128, 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(args)
+
+    vis, good, times, scans = make_block(args.num_ant, args.num_times, args.num_chan,
+                                         args.num_corr, args.flag_frac)
+
+    print(f"{vis.shape[0]} rows x {args.num_chan} channels x {args.num_corr} corrs,"
+          f" {vis.nbytes / 1024**2:.0f} MB")
+
+    for chanavg in args.chanavg:
+        vector_s = _time(lambda: vector_amp_phase(*channel_sums(vis, good, chanavg)),
+                         args.repeat)
+        scalar_s = _time(lambda: scalar_channel_sums(vis, good, chanavg), args.repeat)
+
+        print(f"chanavg={chanavg}: vector {vector_s:.3f} s, scalar {scalar_s:.3f} s")
+
+    # Baseline averaging per integration and per scan from the unbinned sums.
+    sums, counts = channel_sums(vis, good, 1)
+
+    integ_s = _time(lambda: baseline_sums(sums, counts, times), args.repeat)
+    scan_s = _time(lambda: baseline_sums(sums, counts, time_bin_ids(times, scans)),
+                   args.repeat)
+
+    print(f"baseline average per integration: {integ_s:.3f} s, per scan: {scan_s:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
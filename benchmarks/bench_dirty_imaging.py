@@ -0,0 +1,179 @@
+'''
+Time the NumPy dirty imaging (`dirty_imaging`) and measure its peak memory.
+
+Without `--vis`, a point source in a synthetic MS held in memory
+(`ms_export.DictTableBackend`) is imaged and the peak flux and position are
+checked:
+
+    python benchmarks/bench_dirty_imaging.py --num-ant 8 --num-chan 1024
+
+With `--vis` and `--field`, that field of a real MS is imaged to FITS, and
+then with `tclean(niter=0)` and `exportfits` at the same SPWs, cell, image
+size and weighting. This needs casatools and casatasks:
+
+    python benchmarks/bench_dirty_imaging.py --vis track.ms --field target --spw 0~3
+'''
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from astropy.io import fits
+
+from quicklook_sma.dirty_imaging import compute_dirty_image, dirty_image_to_fits
+from quicklook_sma.export_casa_tables.ms_export import DictTableBackend
+from quicklook_sma.tests.synthetic import make_synthetic_ms
+
+
+def _run(func):
+    '''
+    Time `func` without tracing, then run it again to measure the peak of
+    the memory allocated by NumPy and Python.
+    '''
+
+    start = time.perf_counter()
+    out = func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return out, elapsed, peak / 1024**2
+
+
+def bench_synthetic(args):
+
+    offset = (4., 3.)
+    flux = 1.5
+
+    main, subtables = make_synthetic_ms(num_ant=args.num_ant, num_scans=args.num_scans,
+                                        times_per_scan=args.times_per_scan,
+                                        num_spw=args.num_spw, num_chan=args.num_chan,
+                                        flux=flux, offset_arcsec=offset)
+
+    backend = DictTableBackend(main, subtables)
+
+    size_mb = main['DATA'].nbytes / 1024**2
+
+    print(f"{len(main['TIME'])} rows, {args.num_chan} channels x {main['DATA'].shape[0]}"
+          f" corrs, {size_mb:.0f} MB of DATA")
+
+    centre = args.imsize // 2
+
+    for weighting in ['natural', 'briggs', 'uniform']:
+
+        def func():
+            return compute_dirty_image(backend, 1, list(range(args.num_spw)), args.cell,
+                                       args.imsize, weighting=weighting,
+                                       chunk_rows=args.chunk_rows)
+
+        (image, psf, _), elapsed, peak_mb = _run(func)
+
+        yy, xx = np.unravel_index(np.argmax(image), image.shape)
+
+        # Offset of the peak east and north, in arcsec.
+        found = (-(xx - centre) * args.cell, (yy - centre) * args.cell)
+
+        print(f"{weighting}: {elapsed:.2f} s, peak memory {peak_mb:.0f} MB,"
+              f" peak {image[yy, xx]:.4f} Jy/beam (expected {flux})"
+              f" at {found} arcsec (expected {offset})")
+
+
+def _tclean_dirty_to_fits(args, imagename, fitsname):
+    '''
+    Dirty image of the same selection with tclean, with the settings of the
+    quicklook continuum imaging, exported to FITS.
+    '''
+
+    from casatasks import tclean, exportfits
+
+    tclean(vis=args.vis,
+           field=args.field,
+           spw=str(args.spw),
+           cell=f"{args.cell}arcsec",
+           imsize=[args.imsize, args.imsize],
+           specmode='mfs',
+           nterms=1,
+           weighting=args.weighting,
+           robust=0.0,
+           niter=0,
+           imagename=imagename,
+           pblimit=0.5)
+
+    exportfits(imagename=f"{imagename}.image",
+               fitsimage=fitsname,
+               history=False,
+               overwrite=True)
+
+
+def _fits_peak(fitsname):
+    '''
+    Peak of the finite pixels in a FITS image.
+    '''
+
+    return np.nanmax(fits.getdata(fitsname))
+
+
+def bench_ms(args):
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        fitsname = os.path.join(tmp_dir, f"{args.field}.fits")
+
+        def func():
+            return dirty_image_to_fits(args.vis, args.field, args.spw, args.cell,
+                                       args.imsize, fitsname,
+                                       weighting=args.weighting,
+                                       chunk_rows=args.chunk_rows)
+
+        beam, elapsed, peak_mb = _run(func)
+
+        print(f"numpy {args.weighting}: {elapsed:.1f} s, peak memory {peak_mb:.0f} MB,"
+              f" beam {beam}, image peak {_fits_peak(fitsname):.4g}")
+
+        tclean_fitsname = os.path.join(tmp_dir, f"tclean_{args.field}.fits")
+
+        # tclean's memory is allocated outside Python, so only the time is
+        # measured.
+        start = time.perf_counter()
+        _tclean_dirty_to_fits(args, os.path.join(tmp_dir, f"tclean_{args.field}"),
+                              tclean_fitsname)
+        tclean_elapsed = time.perf_counter() - start
+
+        print(f"tclean {args.weighting}: {tclean_elapsed:.1f} s,"
+              f" image peak {_fits_peak(tclean_fitsname):.4g}")
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vis", default=None)
+    parser.add_argument("--field", default=None)
+    parser.add_argument("--spw", default="0~3")
+    parser.add_argument("--weighting", default="briggs")
+    parser.add_argument("--cell", type=float, default=0.5)
+    parser.add_argument("--imsize", type=int, default=256)
+    parser.add_argument("--num-ant", type=int, default=8)
+    parser.add_argument("--num-scans", type=int, default=6)
+    parser.add_argument("--times-per-scan", type=int, default=20)
+    parser.add_argument("--num-spw", type=int, default=2)
+    parser.add_argument("--num-chan", type=int, default=1024)
+    parser.add_argument("--chunk-rows", type=int, default=100000)
+    args = parser.parse_args(args)
+
+    if args.vis is None:
+        bench_synthetic(args)
+    else:
+        if args.field is None:
+            parser.error("--field is required with --vis.")
+        bench_ms(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+'''
+Time the numpy QA table export (`ms_export`) against the plotms export.
+
+Without `--vis`, the numpy engine is timed on a synthetic MS held in memory
+(`ms_export.DictTableBackend`):
+
+    python benchmarks/bench_ms_export.py --num-ant 8 --num-chan 1024
+
+With `--vis` and `--field`, both engines export all QA tables of that field
+of a real MS. This needs casatools and casaplotms:
+
+    python benchmarks/bench_ms_export.py --vis track.ms --field 3c279
+'''
+
+import argparse
+import os
+import tempfile
+import time
+
+from quicklook_sma.export_casa_tables.ms_export import (DictTableBackend, CasaTableBackend,
+                                                         compute_field_products,
+                                                         export_field_tables, read_ms_info)
+from quicklook_sma.export_casa_tables.qa_plot_tools import QA_TABLE_MAPPING, _plotms_qa_table
+from quicklook_sma.tests.synthetic import make_synthetic_ms
+
+
+def bench_synthetic(args):
+
+    main, subtables = make_synthetic_ms(num_ant=args.num_ant, num_scans=args.num_scans,
+                                        times_per_scan=args.times_per_scan,
+                                        num_spw=args.num_spw, num_chan=args.num_chan,
+                                        model_scale=0.9, flag_frac=0.1)
+
+    backend = DictTableBackend(main, subtables)
+
+    num_rows = len(main['TIME'])
+    size_mb = main['DATA'].nbytes / 1024**2
+
+    print(f"{num_rows} rows, {args.num_chan} channels x {main['DATA'].shape[0]} corrs,"
+          f" {size_mb:.0f} MB of DATA")
+
+    start = time.perf_counter()
+    out = compute_field_products(backend, 0, QA_TABLE_MAPPING,
+                                 chanavg_vs_chan=args.chanavg_vs_chan,
+                                 chunk_rows=args.chunk_rows)
+    elapsed = time.perf_counter() - start
+
+    num_out = sum(len(columns['y']) for columns in out.values())
+
+    print(f"numpy: {len(out)} tables, {num_out} rows in {elapsed:.2f} s")
+
+
+def bench_ms(args):
+
+    products = QA_TABLE_MAPPING
+
+    backend = CasaTableBackend(args.vis)
+    ms_info = read_ms_info(backend)
+
+    field_names = [str(name) for name in backend.read_subtable('FIELD', ['NAME'])['NAME']]
+    field_id = field_names.index(args.field)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        filenames = {key: os.path.join(tmp_dir, f"numpy_{key}.txt") for key in products}
+
+        start = time.perf_counter()
+        export_field_tables(backend, field_id, args.field, products, filenames,
+                            chanavg_vs_chan=args.chanavg_vs_chan,
+                            chunk_rows=args.chunk_rows, ms_info=ms_info)
+        print(f"numpy: {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        for key, product in products.items():
+            _plotms_qa_table(args.vis, args.field, product,
+                             os.path.join(tmp_dir, f"plotms_{key}.txt"),
+                             chanavg_vs_chan=args.chanavg_vs_chan)
+        print(f"plotms: {time.perf_counter() - start:.1f} s")
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vis", default=None)
+    parser.add_argument("--field", default=None)
+    parser.add_argument("--num-ant", type=int, default=8)
+    parser.add_argument("--num-scans", type=int, default=6)
+    parser.add_argument("--times-per-scan", type=int, default=20)
+    parser.add_argument("--num-spw", type=int, default=2)
+    parser.add_argument("--num-chan", type=int, default=1024)
+    parser.add_argument("--chanavg-vs-chan", type=int, default=8)
+    parser.add_argument("--chunk-rows", type=int, default=100000)
+    args = parser.parse_args(args)
+
+    if args.vis is None:
+        bench_synthetic(args)
+    else:
+        if args.field is None:
+            parser.error("--field is required with --vis.")
+        bench_ms(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+'''
+Compare the numpy and astropy engines of `read_data_sma.read_casa_txt` on
+synthetic plotms txt exports.
+
+    python benchmarks/bench_read_casa_txt.py --rows 10000 100000 1000000 10000000
+'''
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from quicklook_sma.read_data_sma import read_casa_txt
+from quicklook_sma.tests.synthetic import make_plotms_txt
+
+
+def time_engine(filename, engine):
+    '''
+    Wall time (s) and traced peak memory (MB) of one read without the table
+    cache. The peak is from a second read since tracing slows the parsing.
+    '''
+
+    try:
+        start = time.perf_counter()
+        read_casa_txt(filename, engine=engine, use_cache=False)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        try:
+            read_casa_txt(filename, engine=engine, use_cache=False)
+            peak = tracemalloc.get_traced_memory()[1] / 1024**2
+        finally:
+            tracemalloc.stop()
+
+    except MemoryError:
+        return None, None
+
+    return elapsed, peak
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+",
+                        default=[10000, 100000, 1000000])
+    parser.add_argument("--engines", nargs="+", default=['numpy', 'astropy'])
+    args = parser.parse_args(args)
+
+    print(f"{'rows':>10} {'MB':>8} " +
+          " ".join(f"{engine + ' s':>12} {engine + ' MB':>12}" for engine in args.engines))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        for num_rows in args.rows:
+
+            filename = os.path.join(tmp_dir, f"field_bench_amp_chan_{num_rows}.txt")
+            make_plotms_txt(filename, num_rows)
+
+            size_mb = os.path.getsize(filename) / 1024**2
+
+            results = []
+            for engine in args.engines:
+                elapsed, peak = time_engine(filename, engine)
+
+                if elapsed is None:
+                    results.append(f"{'MemoryError':>12} {'':>12}")
+                else:
+                    results.append(f"{elapsed:12.2f} {peak:12.0f}")
+
+            print(f"{num_rows:10d} {size_mb:8.1f} " + " ".join(results))
+
+            os.remove(filename)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,12 @@ casalog = logsink()
 
 
 # Command line inputs.
+# With "--plan-only", only the imaging plan is made and logged.
 
-config_filename = sys.argv[-1]
+plan_only = "--plan-only" in sys.argv
+
+# The config file is the last argument that is not the flag.
+config_filename = [arg for arg in sys.argv if arg != "--plan-only"][-1]
 
 sma_config = read_config(config_filename)
 
@@ -39,6 +43,19 @@ if not os.path.exists(products_folder):
 # --------------------------------
 run_quicklook = True
 
+# imaging_workers : int
+# Number of tclean jobs (one per field and sideband) run at the same time.
+# Memory use is kept under 75% of the machine's memory.
+imaging_workers = 1
+
+# imaging_engine : str
+# 'tclean', or 'numpy' for fast dirty images gridded and FFT'd without
+# tclean. 'numpy' does not clean, so the calibrator images are dirty too.
+imaging_engine = 'tclean'
+
+# The cell and image sizes are cached here and shared by both passes.
+imaging_plan_file = "quicklook_imaging_plan.json"
+
 # Run dirty imaging only for a quicklook
 if run_quicklook:
 
@@ -46,7 +63,11 @@ if run_quicklook:
     quicklook_continuum_imaging(config_filename,
                                 image_type='target',
                                 niter=0, nsigma=5.,
-                                output_folder="quicklook_imaging")
+                                output_folder="quicklook_imaging",
+                                n_workers=imaging_workers,
+                                plan_file=imaging_plan_file,
+                                plan_only=plan_only,
+                                engine=imaging_engine)
 
 
     # Gain and bandpass cals. No imaging of the flux cal by default.
@@ -55,7 +76,14 @@ if run_quicklook:
     quicklook_continuum_imaging(config_filename,
                                 image_type='calibrator',
                                 niter=20, nsigma=5.,
-                                output_folder="quicklook_calibrator_imaging")
+                                output_folder="quicklook_calibrator_imaging",
+                                n_workers=imaging_workers,
+                                plan_file=imaging_plan_file,
+                                plan_only=plan_only,
+                                engine=imaging_engine)
+
+    if plan_only:
+        sys.exit(0)
 
     os.system("cp -r {0} {1}".format('quicklook_imaging', products_folder))
     os.system("cp -r {0} {1}".format('quicklook_calibrator_imaging', products_folder))
@@ -72,6 +100,11 @@ make_all_caltable_txt(config_filename)
 # to 128 per chunk/SPW. CHOOSING LARGER VALUES WILL RESULT IN LARGE DATA FILES!
 chans_to_show = 128
 
+# n_workers : int
+# Number of fields exported at the same time. Each worker reads the MS, so
+# keep this small on slow disks.
+n_workers = 1
+
 this_config = read_config(config_filename)
 
 # Calculate the number of channels from the given rechunk factor
@@ -90,7 +123,8 @@ make_qa_tables(config_filename,
                 outtype='txt',
                 overwrite=False,
                 chanavg_vs_time=16384,
-                chanavg_vs_chan=chans_to_avg)
+                chanavg_vs_chan=chans_to_avg,
+                n_workers=n_workers)
 
 # make_all_flagsummary_data(myvis, output_folder='perfield_flagfraction_txt')
 
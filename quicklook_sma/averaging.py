@@ -0,0 +1,210 @@
+
+'''
+Flag-aware averaging of visibility blocks.
+
+The blocks have shape (row, chan, corr) with a matching boolean `good` mask
+that is True for unflagged samples. The reductions return sums and counts
+rather than means, so results from separate chunks of rows can be added
+before dividing with `finish_mean`.
+
+Vector averages sum the complex visibilities and take the amplitude and
+phase of the mean (`vector_amp_phase`). Scalar averages sum the amplitudes
+instead (`scalar_channel_sums`).
+'''
+
+import numpy as np
+
+from quicklook_sma.downsample import bin_starts
+
+
+def channel_sums(values, good, chanavg):
+    '''
+    Sum of the unflagged `values` in bins of `chanavg` channels.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        (row, chan, corr) block. Complex for vector averaging.
+    good : numpy.ndarray
+        Boolean (row, chan, corr) mask of the unflagged samples.
+    chanavg : int
+        Number of channels per bin. The last bin may be partially filled.
+
+    Returns
+    -------
+    sums : numpy.ndarray
+        (row, bin, corr) sums.
+    counts : numpy.ndarray
+        (row, bin, corr) number of unflagged samples in each sum.
+    '''
+
+    starts = bin_starts(values.shape[1], chanavg)
+
+    sums = np.add.reduceat(np.where(good, values, 0), starts, axis=1)
+    counts = np.add.reduceat(good, starts, axis=1, dtype=np.int64)
+
+    return sums, counts
+
+
+def channel_bin_centers(values, chanavg):
+    '''
+    Mean of the per-channel `values` (e.g., channel index or frequency) in
+    each bin of `chanavg` channels.
+    '''
+
+    values = np.asarray(values, dtype=float)
+
+    starts = bin_starts(len(values), chanavg)
+    counts = np.diff(np.append(starts, len(values)))
+
+    return np.add.reduceat(values, starts) / counts
+
+
+def scalar_channel_sums(vis, good, chanavg):
+    '''
+    Sum of the unflagged amplitudes in bins of `chanavg` channels.
+    '''
+
+    return channel_sums(np.abs(vis), good, chanavg)
+
+
+def time_bin_ids(times, scans=None, interval=None):
+    '''
+    Integer time bin of each row.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        Row times.
+    scans : numpy.ndarray, optional
+        Scan number of each row. Bins never cross a scan boundary.
+    interval : float, optional
+        Bin width in the units of `times`. With `None`, every scan is one
+        bin, like plotms with `avgtime='1e8'`.
+
+    Returns
+    -------
+    bin_ids : numpy.ndarray
+        Bin index of each row, ordered by scan then time.
+    '''
+
+    times = np.asarray(times, dtype=float)
+
+    if scans is None:
+        scans = np.zeros(len(times), dtype=np.int64)
+
+    scan_values, scan_ids = np.unique(scans, return_inverse=True)
+    scan_ids = scan_ids.ravel()
+
+    if interval is None:
+        return scan_ids
+
+    # Bins start at the first time in each scan.
+    scan_start = np.full(len(scan_values), np.inf)
+    np.minimum.at(scan_start, scan_ids, times)
+
+    time_ids = np.floor((times - scan_start[scan_ids]) / interval).astype(np.int64)
+
+    _, bin_ids = np.unique(scan_ids * (time_ids.max() + 1) + time_ids,
+                           return_inverse=True)
+
+    return bin_ids.ravel()
+
+
+def row_group_sums(values, group_ids):
+    '''
+    Sum the rows (first axis) of `values` that share a group id.
+
+    Returns the sorted unique group ids and the summed block with one row
+    per group.
+    '''
+
+    group_ids = np.asarray(group_ids)
+
+    order = np.argsort(group_ids, kind='stable')
+    sorted_ids = group_ids[order]
+
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+
+    return sorted_ids[starts], np.add.reduceat(values[order], starts, axis=0)
+
+
+def baseline_sums(sums, counts, times):
+    '''
+    Combine the (row, bin, corr) sums and counts of all baselines in each
+    integration. Returns the integration times with the combined sums and
+    counts.
+    '''
+
+    unique_times, time_sums = row_group_sums(sums, times)
+    _, time_counts = row_group_sums(counts, times)
+
+    return unique_times, time_sums, time_counts
+
+
+def group_sums(keys, values, return_first=False):
+    '''
+    Sum each flat array in `values` over the entries sharing the same key
+    columns.
+
+    Returns the key columns and summed values for each group, sorted by key.
+    With `return_first`, the index of the first entry in each group is
+    also returned.
+    '''
+
+    group_id = np.zeros(len(keys[0]), dtype=np.int64)
+
+    for key in keys:
+        uniq, inv = np.unique(key, return_inverse=True)
+        group_id = group_id * len(uniq) + inv.ravel()
+
+    _, first, inv = np.unique(group_id, return_index=True, return_inverse=True)
+
+    num_groups = len(first)
+
+    out_keys = [key[first] for key in keys]
+    out_values = []
+
+    for value in values:
+        if np.iscomplexobj(value):
+            out_values.append(np.bincount(inv, weights=value.real, minlength=num_groups) +
+                              1j * np.bincount(inv, weights=value.imag, minlength=num_groups))
+        else:
+            out_values.append(np.bincount(inv, weights=value, minlength=num_groups))
+
+    if return_first:
+        return out_keys, out_values, first
+
+    return out_keys, out_values
+
+
+def finish_mean(sums, counts):
+    '''
+    Mean from sums and counts. Empty bins are NaN.
+    '''
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def vector_amp_phase(vis_sums, counts):
+    '''
+    Amplitude and phase (in degrees) of the vector-averaged visibilities.
+    '''
+
+    mean_vis = finish_mean(vis_sums, counts)
+
+    return np.abs(mean_vis), np.rad2deg(np.angle(mean_vis))
+
+
+def circular_mean_deg(phases, group_ids):
+    '''
+    Mean of the phases (in degrees) in each group, accounting for the wrap
+    at +/-180 deg. Returns the sorted unique group ids and mean phases.
+    '''
+
+    phasors = np.exp(1j * np.deg2rad(np.asarray(phases, dtype=float)))
+
+    unique_ids, phasor_sums = row_group_sums(phasors, group_ids)
+
+    return unique_ids, np.rad2deg(np.angle(phasor_sums))
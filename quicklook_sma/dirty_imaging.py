@@ -0,0 +1,706 @@
+
+'''
+Dirty MFS imaging of one field with NumPy.
+
+A lightweight replacement for an nterms=1, niter=0 `tclean` call for the
+quicklook images. The visibilities are read in chunks and averaged into
+narrow channel bins. They are gridded with a Kaiser-Bessel kernel using
+natural, uniform or Briggs weights, and the grid is FFT'd to a dirty image
+that is written straight to FITS. The restoring beam in the header is
+fit to the PSF.
+
+The w-term is ignored, which is fine for the small SMA primary beam. Only
+the parallel-hand correlations are used, giving a Stokes I image.
+
+The table access uses the backends in `export_casa_tables.ms_export`, so
+the imaging can be run on a fake MS without CASA.
+'''
+
+import os
+import tempfile
+import numpy as np
+
+from quicklook_sma.downsample import bin_starts
+from quicklook_sma.averaging import channel_sums, channel_bin_centers
+from quicklook_sma.export_casa_tables.ms_export import (CasaTableBackend, read_ms_info,
+                                                         DATACOLUMN_MAPPING)
+
+
+# Speed of light in m/s
+_C_LIGHT = 299792458.
+
+# Width of the gridding kernel in grid cells.
+KERNEL_WIDTH = 6
+
+# The kernel is tabulated at this many points per grid cell.
+KERNEL_OVERSAMPLING = 1000
+
+# The uv-grid is made this much larger than the image so the aliasing from
+# the gridding kernel falls outside the image.
+GRID_PADDING = 1.2
+
+PARALLEL_HANDS = ['I', 'XX', 'YY', 'RR', 'LL']
+
+_IMAGING_COLUMNS = ['UVW', 'ANTENNA1', 'ANTENNA2', 'FLAG', 'WEIGHT']
+
+
+def kb_beta(width=KERNEL_WIDTH, padding=GRID_PADDING):
+    '''
+    Kaiser-Bessel shape parameter for the kernel width and grid padding,
+    following Beatty et al. (2005).
+    '''
+
+    return np.pi * np.sqrt((width / padding)**2 * (padding - 0.5)**2 - 0.8)
+
+
+def kaiser_bessel(x, width=KERNEL_WIDTH, beta=None):
+    '''
+    Kaiser-Bessel gridding kernel at offsets `x` (in grid cells). Zero
+    outside of +/- width / 2.
+    '''
+
+    if beta is None:
+        beta = kb_beta(width)
+
+    x = np.asarray(x, dtype=float)
+
+    arg = 1 - (2 * x / width)**2
+
+    return np.where(arg > 0, np.i0(beta * np.sqrt(np.clip(arg, 0, None))), 0.)
+
+
+def grid_correction(num_pix, width=KERNEL_WIDTH, beta=None, num_samples=2001):
+    '''
+    Fourier transform of the gridding kernel at each of the `num_pix`
+    image pixels along one axis, used to correct the image for the
+    kernel taper.
+    '''
+
+    offsets = np.linspace(-width / 2, width / 2, num_samples)
+    kernel = kaiser_bessel(offsets, width=width, beta=beta)
+
+    # Image pixel positions in cycles per grid cell.
+    freqs = (np.arange(num_pix) - num_pix // 2) / num_pix
+
+    # The kernel is zero at both ends, so a plain sum is the trapezoid rule.
+    return np.sum(kernel[None, :] * np.cos(2 * np.pi * freqs[:, None] * offsets[None, :]),
+                  axis=1) * (offsets[1] - offsets[0])
+
+
+def padded_grid_size(imsize, padding=GRID_PADDING):
+    '''
+    Even uv-grid size for an `imsize` image.
+    '''
+
+    num_grid = int(np.ceil(imsize * padding))
+
+    return num_grid + num_grid % 2
+
+
+def chan_bin_width(chan_freq, max_frac_bandwidth=1e-3):
+    '''
+    Number of channels averaged before gridding, keeping the fractional
+    bandwidth of each bin below `max_frac_bandwidth` so the bandwidth
+    smearing is negligible across the image.
+    '''
+
+    chan_freq = np.asarray(chan_freq, dtype=float)
+
+    if len(chan_freq) < 2:
+        return 1
+
+    chan_width = np.abs(np.median(np.diff(chan_freq)))
+    max_width = max_frac_bandwidth * np.min(chan_freq)
+
+    return max(int(max_width // chan_width), 1)
+
+
+def chunk_uv_samples(chunk, chan_freq, chanavg, corr_idx, data_colname=None):
+    '''
+    uv-coordinates (in wavelengths), weights and weighted visibility sums
+    of the unflagged channel bins of one chunk of cross-correlations.
+
+    Parameters
+    ----------
+    chunk : dict
+        Main table columns in the casatools layout (rows last).
+    chan_freq : numpy.ndarray
+        Channel frequencies in Hz.
+    chanavg : int
+        Channels averaged per bin.
+    corr_idx : list
+        Correlations to use.
+    data_colname : str, optional
+        Data column. Without it, only the coordinates and weights are
+        returned.
+
+    Returns
+    -------
+    samples : dict
+        Flat 'u', 'v', 'freq' (Hz) and 'weight' arrays and, with
+        `data_colname`, 'vis' (the weighted sum of the visibilities in each
+        bin).
+    '''
+
+    cross = chunk['ANTENNA1'] != chunk['ANTENNA2']
+
+    # casatools layout is (corr, chan, row). Move rows first.
+    good = ~np.transpose(chunk['FLAG'][corr_idx][..., cross], (2, 1, 0))
+    weight = np.transpose(chunk['WEIGHT'][corr_idx][..., cross])
+
+    if data_colname is None:
+        count = np.add.reduceat(good, bin_starts(good.shape[1], chanavg), axis=1,
+                                dtype=np.int64)
+    else:
+        data = np.transpose(chunk[data_colname][corr_idx][..., cross], (2, 1, 0))
+        vis_sum, count = channel_sums(data, good, chanavg)
+
+    bin_freq = channel_bin_centers(chan_freq, chanavg)
+
+    shape = count.shape
+
+    # Each bin has the weight of its unflagged channels.
+    bin_weight = weight[:, None, :] * count
+
+    keep = bin_weight.ravel() > 0
+
+    uvw = chunk['UVW'][:, cross]
+
+    u = np.broadcast_to((uvw[0][:, None] * bin_freq[None, :] / _C_LIGHT)[:, :, None], shape)
+    v = np.broadcast_to((uvw[1][:, None] * bin_freq[None, :] / _C_LIGHT)[:, :, None], shape)
+
+    samples = {'u': u.ravel()[keep],
+               'v': v.ravel()[keep],
+               'freq': np.broadcast_to(bin_freq[None, :, None], shape).ravel()[keep],
+               'weight': bin_weight.ravel()[keep]}
+
+    if data_colname is not None:
+        # Flagged channels are already zero in the sums.
+        samples['vis'] = (weight[:, None, :] * vis_sum).ravel()[keep]
+
+    return samples
+
+
+def _grid_coords(samples, num_grid, uv_cell):
+    '''
+    Grid coordinates of the samples. u is negated so that RA increases
+    to the left of the image.
+    '''
+
+    return (-samples['u'] / uv_cell + num_grid // 2,
+            samples['v'] / uv_cell + num_grid // 2)
+
+
+def grid_weight_density(density, samples, uv_cell, width=KERNEL_WIDTH):
+    '''
+    Add the natural weights of the samples to the nearest cell of the
+    `density` grid, used for uniform and Briggs weighting. Samples falling
+    off the grid are ignored.
+    '''
+
+    num_grid = density.shape[0]
+
+    gu, gv = _grid_coords(samples, num_grid, uv_cell)
+
+    iu = np.rint(gu).astype(np.int64)
+    iv = np.rint(gv).astype(np.int64)
+
+    margin = width // 2 + 1
+
+    on_grid = (iu >= margin) & (iu < num_grid - margin) & \
+        (iv >= margin) & (iv < num_grid - margin)
+
+    density += np.bincount(iv[on_grid] * num_grid + iu[on_grid],
+                           weights=samples['weight'][on_grid],
+                           minlength=num_grid**2).reshape(density.shape)
+
+
+def symmetric_density(density):
+    '''
+    Weight density including the conjugate of every sample at (-u, -v).
+    '''
+
+    return density + np.roll(density[::-1, ::-1], 1, axis=(0, 1))
+
+
+def imaging_weights(samples, density, uv_cell, weighting='briggs', robust=0.0):
+    '''
+    Imaging weights of the samples.
+
+    Parameters
+    ----------
+    density : numpy.ndarray
+        Output of `symmetric_density`. Not used for natural weighting.
+    weighting : str, optional
+        'natural', 'uniform' or 'briggs'.
+    robust : float, optional
+        Briggs robust parameter, as in `tclean`.
+    '''
+
+    if weighting == 'natural':
+        return samples['weight']
+
+    num_grid = density.shape[0]
+
+    gu, gv = _grid_coords(samples, num_grid, uv_cell)
+
+    iu = np.clip(np.rint(gu).astype(np.int64), 0, num_grid - 1)
+    iv = np.clip(np.rint(gv).astype(np.int64), 0, num_grid - 1)
+
+    cell_density = density[iv, iu]
+
+    if weighting == 'uniform':
+        return samples['weight'] / np.maximum(cell_density, np.finfo(float).tiny)
+
+    if weighting != 'briggs':
+        raise ValueError(f"weighting must be 'natural', 'uniform' or 'briggs'. Received {weighting}")
+
+    # Same definition as tclean.
+    f2 = (5 * 10**(-robust))**2 / (np.sum(density**2) / np.sum(density))
+
+    return samples['weight'] / (1 + cell_density * f2)
+
+
+def kernel_table(width=KERNEL_WIDTH, beta=None, oversampling=KERNEL_OVERSAMPLING):
+    '''
+    Kaiser-Bessel kernel tabulated at `oversampling` points per grid cell
+    across its full width.
+    '''
+
+    half_width = width * oversampling // 2
+
+    return kaiser_bessel(np.arange(-half_width, half_width + 1) / oversampling,
+                         width=width, beta=beta)
+
+
+def grid_samples(grids, samples, values, uv_cell, table, width=KERNEL_WIDTH,
+                 oversampling=KERNEL_OVERSAMPLING):
+    '''
+    Add each array in `values` at the sample uv-coordinates to the matching
+    grid in `grids` with the tabulated gridding kernel (see `kernel_table`).
+    Samples whose kernel extends off the grid are ignored.
+
+    Returns the sums of `values` that were gridded.
+    '''
+
+    num_grid = grids[0].shape[0]
+
+    gu, gv = _grid_coords(samples, num_grid, uv_cell)
+
+    base_u = np.floor(gu).astype(np.int64) - width // 2 + 1
+    base_v = np.floor(gv).astype(np.int64) - width // 2 + 1
+
+    on_grid = (base_u >= 0) & (base_u + width <= num_grid) & \
+        (base_v >= 0) & (base_v + width <= num_grid)
+
+    gu, gv = gu[on_grid], gv[on_grid]
+    base_u, base_v = base_u[on_grid], base_v[on_grid]
+    values = [value[on_grid] for value in values]
+
+    offsets = np.arange(width)
+
+    # Table index of the kernel at each grid cell offset from the sample.
+    half_width = width * oversampling // 2
+
+    def lookup(base, coord):
+        idx = np.rint((base[:, None] + offsets[None, :] - coord[:, None]) * oversampling)
+        return table[np.clip(idx.astype(np.int64) + half_width, 0, len(table) - 1)]
+
+    kern_u = lookup(base_u, gu)
+    kern_v = lookup(base_v, gv)
+
+    flat_grids = [grid.reshape(-1) for grid in grids]
+
+    for jj in offsets:
+
+        row_idx = (base_v + jj) * num_grid
+
+        for ii in offsets:
+
+            idx = row_idx + base_u + ii
+            kern = kern_v[:, jj] * kern_u[:, ii]
+
+            for flat_grid, value in zip(flat_grids, values):
+
+                if np.iscomplexobj(value):
+                    flat_grid += np.bincount(idx, weights=kern * value.real,
+                                             minlength=num_grid**2)
+                    flat_grid += 1j * np.bincount(idx, weights=kern * value.imag,
+                                                  minlength=num_grid**2)
+                else:
+                    flat_grid += np.bincount(idx, weights=kern * value,
+                                             minlength=num_grid**2)
+
+    return [np.sum(value) for value in values]
+
+
+def grid_to_image(grid, imsize, correction):
+    '''
+    FFT the uv-grid and return the central `imsize` pixels corrected for
+    the kernel taper. Only the real part is kept since the conjugate
+    samples are not gridded.
+    '''
+
+    num_grid = grid.shape[0]
+
+    image = np.fft.fftshift(np.fft.ifft2(np.fft.ifftshift(grid))).real * num_grid**2
+
+    image /= correction[:, None] * correction[None, :]
+
+    start = num_grid // 2 - imsize // 2
+
+    return image[start:start + imsize, start:start + imsize]
+
+
+def fit_beam(psf, cell_arcsec, threshold=0.5):
+    '''
+    Gaussian beam fit to the main lobe of the PSF.
+
+    The pixels above `threshold` connected to the peak are fit with a 2D
+    Gaussian centred on the peak, from a linear fit to the log of the PSF.
+
+    Returns
+    -------
+    bmaj, bmin : float
+        FWHM in arcsec.
+    bpa : float
+        Position angle of the major axis in deg, east of north.
+    '''
+
+    imsize = psf.shape[0]
+    centre = imsize // 2
+
+    above = psf > threshold
+
+    # Grow the main lobe out from the peak.
+    lobe = np.zeros_like(above)
+    lobe[centre, centre] = True
+
+    while True:
+        grown = lobe.copy()
+        grown[1:] |= lobe[:-1]
+        grown[:-1] |= lobe[1:]
+        grown[:, 1:] |= lobe[:, :-1]
+        grown[:, :-1] |= lobe[:, 1:]
+        grown &= above
+
+        if np.array_equal(grown, lobe):
+            break
+
+        lobe = grown
+
+    yy, xx = np.nonzero(lobe)
+
+    # Offsets east (RA increases to the left) and north.
+    east = -(xx - centre) * cell_arcsec
+    north = (yy - centre) * cell_arcsec
+
+    # ln psf = -0.5 * (a e^2 + 2 b e n + c n^2)
+    design = np.vstack([east**2, 2 * east * north, north**2]).T
+    coeffs = np.linalg.lstsq(design, -2 * np.log(psf[yy, xx]), rcond=None)[0]
+
+    inv_cov = np.array([[coeffs[0], coeffs[1]], [coeffs[1], coeffs[2]]])
+
+    # A lobe only one pixel wide cannot be fit. Use the pixel size.
+    if len(yy) < 3 or np.any(np.linalg.eigvalsh(inv_cov) <= 0):
+        return cell_arcsec, cell_arcsec, 0.
+
+    eigvals, eigvecs = np.linalg.eigh(np.linalg.inv(inv_cov))
+
+    fwhm = 2 * np.sqrt(2 * np.log(2)) * np.sqrt(eigvals)
+
+    major_east, major_north = eigvecs[:, 1]
+
+    bpa = np.rad2deg(np.arctan2(major_east, major_north))
+    bpa = (bpa + 90.) % 180. - 90.
+
+    return fwhm[1], fwhm[0], bpa
+
+
+def compute_dirty_image(backend, field_id, ddids, cell_arcsec, imsize,
+                        weighting='briggs', robust=0.0, datacolumn=None,
+                        chunk_rows=100000, ms_info=None, max_frac_bandwidth=1e-3):
+    '''
+    Dirty image and PSF of one field.
+
+    The MS is read twice: first only the uvw, flags and weights to find the
+    weight density for uniform or Briggs weighting, then with the data to
+    grid the visibilities.
+
+    Parameters
+    ----------
+    backend : `ms_export.CasaTableBackend` or `ms_export.DictTableBackend`
+        Table access for the MS.
+    field_id : int
+        FIELD_ID to image.
+    ddids : list
+        DATA_DESC_IDs combined into the image.
+    cell_arcsec : float
+        Pixel size.
+    imsize : int
+        Image size in pixels.
+    weighting : str, optional
+        'natural', 'uniform' or 'briggs'.
+    robust : float, optional
+        Briggs robust parameter.
+    datacolumn : str, optional
+        'data', 'corrected' or 'model'. Defaults to 'corrected' when it
+        exists, otherwise 'data', as in tclean.
+    chunk_rows : int, optional
+        Number of rows read at once.
+    ms_info : dict, optional
+        Output of `ms_export.read_ms_info`.
+    max_frac_bandwidth : float, optional
+        Channels are averaged before gridding up to this fractional
+        bandwidth (see `chan_bin_width`).
+
+    Returns
+    -------
+    image : numpy.ndarray
+        Dirty image in Jy/beam, with RA increasing to the left.
+    psf : numpy.ndarray
+        PSF normalized to a peak of 1.
+    ref_freq : float
+        Weighted mean frequency in Hz.
+    '''
+
+    if ms_info is None:
+        ms_info = read_ms_info(backend)
+
+    if datacolumn is None:
+        datacolumn = 'corrected' if 'CORRECTED_DATA' in backend.colnames() else 'data'
+
+    data_colname = DATACOLUMN_MAPPING[datacolumn]
+
+    num_grid = padded_grid_size(imsize)
+
+    # uv-cell size in wavelengths.
+    uv_cell = 1. / (num_grid * np.deg2rad(cell_arcsec / 3600.))
+
+    beta = kb_beta(KERNEL_WIDTH)
+    table = kernel_table(beta=beta)
+
+    def ddid_setup(ddid):
+        chan_freq = ms_info['chan_freq'][ddid]
+        corr_names = ms_info['corr_names'][ddid]
+
+        corr_idx = [ii for ii, name in enumerate(corr_names) if name in PARALLEL_HANDS]
+        if len(corr_idx) == 0:
+            corr_idx = list(range(len(corr_names)))
+
+        return chan_freq, chan_bin_width(chan_freq, max_frac_bandwidth), corr_idx
+
+    density = np.zeros((num_grid, num_grid))
+
+    if weighting != 'natural':
+        for ddid in ddids:
+            chan_freq, chanavg, corr_idx = ddid_setup(ddid)
+
+            for chunk in backend.iter_chunks(field_id, ddid, _IMAGING_COLUMNS, chunk_rows):
+                grid_weight_density(density,
+                                    chunk_uv_samples(chunk, chan_freq, chanavg, corr_idx),
+                                    uv_cell)
+
+        density = symmetric_density(density)
+
+    vis_grid = np.zeros((num_grid, num_grid), dtype=complex)
+    psf_grid = np.zeros((num_grid, num_grid))
+
+    weight_sum = 0.
+    freq_sum = 0.
+    freq_weight_sum = 0.
+
+    for ddid in ddids:
+        chan_freq, chanavg, corr_idx = ddid_setup(ddid)
+
+        for chunk in backend.iter_chunks(field_id, ddid, _IMAGING_COLUMNS + [data_colname],
+                                         chunk_rows):
+
+            samples = chunk_uv_samples(chunk, chan_freq, chanavg, corr_idx,
+                                       data_colname=data_colname)
+
+            if len(samples['weight']) == 0:
+                continue
+
+            img_weight = imaging_weights(samples, density, uv_cell,
+                                         weighting=weighting, robust=robust)
+
+            # The visibility sums already include the natural weights.
+            scale = img_weight / samples['weight']
+
+            this_weight = grid_samples([vis_grid, psf_grid], samples,
+                                       [samples['vis'] * scale, img_weight],
+                                       uv_cell, table)[1]
+
+            weight_sum += this_weight
+            freq_sum += np.sum(img_weight * samples['freq'])
+            freq_weight_sum += np.sum(img_weight)
+
+    if weight_sum == 0:
+        raise ValueError(f"No unflagged data for field {field_id} in {ddids}.")
+
+    correction = grid_correction(num_grid, beta=beta)
+
+    image = grid_to_image(vis_grid, imsize, correction) / weight_sum
+    psf = grid_to_image(psf_grid, imsize, correction) / weight_sum
+
+    return image, psf, freq_sum / freq_weight_sum
+
+
+def spw_range_ids(spw):
+    '''
+    SPW numbers in a CASA SPW selection of numbers and "min~max" ranges
+    (e.g., "0~3,6").
+    '''
+
+    spw_ids = []
+
+    for part in str(spw).split(","):
+        if "~" in part:
+            low, high = part.split("~")
+            spw_ids.extend(range(int(low), int(high) + 1))
+        else:
+            spw_ids.append(int(part))
+
+    return spw_ids
+
+
+def write_dirty_fits(filename, image, ra_deg, dec_deg, cell_arcsec, ref_freq, beam,
+                     bandwidth=None, field_name=None):
+    '''
+    Write the dirty image to FITS with the axes of a `tclean` image
+    exported with `exportfits` (RA, Dec, frequency, Stokes).
+
+    The file is written to a temporary name and renamed when complete.
+    '''
+
+    from astropy.io import fits
+
+    imsize = image.shape[0]
+
+    header = fits.Header()
+
+    header['BUNIT'] = 'Jy/beam'
+    header['BMAJ'] = beam[0] / 3600.
+    header['BMIN'] = beam[1] / 3600.
+    header['BPA'] = beam[2]
+    header['BTYPE'] = 'Intensity'
+    if field_name is not None:
+        header['OBJECT'] = field_name
+    header['TELESCOP'] = 'SMA'
+    header['RADESYS'] = 'FK5'
+    header['EQUINOX'] = 2000.
+
+    header['CTYPE1'] = 'RA---SIN'
+    header['CRVAL1'] = ra_deg
+    header['CDELT1'] = -cell_arcsec / 3600.
+    header['CRPIX1'] = imsize // 2 + 1
+    header['CUNIT1'] = 'deg'
+
+    header['CTYPE2'] = 'DEC--SIN'
+    header['CRVAL2'] = dec_deg
+    header['CDELT2'] = cell_arcsec / 3600.
+    header['CRPIX2'] = imsize // 2 + 1
+    header['CUNIT2'] = 'deg'
+
+    header['CTYPE3'] = 'FREQ'
+    header['CRVAL3'] = ref_freq
+    header['CDELT3'] = bandwidth if bandwidth is not None else 1.
+    header['CRPIX3'] = 1.
+    header['CUNIT3'] = 'Hz'
+
+    header['CTYPE4'] = 'STOKES'
+    header['CRVAL4'] = 1.
+    header['CDELT4'] = 1.
+    header['CRPIX4'] = 1.
+
+    header['ORIGIN'] = 'quicklook_sma.dirty_imaging'
+
+    hdu = fits.PrimaryHDU(data=image[None, None].astype(np.float32), header=header)
+
+    out_dir = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=out_dir, prefix=".tmp-", suffix=".fits")
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            hdu.writeto(f)
+
+        os.replace(tmp_name, filename)
+
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def dirty_image_to_fits(vis, field, spw, cell, imsize, fitsname,
+                        weighting='briggs', robust=0.0, datacolumn=None,
+                        chunk_rows=100000, backend=None):
+    '''
+    Make a dirty MFS image of one field and write it to FITS. The
+    arguments follow the `tclean` call in `quicklook_imaging`.
+
+    Parameters
+    ----------
+    vis : str
+        MS name.
+    field : str
+        Field name.
+    spw : str
+        SPW selection (see `spw_range_ids`).
+    cell : str or float
+        Pixel size, as a string with units (e.g., "0.2arcsec") or in arcsec.
+    imsize : int
+        Image size in pixels.
+    fitsname : str
+        Output FITS file.
+    backend : `ms_export.DictTableBackend`, optional
+        Table access. Defaults to reading `vis` with casatools.
+
+    Returns
+    -------
+    beam : tuple
+        Major and minor FWHM (arcsec) and position angle (deg) fit to the
+        PSF.
+    '''
+
+    if backend is None:
+        backend = CasaTableBackend(vis)
+
+    if isinstance(cell, str):
+        import astropy.units as u
+        cell_arcsec = u.Quantity(cell).to(u.arcsec).value
+    else:
+        cell_arcsec = float(cell)
+
+    field_info = backend.read_subtable('FIELD', ['NAME', 'PHASE_DIR'])
+    field_id = [str(name) for name in field_info['NAME']].index(field)
+
+    # PHASE_DIR is (RA, Dec) in radians.
+    ra_rad, dec_rad = np.ravel(field_info['PHASE_DIR'][field_id])[:2]
+
+    ms_info = read_ms_info(backend)
+
+    spw_ids = spw_range_ids(spw)
+    field_ddids = backend.data_desc_ids(field_id)
+
+    ddids = [ddid for ddid, spw_id in enumerate(ms_info['spw_id'])
+             if spw_id in spw_ids and ddid in field_ddids]
+
+    image, psf, ref_freq = compute_dirty_image(backend, field_id, ddids, cell_arcsec,
+                                               int(imsize),
+                                               weighting=weighting,
+                                               robust=robust,
+                                               datacolumn=datacolumn,
+                                               chunk_rows=chunk_rows,
+                                               ms_info=ms_info)
+
+    beam = fit_beam(psf, cell_arcsec)
+
+    all_freqs = np.concatenate([ms_info['chan_freq'][ddid] for ddid in ddids])
+
+    write_dirty_fits(fitsname, image, np.rad2deg(ra_rad) % 360., np.rad2deg(dec_rad),
+                     cell_arcsec, ref_freq, beam,
+                     bandwidth=np.ptp(all_freqs), field_name=field)
+
+    return beam
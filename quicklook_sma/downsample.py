@@ -0,0 +1,119 @@
+
+'''
+Point reduction for plotting large tables.
+
+Each function works on the rows of one series (e.g., one SPW and
+correlation) and returns the indices of the rows to keep or the bin
+starts to average over.
+'''
+
+import numpy as np
+
+
+DOWNSAMPLE_METHODS = ['mean', 'minmax', 'lttb']
+
+
+def bin_starts(num_points, bin_size):
+    '''
+    Start index of each bin of `bin_size` consecutive points.
+    '''
+
+    return np.arange(0, num_points, max(int(bin_size), 1))
+
+
+def bin_mean(values, bin_size):
+    '''
+    Mean of `values` in bins of `bin_size` consecutive points. The last bin
+    may be partially filled.
+    '''
+
+    values = np.asarray(values, dtype=float)
+
+    starts = bin_starts(len(values), bin_size)
+    counts = np.diff(np.append(starts, len(values)))
+
+    return np.add.reduceat(values, starts) / counts
+
+
+def minmax_indices(y, bin_size):
+    '''
+    Indices of the minimum and maximum of `y` in each bin of `bin_size`
+    consecutive points, in increasing order. NaNs are ignored unless a bin
+    is all NaN.
+    '''
+
+    y = np.asarray(y, dtype=float)
+
+    num_points = len(y)
+
+    if num_points == 0:
+        return np.array([], dtype=int)
+
+    starts = bin_starts(num_points, bin_size)
+    bin_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, num_points)))
+
+    isnan = np.isnan(y)
+    y_low = np.where(isnan, np.inf, y)
+    y_high = np.where(isnan, -np.inf, y)
+
+    keep = []
+
+    for this_y, reduce_func in [(y_low, np.minimum), (y_high, np.maximum)]:
+
+        bin_extreme = reduce_func.reduceat(this_y, starts)
+
+        matches = np.flatnonzero(this_y == bin_extreme[bin_ids])
+
+        # First matching point in each bin.
+        _, first = np.unique(bin_ids[matches], return_index=True)
+
+        keep.append(matches[first])
+
+    return np.unique(np.concatenate(keep))
+
+
+def lttb_indices(x, y, num_out):
+    '''
+    Largest-Triangle-Three-Buckets selection of `num_out` points from the
+    series (x, y). The first and last points are always kept.
+    '''
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    num_points = len(x)
+
+    if num_out >= num_points:
+        return np.arange(num_points)
+
+    if num_out < 3:
+        return np.array([0, num_points - 1])[:max(num_out, 0)]
+
+    # Buckets for all points between the first and last.
+    edges = np.floor(np.linspace(1, num_points - 1, num_out - 1)).astype(int)
+
+    out = np.empty(num_out, dtype=int)
+    out[0] = 0
+    out[-1] = num_points - 1
+
+    prev = 0
+
+    for ii in range(num_out - 2):
+
+        start, end = edges[ii], edges[ii + 1]
+
+        # Average of the next bucket. For the last bucket, this is the last point.
+        next_start = edges[ii + 1]
+        next_end = edges[ii + 2] if ii + 2 < len(edges) else num_points
+
+        next_x = np.nanmean(x[next_start:next_end])
+        next_y = np.nanmean(y[next_start:next_end])
+
+        area = np.abs((x[prev] - next_x) * (y[start:end] - y[prev]) -
+                      (x[prev] - x[start:end]) * (next_y - y[prev]))
+
+        prev = start + np.argmax(np.nan_to_num(area, nan=-1.))
+
+        out[ii + 1] = prev
+
+    return out
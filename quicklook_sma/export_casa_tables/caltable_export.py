@@ -0,0 +1,224 @@
+
+'''
+Export the caltable QA tables without plotms.
+
+Each calibration table is read once (per SPW, since the solution shapes can
+differ between SPWs) and every per-SPW or per-antenna table for a
+`CALTABLE_MAPPING` entry is then made from memory. The output uses the same
+txt layout as the plotms export (see `ms_export.write_plotms_txt`).
+'''
+
+import os
+import numpy as np
+
+from quicklook_sma.table_io import is_npz_table, write_npz_table
+from quicklook_sma.export_casa_tables.ms_export import (TXT_COLNAMES, CORR_TYPE_NAMES,
+                                                         write_plotms_txt)
+
+
+_CALTABLE_COLUMNS = ['TIME', 'FIELD_ID', 'SCAN_NUMBER', 'OBSERVATION_ID',
+                     'ANTENNA1', 'ANTENNA2', 'FLAG']
+
+
+def receptor_names(corr_names):
+    '''
+    Receptor names of the parallel hands in `corr_names` (e.g., ['XX', 'YY']
+    gives ['X', 'Y']). These label the polarization axis of the solutions.
+    '''
+
+    return [name[0] for name in corr_names if len(name) == 2 and name[0] == name[1]]
+
+
+def read_caltable(caltable_name, vis=None):
+    '''
+    Read the solutions of a calibration table into memory.
+
+    Parameters
+    ----------
+    caltable_name : str
+        Calibration table.
+    vis : str, optional
+        MS the caltable was made from. The receptor names of the solutions
+        are taken from its POLARIZATION table. Without it, the solutions are
+        labelled by their index.
+
+    Returns
+    -------
+    cal_data : dict
+        'spw' is {spw: {colname: array}} with the solution arrays in the
+        casatools layout (pol, chan, row), 'param' is the name of the
+        solution column (CPARAM or FPARAM), 'chan_freq' is the channel
+        frequencies of each SPW, 'ant_names' the antenna names and
+        'pol_names' the names of the solution polarizations.
+    '''
+
+    from casatools import table
+    tb = table()
+
+    tb.open(caltable_name)
+
+    try:
+        param = 'CPARAM' if 'CPARAM' in tb.colnames() else 'FPARAM'
+
+        spws = np.unique(tb.getcol('SPECTRAL_WINDOW_ID'))
+
+        spw_data = {}
+
+        for spw in spws:
+            subtable = tb.query(f'SPECTRAL_WINDOW_ID=={spw}')
+
+            try:
+                spw_data[int(spw)] = {colname: subtable.getcol(colname)
+                                      for colname in _CALTABLE_COLUMNS + [param]}
+            finally:
+                subtable.close()
+
+    finally:
+        tb.close()
+
+    tb.open(os.path.join(caltable_name, 'SPECTRAL_WINDOW'))
+    chan_freq = {spw: np.ravel(tb.getcell('CHAN_FREQ', spw)) for spw in spw_data}
+    tb.close()
+
+    tb.open(os.path.join(caltable_name, 'ANTENNA'))
+    ant_names = np.array(tb.getcol('NAME'))
+    tb.close()
+
+    pol_names = []
+
+    if vis is not None:
+        tb.open(os.path.join(vis, 'POLARIZATION'))
+        corr_names = [CORR_TYPE_NAMES.get(int(val), str(val))
+                      for val in np.ravel(tb.getcell('CORR_TYPE', 0))]
+        tb.close()
+
+        pol_names = receptor_names(corr_names)
+
+    return {'spw': spw_data,
+            'param': param,
+            'chan_freq': chan_freq,
+            'ant_names': ant_names,
+            'pol_names': pol_names}
+
+
+def iteration_values(cal_data, iteraxis):
+    '''
+    SPW or antenna numbers to make separate tables for.
+    '''
+
+    if iteraxis == 'spw':
+        return sorted(cal_data['spw'])
+
+    return sorted(set(np.concatenate([cols['ANTENNA1'] for cols in cal_data['spw'].values()])))
+
+
+def caltable_columns(cal_data, caltable_values, iter_value):
+    '''
+    Columns in the plotms txt layout for one SPW or antenna of a caltable.
+    Flagged solutions are dropped, as in the plotms export.
+
+    Parameters
+    ----------
+    cal_data : dict
+        Output of `read_caltable`.
+    caltable_values : dict
+        Entry of `caltable_plots.CALTABLE_MAPPING`.
+    iter_value : int
+        SPW or antenna number, following `caltable_values['iter']`.
+    '''
+
+    out = []
+
+    for spw, cols in cal_data['spw'].items():
+
+        if caltable_values['iter'] == 'spw':
+            if spw != iter_value:
+                continue
+            rows = np.arange(len(cols['TIME']))
+        else:
+            rows = np.flatnonzero(cols['ANTENNA1'] == iter_value)
+
+        if len(rows) == 0:
+            continue
+
+        # (pol, chan, row) -> (row, chan, pol)
+        param = np.transpose(cols[cal_data['param']][..., rows], (2, 1, 0))
+        good = ~np.transpose(cols['FLAG'][..., rows], (2, 1, 0))
+
+        row_idx, chan_idx, pol_idx = np.nonzero(good)
+
+        # Receptor names, or the index for polarizations without one.
+        pol_names = list(cal_data.get('pol_names', []))
+        pol_names = np.array(pol_names[:param.shape[2]] +
+                             [str(idx) for idx in range(len(pol_names), param.shape[2])])
+
+        values = param[row_idx, chan_idx, pol_idx]
+
+        if caltable_values['y'] == 'phase':
+            yvals = np.rad2deg(np.angle(values))
+        elif np.iscomplexobj(values):
+            yvals = np.abs(values)
+        else:
+            yvals = values
+
+        freq = cal_data['chan_freq'][spw][chan_idx] / 1e9
+        times = cols['TIME'][rows][row_idx]
+
+        xvals = times if caltable_values['x'] == 'time' else freq
+
+        ant1 = cols['ANTENNA1'][rows][row_idx]
+        ant2 = cols['ANTENNA2'][rows][row_idx]
+
+        # ANTENNA2 is -1 for antenna-based solutions.
+        ant_names = np.append(cal_data['ant_names'], '*')
+
+        out.append({'x': xvals,
+                    'y': yvals,
+                    'chan': chan_idx,
+                    'scan': cols['SCAN_NUMBER'][rows][row_idx],
+                    'field': cols['FIELD_ID'][rows][row_idx],
+                    'ant1': ant1,
+                    'ant2': ant2,
+                    'ant1name': ant_names[ant1],
+                    'ant2name': ant_names[ant2],
+                    'time': times,
+                    'freq': freq,
+                    'spw': np.full(len(row_idx), spw),
+                    'corr': pol_names[pol_idx],
+                    'obs': cols['OBSERVATION_ID'][rows][row_idx]})
+
+    if len(out) == 0:
+        return None
+
+    return {colname: np.concatenate([cols[colname] for cols in out])
+            for colname in TXT_COLNAMES}
+
+
+def export_caltable(cal_data, caltable_name, caltable_values, filenames):
+    '''
+    Write the tables for one `CALTABLE_MAPPING` entry from the caltable
+    already read with `read_caltable`.
+
+    Parameters
+    ----------
+    filenames : dict
+        {SPW or antenna number: output file name}. Names ending in ".npz"
+        are written with `table_io.write_npz_table`.
+    '''
+
+    # Only the axes are needed by the txt writer.
+    product = {'xaxis': caltable_values['x'], 'yaxis': caltable_values['y']}
+
+    meta = {'vis': caltable_name}
+
+    for iter_value, filename in filenames.items():
+
+        columns = caltable_columns(cal_data, caltable_values, iter_value)
+
+        if columns is None:
+            continue
+
+        if is_npz_table(filename):
+            write_npz_table(filename, columns, meta)
+        else:
+            write_plotms_txt(filename, columns, product, meta=meta)
@@ -1,9 +1,15 @@
 
 import os
+import json
+import time
 from glob import glob
 import numpy as np
 
 import quicklook_sma.utilities as utils
+from quicklook_sma.parallel import parallel_map
+from quicklook_sma.table_io import plotms_output_name, finalize_plotms_output
+from quicklook_sma.export_casa_tables.caltable_export import (read_caltable, iteration_values,
+                                                              export_caltable)
 
 
 CALTABLE_MAPPING = {'bandpass_amp': {'output_folder': 'final_caltable_txt',
@@ -56,14 +62,32 @@ CALTABLE_MAPPING = {'bandpass_amp': {'output_folder': 'final_caltable_txt',
                                     'colorby': 'spw'}}
 
 
-def make_caltable_txt(ms_active, caltable_type):
+# Written by `make_all_caltable_txt` in the caltable output folder.
+CALTABLE_REPORT_FILENAME = 'caltable_export_report.json'
+
+
+def make_caltable_txt(ms_active, caltable_type, outtype='txt', engine='plotms',
+                      caltable_data=None):
     '''
     Output txt files using plotms to make plots of various calibration tables.
     See definitions in `CALTABLE_MAPPING`.
     The naming convention follows the VLA pipeline table names from `hifv_finalcals`
 
+    With `outtype='npz'`, the plotms txt output is converted to a binary
+    table (see `quicklook_sma.table_io`). 'txt.gz' and 'txt.zst' compress
+    the txt output with gzip or zstd.
+
+    With `engine='numpy'`, the caltable is read once with
+    `caltable_export.read_caltable` and all SPW or antenna tables are written
+    from memory instead of one plotms call each. Pass the same
+    `caltable_data` dictionary to several calls to read caltables shared by
+    more than one `CALTABLE_MAPPING` entry only once.
+
     '''
 
+    if engine not in ['plotms', 'numpy']:
+        raise ValueError(f"engine must be 'plotms' or 'numpy'. Received {engine}")
+
     caltable_values = CALTABLE_MAPPING[caltable_type]
 
     from casatools import logsink
@@ -75,15 +99,14 @@ def make_caltable_txt(ms_active, caltable_type):
 
     tb = table()
 
-    from casaplotms import plotms
-
     casalog.post(f"Running make_caltable_txt on {caltable_type} to export txt files for QA.")
     print(f"Running make_caltable_txt on {caltable_type} to export txt files for QA.")
 
     mySDM = ms_active.rstrip(".ms")
 
-    if not os.path.exists(caltable_values['output_folder']):
-        os.mkdir(caltable_values['output_folder'])
+    # Other caltable types can be exported at the same time in other
+    # processes (see `make_all_caltable_txt`).
+    os.makedirs(caltable_values['output_folder'], exist_ok=True)
 
     # Final BP cal table now includes the stage number and step
     caltable_name = glob(mySDM + caltable_values['search_string'])
@@ -92,13 +115,31 @@ def make_caltable_txt(ms_active, caltable_type):
     # Blindly assume we want the first name
     caltable_name = caltable_name[0]
 
-    tb.open(caltable_name)
-    spw_vals = np.unique(tb.getcol("SPECTRAL_WINDOW_ID"))
-    ant_vals = np.unique(tb.getcol("ANTENNA1"))
-    tb.close()
+    if engine == 'numpy':
+        if caltable_data is None:
+            caltable_data = {}
+
+        # Read each caltable once, also across caltable types.
+        if caltable_name not in caltable_data:
+            caltable_data[caltable_name] = read_caltable(caltable_name, vis=ms_active)
 
-    # Make txt files per SPW.
-    iteraxis = spw_vals if caltable_values['iter'] == 'spw' else ant_vals
+        cal_data = caltable_data[caltable_name]
+
+        iteraxis = iteration_values(cal_data, caltable_values['iter'])
+
+    else:
+        from casaplotms import plotms
+
+        tb.open(caltable_name)
+        spw_vals = np.unique(tb.getcol("SPECTRAL_WINDOW_ID"))
+        ant_vals = np.unique(tb.getcol("ANTENNA1"))
+        tb.close()
+
+        # Make txt files per SPW.
+        iteraxis = spw_vals if caltable_values['iter'] == 'spw' else ant_vals
+
+    # Tables to write with the numpy engine.
+    filenames = {}
 
     for ii in iteraxis:
 
@@ -107,18 +148,29 @@ def make_caltable_txt(ms_active, caltable_type):
 
         # Output text names
         # name_xaxis_yaxis_iter num
-        out_filename = '{0}_{1}_{2}_{3}{4}.txt'.format(caltable_name,
+        out_filename = '{0}_{1}_{2}_{3}{4}.{5}'.format(caltable_name,
                                                        caltable_values['x'],
                                                        caltable_values['y'],
                                                        caltable_values['iter'],
-                                                       ii)
+                                                       ii,
+                                                       outtype)
 
         thisplotfile = os.path.join(caltable_values['output_folder'], out_filename)
 
-        if not os.path.exists(thisplotfile):
+        if os.path.exists(thisplotfile):
+            casalog.post("File {} already exists. Skipping".format(thisplotfile))
+
+        elif engine == 'numpy':
+            filenames[ii] = thisplotfile
+
+        else:
 
             print(caltable_name)
 
+            # plotms only writes txt. Binary or compressed tables are
+            # converted afterwards.
+            plotfile = plotms_output_name(thisplotfile)
+
             plotms(vis=caltable_name,
                    xaxis=caltable_values['x'],
                    yaxis=caltable_values['y'],
@@ -129,12 +181,43 @@ def make_caltable_txt(ms_active, caltable_type):
                    showgui=False,
                    # avgtime='1e8',
                    averagedata=True,
-                   plotfile=thisplotfile)
-        else:
-            casalog.post("File {} already exists. Skipping".format(thisplotfile))
+                   plotfile=plotfile)
 
+            finalize_plotms_output(plotfile, thisplotfile)
 
-def make_all_caltable_txt(config_file):
+    if engine == 'numpy':
+        export_caltable(cal_data, caltable_name, caltable_values, filenames)
+
+
+def make_all_caltable_txt(config_file, outtype='txt', engine='plotms', workers=1,
+                          report_file=None):
+    '''
+    Export the tables for all caltable types in `CALTABLE_MAPPING`.
+
+    Caltable types that read the same caltable are exported together in one
+    job so the numpy engine reads that caltable once. With `workers > 1`,
+    the jobs run at the same time in separate processes.
+
+    Parameters
+    ----------
+    config_file : str
+        Pipeline config file.
+    outtype : str, optional
+        'txt', 'txt.gz', 'txt.zst' or 'npz'. See `make_caltable_txt`.
+    engine : str, optional
+        'plotms' or 'numpy'. See `make_caltable_txt`.
+    workers : int or None, optional
+        Number of processes. `None` uses all CPUs.
+    report_file : str, optional
+        JSON file for the export report. Defaults to
+        `CALTABLE_REPORT_FILENAME` in the caltable output folder.
+
+    Returns
+    -------
+    report : dict
+        Time taken, status ('success' or 'failed') and error message for
+        each caltable type, and the total time.
+    '''
 
     from casatools import logsink
 
@@ -145,11 +228,80 @@ def make_all_caltable_txt(config_file):
 
     msname = this_config['myvis']
 
-    for key in CALTABLE_MAPPING:
+    # Group the caltable types reading the same caltable.
+    groups = {}
+    for key, caltable_values in CALTABLE_MAPPING.items():
+        groups.setdefault(caltable_values['search_string'], []).append(key)
+
+    jobs = [(msname, keys, outtype, engine) for keys in groups.values()]
+
+    # Make the output folders before the jobs run in parallel.
+    for caltable_values in CALTABLE_MAPPING.values():
+        os.makedirs(caltable_values['output_folder'], exist_ok=True)
+
+    start_time = time.time()
+
+    results = parallel_map(_export_caltable_group, jobs, workers=workers)
+
+    report = {'vis': msname,
+              'engine': engine,
+              'outtype': outtype,
+              'workers': workers,
+              'total_seconds': time.time() - start_time,
+              'caltables': {}}
+
+    merged = {}
+    for result in results:
+        merged.update(result)
+
+    # Report in the order of CALTABLE_MAPPING.
+    report['caltables'] = {key: merged[key] for key in CALTABLE_MAPPING}
+
+    for key, result in report['caltables'].items():
+        if result['status'] == 'success':
+            casalog.post(f"Exported {key} in {result['seconds']:.1f} s")
+        else:
+            casalog.post(f"Found exception for {key}")
+            casalog.post(f"{result['error']}")
+
+    if report_file is None:
+        output_folder = list(CALTABLE_MAPPING.values())[0]['output_folder']
+        report_file = os.path.join(output_folder, CALTABLE_REPORT_FILENAME)
+
+    report_folder = os.path.dirname(report_file)
+    if report_folder:
+        os.makedirs(report_folder, exist_ok=True)
+
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    return report
+
+
+def _export_caltable_group(job):
+    '''
+    Run `make_caltable_txt` for caltable types sharing one caltable and
+    return the time and status of each.
+    '''
+
+    msname, keys, outtype, engine = job
+
+    # Caltables read by the numpy engine, shared between caltable types.
+    caltable_data = {}
+
+    out = {}
+
+    for key in keys:
+
+        start_time = time.time()
+
         try:
-            make_caltable_txt(msname, key)
+            make_caltable_txt(msname, key, outtype=outtype, engine=engine,
+                              caltable_data=caltable_data)
+            out[key] = {'status': 'success', 'error': None}
         except Exception as exc:
-            casalog.post(f"Found exception for {key}")
-            casalog.post(f"{exc}")
-            continue
+            out[key] = {'status': 'failed', 'error': f"{type(exc).__name__}: {exc}"}
+
+        out[key]['seconds'] = time.time() - start_time
 
+    return out
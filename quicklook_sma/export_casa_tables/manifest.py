@@ -0,0 +1,167 @@
+
+'''
+Manifest of the exported QA tables.
+
+For every table written, the manifest records the MS it was made from (path
+and modification stamp), the selection and averaging parameters, and the
+size and checksum of the output. A rerun only redoes tables whose entry is
+missing, made with different parameters or from a changed MS, or whose file
+no longer matches. Tables left partially written by an interrupted run
+have no entry and are redone.
+
+The manifest is rewritten to a temporary file and renamed into place after
+each update so it is never left partially written.
+
+Outputs can also be directories (e.g., CASA images). Their size and
+checksum cover all the files inside.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+MANIFEST_FILENAME = 'export_manifest.json'
+
+
+def _files_in(path):
+    '''
+    `path` itself for a file, or all files below the directory `path` in
+    a fixed order.
+    '''
+
+    if not os.path.isdir(path):
+        return [path]
+
+    return sorted(os.path.join(root, name)
+                  for root, _, names in os.walk(path) for name in names)
+
+
+def file_checksum(filename, blocksize=2**20):
+    '''
+    BLAKE2 hash of the file contents. For a directory, the relative names
+    and contents of all the files inside are hashed.
+    '''
+
+    this_hash = hashlib.blake2b(digest_size=20)
+
+    for this_file in _files_in(filename):
+
+        if this_file != filename:
+            this_hash.update(os.path.relpath(this_file, filename).encode())
+
+        with open(this_file, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                this_hash.update(block)
+
+    return this_hash.hexdigest()
+
+
+def path_size(filename):
+    '''
+    Size of the file, or the summed size of the files in a directory.
+    '''
+
+    return sum(os.path.getsize(this_file) for this_file in _files_in(filename))
+
+
+def ms_stamp(vis):
+    '''
+    Identity of the MS: its absolute path and the latest modification time
+    of the data files of the main table ("table.dat" and "table.f*"), which
+    change when the data, flags or rows change. "table.lock" is skipped
+    since casacore rewrites it whenever the table is locked or unlocked.
+    '''
+
+    mtimes = [entry.stat().st_mtime_ns for entry in os.scandir(vis)
+              if entry.is_file() and
+              (entry.name == 'table.dat' or entry.name.startswith('table.f'))]
+
+    return {'vis': os.path.abspath(vis),
+            'modified_ns': max(mtimes) if len(mtimes) > 0 else None}
+
+
+class ExportManifest(object):
+    '''
+    Manifest of the tables exported to `folder`.
+
+    Parameters
+    ----------
+    folder : str
+        Output folder of the tables.
+    filename : str, optional
+        Name of the manifest in `folder`.
+    '''
+
+    def __init__(self, folder, filename=MANIFEST_FILENAME):
+
+        self.folder = folder
+        self.filename = os.path.join(folder, filename)
+
+        self.entries = {}
+
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # Unreadable manifest. Everything is redone.
+                self.entries = {}
+
+    def _key(self, filename):
+        return os.path.relpath(filename, self.folder)
+
+    def is_current(self, filename, params):
+        '''
+        Check whether `filename` was completely written with `params` and
+        is unchanged since.
+        '''
+
+        entry = self.entries.get(self._key(filename))
+
+        if entry is None or entry['params'] != params:
+            return False
+
+        if not os.path.exists(filename):
+            return False
+
+        if path_size(filename) != entry['size']:
+            return False
+
+        return file_checksum(filename) == entry['checksum']
+
+    def record(self, filename, params):
+        '''
+        Add the completed table `filename` made with `params` and save the
+        manifest.
+        '''
+
+        self.entries[self._key(filename)] = {'params': params,
+                                             'size': path_size(filename),
+                                             'checksum': file_checksum(filename)}
+
+        self.save()
+
+    def remove(self, filename):
+        '''
+        Drop the entry for `filename` (e.g., before it is rewritten).
+        '''
+
+        if self.entries.pop(self._key(filename), None) is not None:
+            self.save()
+
+    def save(self):
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.folder, prefix=".tmp-", suffix=".json")
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+
+            os.replace(tmp_name, self.filename)
+
+        except Exception:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
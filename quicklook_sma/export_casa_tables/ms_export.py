@@ -0,0 +1,682 @@
+
+'''
+Export the QA tables from a MeasurementSet without plotms.
+
+All products for one field are computed from a single chunked read of the
+visibilities and written in the same txt layout as the plotms export, so
+`read_data_sma.read_casa_txt` reads either one. Each chunk is summed into
+its output groups as soon as it is read, so the memory used follows the
+chunk size and the size of the output, not the number of rows in the MS.
+
+The table access goes through a small backend so the computation can be run
+on a fake MS (`DictTableBackend`) without CASA.
+'''
+
+import os
+import numpy as np
+
+from quicklook_sma.table_io import is_npz_table, write_npz_table, open_table_text
+from quicklook_sma.averaging import (channel_sums, scalar_channel_sums, channel_bin_centers,
+                                     group_sums, finish_mean, vector_amp_phase)
+from quicklook_sma.export_casa_tables.scan_stats import (chunk_stat_samples, partial_scan_stats,
+                                                         merge_scan_stats, reduce_scan_stats,
+                                                         scan_stats_columns,
+                                                         SCAN_STATS_COLNAMES)
+
+
+# Speed of light in m/s
+_C_LIGHT = 299792458.
+
+DATACOLUMN_MAPPING = {'data': 'DATA',
+                      'corrected': 'CORRECTED_DATA',
+                      'model': 'MODEL_DATA'}
+
+# Stokes enum from casacore used in POLARIZATION/CORR_TYPE.
+CORR_TYPE_NAMES = {1: 'I', 2: 'Q', 3: 'U', 4: 'V',
+                   5: 'RR', 6: 'RL', 7: 'LR', 8: 'LL',
+                   9: 'XX', 10: 'XY', 11: 'YX', 12: 'YY'}
+
+AXIS_UNITS = {'time': 'MJD(seconds)',
+              'chan': 'None',
+              'freq': 'GHz',
+              'uvdist': 'm',
+              'uvwave': 'lambda',
+              'amp': 'None',
+              'phase': 'deg',
+              'antenna1': 'None'}
+
+TXT_COLNAMES = ['x', 'y', 'chan', 'scan', 'field', 'ant1', 'ant2', 'ant1name',
+                'ant2name', 'time', 'freq', 'spw', 'corr', 'obs']
+
+# The averaging applied by each group of products:
+# 'time': per integration, averaged over baselines.
+# 'chan': per scan, averaged over baselines.
+# 'baseline': per scan and baseline.
+PRODUCT_GROUPS = {'time': ['time', 'scan', 'obs', 'bin', 'corr'],
+                  'chan': ['scan', 'obs', 'bin', 'corr'],
+                  'baseline': ['scan', 'obs', 'ant1', 'ant2', 'bin', 'corr']}
+
+# Name of the per-scan statistics in the `compute_field_products` output.
+SCAN_STATS_KEY = 'scan_stats'
+
+_MAIN_COLUMNS = ['TIME', 'SCAN_NUMBER', 'OBSERVATION_ID', 'ANTENNA1', 'ANTENNA2',
+                 'UVW', 'FLAG']
+
+
+class CasaTableBackend(object):
+    '''
+    Read the MS with `casatools.table`.
+
+    Parameters
+    ----------
+    vis : str
+        MeasurementSet name.
+    '''
+
+    def __init__(self, vis):
+        self.vis = vis
+
+    def colnames(self):
+        from casatools import table
+        tb = table()
+
+        tb.open(self.vis)
+        colnames = tb.colnames()
+        tb.close()
+
+        return colnames
+
+    def read_subtable(self, name, colnames):
+        '''
+        Return {colname: list of row values} for the subtable `name`.
+        Cells are read one at a time so columns with a different shape
+        per row (e.g. CHAN_FREQ) work.
+        '''
+
+        from casatools import table
+        tb = table()
+
+        tb.open(os.path.join(self.vis, name))
+
+        out = {colname: [tb.getcell(colname, ii) for ii in range(tb.nrows())]
+               for colname in colnames}
+
+        tb.close()
+
+        return out
+
+    def iter_rows(self, colnames, chunk_rows):
+        '''
+        Yield {colname: array} for chunks of at most `chunk_rows` rows of the
+        whole main table.
+        '''
+
+        from casatools import table
+        tb = table()
+
+        tb.open(self.vis)
+
+        try:
+            num_rows = tb.nrows()
+
+            for start in range(0, num_rows, chunk_rows):
+                nrow = min(chunk_rows, num_rows - start)
+
+                yield {colname: tb.getcol(colname, startrow=start, nrow=nrow)
+                       for colname in colnames}
+
+        finally:
+            tb.close()
+
+    def data_desc_ids(self, field_id):
+        '''
+        DATA_DESC_IDs with rows for the field.
+        '''
+
+        from casatools import table
+        tb = table()
+
+        tb.open(self.vis)
+        subtable = tb.query(f'FIELD_ID=={field_id}', columns='DATA_DESC_ID')
+        ddids = np.unique(subtable.getcol('DATA_DESC_ID')) if subtable.nrows() > 0 else []
+        subtable.close()
+        tb.close()
+
+        return list(ddids)
+
+    def iter_chunks(self, field_id, ddid, colnames, chunk_rows):
+        '''
+        Yield {colname: array} for chunks of at most `chunk_rows` rows of
+        the field and data description. Arrays have the casatools layout
+        with rows last.
+        '''
+
+        from casatools import table
+        tb = table()
+
+        tb.open(self.vis)
+        subtable = tb.query(f'FIELD_ID=={field_id} && DATA_DESC_ID=={ddid}',
+                            columns=",".join(colnames))
+
+        try:
+            num_rows = subtable.nrows()
+
+            for start in range(0, num_rows, chunk_rows):
+                nrow = min(chunk_rows, num_rows - start)
+
+                yield {colname: subtable.getcol(colname, startrow=start, nrow=nrow)
+                       for colname in colnames}
+
+        finally:
+            subtable.close()
+            tb.close()
+
+
+class DictTableBackend(object):
+    '''
+    In-memory stand-in for an MS, for testing without CASA.
+
+    Parameters
+    ----------
+    main : dict
+        Main table columns in the casatools layout (rows last). All rows
+        must share the same data shape.
+    subtables : dict
+        {subtable name: {colname: list of row values}}.
+    '''
+
+    def __init__(self, main, subtables):
+        self.main = main
+        self.subtables = subtables
+
+    def colnames(self):
+        return list(self.main.keys())
+
+    def read_subtable(self, name, colnames):
+        return {colname: list(self.subtables[name][colname]) for colname in colnames}
+
+    def iter_rows(self, colnames, chunk_rows):
+
+        num_rows = len(self.main['FIELD_ID'])
+
+        for start in range(0, num_rows, chunk_rows):
+            yield {colname: self.main[colname][..., start:start + chunk_rows]
+                   for colname in colnames}
+
+    def data_desc_ids(self, field_id):
+        this_field = self.main['FIELD_ID'] == field_id
+        return list(np.unique(self.main['DATA_DESC_ID'][this_field]))
+
+    def iter_chunks(self, field_id, ddid, colnames, chunk_rows):
+
+        rows = np.flatnonzero((self.main['FIELD_ID'] == field_id) &
+                              (self.main['DATA_DESC_ID'] == ddid))
+
+        for start in range(0, len(rows), chunk_rows):
+            these_rows = rows[start:start + chunk_rows]
+
+            yield {colname: self.main[colname][..., these_rows] for colname in colnames}
+
+
+def read_ms_info(backend):
+    '''
+    Spectral setup and antenna names needed to label the exported tables.
+    '''
+
+    ddi_info = backend.read_subtable('DATA_DESCRIPTION',
+                                     ['SPECTRAL_WINDOW_ID', 'POLARIZATION_ID'])
+    spw_info = backend.read_subtable('SPECTRAL_WINDOW', ['CHAN_FREQ'])
+    pol_info = backend.read_subtable('POLARIZATION', ['CORR_TYPE'])
+    ant_info = backend.read_subtable('ANTENNA', ['NAME'])
+
+    ms_info = {'spw_id': [int(val) for val in ddi_info['SPECTRAL_WINDOW_ID']],
+               'chan_freq': [np.asarray(spw_info['CHAN_FREQ'][spw]).ravel()
+                             for spw in ddi_info['SPECTRAL_WINDOW_ID']],
+               'corr_names': [[CORR_TYPE_NAMES.get(int(val), str(val))
+                               for val in np.ravel(pol_info['CORR_TYPE'][pol])]
+                              for pol in ddi_info['POLARIZATION_ID']],
+               'ant_names': np.array(ant_info['NAME'])}
+
+    return ms_info
+
+
+def product_group(product):
+    '''
+    Averaging group (a key of `PRODUCT_GROUPS`) for the plotms settings of
+    a product.
+    '''
+
+    if not product['avgbaseline']:
+        return 'baseline'
+
+    return 'time' if product['avgtime'] is None else 'chan'
+
+
+# Main table column holding each per-row key of `PRODUCT_GROUPS`.
+_ROW_KEY_COLUMNS = {'time': 'TIME', 'scan': 'SCAN_NUMBER', 'obs': 'OBSERVATION_ID',
+                    'ant1': 'ANTENNA1', 'ant2': 'ANTENNA2'}
+
+
+def _chunk_sums(chunk, datacolumn, chan_freq, chanavg, with_resid):
+    '''
+    Flag-aware channel sums of one chunk in bins of `chanavg` channels.
+
+    Returns a dict of flat arrays for the unflagged (row, bin, corr) entries
+    only: their 'row', 'bin' and 'corr' indices and the summed values. The
+    per-row keys are looked up from the chunk when the entries are grouped
+    (`_chunk_group_sums`) rather than repeated for every entry.
+    '''
+
+    # casatools layout is (corr, chan, row). Move rows first.
+    data = np.transpose(chunk[datacolumn], (2, 1, 0))
+    good = ~np.transpose(chunk['FLAG'], (2, 1, 0))
+
+    num_rows, num_chan, num_corr = data.shape
+
+    vis_sum, count = channel_sums(data, good, chanavg)
+
+    num_bins = vis_sum.shape[1]
+
+    bin_chan = channel_bin_centers(np.arange(num_chan), chanavg)
+    bin_freq = channel_bin_centers(chan_freq, chanavg)
+
+    keep = np.flatnonzero(count.ravel() > 0)
+
+    row_idx, bin_corr_idx = np.divmod(keep, num_bins * num_corr)
+    bin_idx, corr_idx = np.divmod(bin_corr_idx, num_corr)
+
+    count = count.ravel()[keep]
+
+    uvdist = np.hypot(chunk['UVW'][0], chunk['UVW'][1])[row_idx]
+
+    sums = {'row': row_idx,
+            'bin': bin_idx,
+            'corr': corr_idx,
+            'vis_sum': vis_sum.ravel()[keep],
+            'count': count,
+            # Count-weighted sums so the averaged x values follow the data.
+            'time_sum': chunk['TIME'][row_idx] * count,
+            'uvdist_sum': uvdist * count,
+            'uvwave_sum': uvdist * bin_freq[bin_idx] / _C_LIGHT * count}
+
+    if with_resid:
+        # Scalar average of |corrected| - |model|.
+        model = np.transpose(chunk['MODEL_DATA'], (2, 1, 0))
+        resid_sum = (scalar_channel_sums(data, good, chanavg)[0] -
+                     scalar_channel_sums(model, good, chanavg)[0])
+        sums['resid_sum'] = resid_sum.ravel()[keep]
+
+    return sums, bin_chan, bin_freq
+
+
+def _value_names(with_resid):
+    '''
+    Names of the summed values in the `_chunk_sums` output.
+    '''
+
+    value_names = ['vis_sum', 'count', 'time_sum', 'uvdist_sum', 'uvwave_sum']
+    if with_resid:
+        value_names.append('resid_sum')
+
+    return value_names
+
+
+def _chunk_group_sums(chunk, sums, group, with_resid):
+    '''
+    Sum the `_chunk_sums` entries of one chunk over each group of
+    `PRODUCT_GROUPS[group]`. Returns the key columns and summed values with
+    one entry per group.
+    '''
+
+    key_names = PRODUCT_GROUPS[group]
+    row_keys = [key for key in key_names if key in _ROW_KEY_COLUMNS]
+
+    # One code per distinct set of row keys, then per (rows, bin, corr).
+    row_code = np.zeros(len(chunk['TIME']), dtype=np.int64)
+    for key in row_keys:
+        uniq, inv = np.unique(chunk[_ROW_KEY_COLUMNS[key]], return_inverse=True)
+        row_code = row_code * len(uniq) + inv.ravel()
+
+    num_bins = sums['bin'].max() + 1 if len(sums['bin']) > 0 else 1
+    num_corr = sums['corr'].max() + 1 if len(sums['corr']) > 0 else 1
+
+    code = (row_code[sums['row']] * num_bins + sums['bin']) * num_corr + sums['corr']
+
+    value_names = _value_names(with_resid)
+
+    _, values, first = group_sums([code], [sums[name] for name in value_names],
+                                  return_first=True)
+
+    out = {key: chunk[_ROW_KEY_COLUMNS[key]][sums['row'][first]] for key in row_keys}
+    out['bin'] = sums['bin'][first]
+    out['corr'] = sums['corr'][first]
+    out.update(dict(zip(value_names, values)))
+
+    return out
+
+
+def _merge_group_sums(partials, group, with_resid):
+    '''
+    Combine per-group sums (from `_chunk_group_sums` or earlier merges) of
+    one averaging group.
+
+    The merged sums have one entry per group, so their size follows the
+    output table and not the number of rows read.
+    '''
+
+    value_names = _value_names(with_resid)
+    key_names = PRODUCT_GROUPS[group]
+
+    keys, values = group_sums([np.concatenate([part[key] for part in partials])
+                               for key in key_names],
+                              [np.concatenate([part[name] for part in partials])
+                               for name in value_names])
+
+    out = dict(zip(key_names, keys))
+    out.update(dict(zip(value_names, values)))
+
+    return out
+
+
+def _reduce_group(partial, with_resid):
+    '''
+    Means for one averaging group from its merged sums.
+    '''
+
+    out = dict(partial)
+
+    count = out['count']
+
+    out['amp'], out['phase'] = vector_amp_phase(out['vis_sum'], count)
+    out['time'] = finish_mean(out['time_sum'], count)
+    out['uvdist'] = finish_mean(out['uvdist_sum'], count)
+    out['uvwave'] = finish_mean(out['uvwave_sum'], count)
+
+    if with_resid:
+        out['resid'] = finish_mean(out['resid_sum'], count)
+
+    return out
+
+
+def _product_columns(reduced, product, field_id, spw_id, bin_chan, bin_freq,
+                     corr_names, ant_names):
+    '''
+    Columns of the plotms txt layout for one product and one spw.
+    '''
+
+    xaxis, yaxis = product['xaxis'], product['yaxis']
+
+    if product['ydatacolumn'] == 'corrected-model_scalar':
+        yvals = reduced['resid']
+    elif yaxis == 'amp':
+        yvals = reduced['amp']
+    else:
+        yvals = reduced['phase']
+
+    xvals = {'time': reduced['time'],
+             'chan': bin_chan[reduced['bin']],
+             'uvdist': reduced.get('uvdist'),
+             'uvwave': reduced.get('uvwave'),
+             'amp': reduced['amp'],
+             'antenna1': reduced.get('ant1')}[xaxis]
+
+    num_rows = len(yvals)
+
+    # Baseline-averaged products have no antenna.
+    if 'ant1' in reduced:
+        ant1, ant2 = reduced['ant1'], reduced['ant2']
+        ant1name, ant2name = ant_names[ant1], ant_names[ant2]
+    else:
+        ant1 = ant2 = np.full(num_rows, -1)
+        ant1name = ant2name = np.full(num_rows, '*')
+
+    return {'x': xvals,
+            'y': yvals,
+            'chan': bin_chan[reduced['bin']],
+            'scan': reduced['scan'],
+            'field': np.full(num_rows, field_id),
+            'ant1': ant1,
+            'ant2': ant2,
+            'ant1name': ant1name,
+            'ant2name': ant2name,
+            'time': reduced['time'],
+            'freq': bin_freq[reduced['bin']] / 1e9,
+            'spw': np.full(num_rows, spw_id),
+            'corr': np.array(corr_names)[reduced['corr']],
+            'obs': reduced['obs']}
+
+
+def compute_field_products(backend, field_id, products, chanavg_vs_time=16384,
+                           chanavg_vs_chan=1, datacolumn='corrected',
+                           chunk_rows=100000, ms_info=None, scan_stats=False):
+    '''
+    Compute the QA products for one field from a single read of the data.
+
+    Parameters
+    ----------
+    backend : `CasaTableBackend` or `DictTableBackend`
+        Table access for the MS.
+    field_id : int
+        FIELD_ID to export.
+    products : dict
+        {product name: settings} with the entries of
+        `qa_plot_tools.QA_TABLE_MAPPING`.
+    chanavg_vs_time : int, optional
+        Channels averaged for the products not versus channel.
+    chanavg_vs_chan : int, optional
+        Channels averaged for the products versus channel.
+    datacolumn : str, optional
+        'data', 'corrected' or 'model'.
+    chunk_rows : int, optional
+        Number of rows read at once.
+    ms_info : dict, optional
+        Output of `read_ms_info`. Read from the backend when not given.
+    scan_stats : bool, optional
+        Also compute the per-scan statistics of `scan_stats` in the same
+        pass, with `chanavg_vs_time` channels averaged per sample.
+
+    Returns
+    -------
+    out : dict
+        {product name: {colname: array}} in the plotms txt column order.
+        With `scan_stats`, `SCAN_STATS_KEY` holds the statistics table in
+        the `scan_stats.SCAN_STATS_COLNAMES` order.
+    '''
+
+    if ms_info is None:
+        ms_info = read_ms_info(backend)
+
+    data_colname = DATACOLUMN_MAPPING[datacolumn]
+
+    with_resid = any(product['ydatacolumn'] == 'corrected-model_scalar'
+                     for product in products.values())
+
+    chanavg = {'time': chanavg_vs_time, 'chan': chanavg_vs_chan}
+
+    # Only compute the averaging needed for the requested products.
+    reductions = set((product_group(product), product['avgchannel'])
+                     for product in products.values())
+    chan_keys = set(chan_key for _, chan_key in reductions)
+
+    colnames = _MAIN_COLUMNS + [data_colname]
+    if with_resid:
+        colnames.append('MODEL_DATA')
+
+    out = {name: [] for name in products}
+    stats_out = []
+
+    num_ant = len(ms_info['ant_names'])
+
+    # Fixed seed so the samples kept for the scan statistics are repeatable.
+    rng = np.random.default_rng(field_id)
+
+    for ddid in backend.data_desc_ids(field_id):
+
+        chan_freq = ms_info['chan_freq'][ddid]
+
+        # Running sums of each averaging group, merged after every chunk.
+        partials = {reduction: None for reduction in reductions}
+        bin_info = {}
+
+        num_corr = len(ms_info['corr_names'][ddid])
+
+        stats = None
+
+        for chunk in backend.iter_chunks(field_id, ddid, colnames, chunk_rows):
+            for chan_key in chan_keys:
+                sums, bin_chan, bin_freq = _chunk_sums(chunk, data_colname, chan_freq,
+                                                       chanavg[chan_key], with_resid)
+                bin_info[chan_key] = (bin_chan, bin_freq)
+
+                for group, this_key in reductions:
+                    if this_key != chan_key:
+                        continue
+
+                    chunk_partial = _chunk_group_sums(chunk, sums, group, with_resid)
+
+                    if partials[(group, chan_key)] is not None:
+                        chunk_partial = _merge_group_sums([partials[(group, chan_key)],
+                                                           chunk_partial],
+                                                          group, with_resid)
+
+                    partials[(group, chan_key)] = chunk_partial
+
+                del sums
+
+            if scan_stats:
+                samples, flags = chunk_stat_samples(chunk, data_colname, chanavg_vs_time)
+                partial = partial_scan_stats(samples, flags, num_ant, num_corr, rng=rng)
+                stats = partial if stats is None else merge_scan_stats([stats, partial])
+
+        if stats is not None:
+            reduced = reduce_scan_stats(stats, num_ant, num_corr)
+
+            stats_out.append(scan_stats_columns(reduced, field_id,
+                                                ms_info['spw_id'][ddid],
+                                                ms_info['corr_names'][ddid],
+                                                ms_info['ant_names']))
+
+        if len(bin_info) == 0:
+            continue
+
+        for group, chan_key in reductions:
+
+            reduced = _reduce_group(partials[(group, chan_key)], with_resid)
+
+            for name, product in products.items():
+                if (product_group(product), product['avgchannel']) != (group, chan_key):
+                    continue
+
+                out[name].append(_product_columns(reduced, product, field_id,
+                                                  ms_info['spw_id'][ddid],
+                                                  *bin_info[chan_key],
+                                                  ms_info['corr_names'][ddid],
+                                                  ms_info['ant_names']))
+
+    out = {name: {colname: np.concatenate([cols[colname] for cols in tabs])
+                  if len(tabs) > 0 else np.array([])
+                  for colname in TXT_COLNAMES}
+           for name, tabs in out.items()}
+
+    if scan_stats:
+        out[SCAN_STATS_KEY] = {colname: np.concatenate([cols[colname] for cols in stats_out])
+                               if len(stats_out) > 0 else np.array([])
+                               for colname in SCAN_STATS_COLNAMES}
+
+    return out
+
+
+def write_plotms_txt(filename, columns, product, meta=None):
+    '''
+    Write the columns in the txt layout of the plotms export. Names ending
+    in ".gz" or ".zst" are compressed.
+
+    Parameters
+    ----------
+    filename : str
+        Output file name.
+    columns : dict
+        {colname: array} for `TXT_COLNAMES`.
+    product : dict
+        Settings for the product from `qa_plot_tools.QA_TABLE_MAPPING`.
+    meta : dict, optional
+        Written as "# key: value" lines before the column names.
+    '''
+
+    units = [AXIS_UNITS[product['xaxis']], AXIS_UNITS[product['yaxis']],
+             'None', 'None', 'None', 'None', 'None', 'None', 'None',
+             'MJD(seconds)', 'GHz', 'None', 'None', 'None']
+
+    fmts = ['%.12g', '%.8g', '%.6g', '%d', '%d', '%d', '%d', '%s', '%s',
+            '%.3f', '%.9f', '%d', '%s', '%d']
+
+    with open_table_text(filename, 'w') as f:
+
+        for key, value in (meta or {}).items():
+            f.write(f"# {key}: {value}\n")
+
+        f.write(f"# From plot 0, iteration 0: {product['yaxis']} vs {product['xaxis']}\n")
+        f.write("# " + " ".join(TXT_COLNAMES) + "\n")
+        f.write("# " + " ".join(units) + "\n")
+
+        col_list = [columns[colname] for colname in TXT_COLNAMES]
+
+        for row in zip(*col_list):
+            f.write(" ".join(fmt % val for fmt, val in zip(fmts, row)) + "\n")
+
+
+def export_field_tables(backend, field_id, field_name, products, filenames,
+                        chanavg_vs_time=16384, chanavg_vs_chan=1,
+                        datacolumn='corrected', chunk_rows=100000, ms_info=None,
+                        vis=None, scan_stats_filename=None):
+    '''
+    Compute and write the tables for one field.
+
+    Parameters
+    ----------
+    filenames : dict
+        {product name: output file name} for the products in `products`.
+        Names ending in ".npz" are written with `table_io.write_npz_table`,
+        all others in the plotms txt layout.
+    scan_stats_filename : str, optional
+        Also write the per-scan statistics (see `scan_stats`), computed in
+        the same pass, to this npz file.
+
+    See `compute_field_products` for the other parameters.
+    '''
+
+    columns = compute_field_products(backend, field_id, products,
+                                     chanavg_vs_time=chanavg_vs_time,
+                                     chanavg_vs_chan=chanavg_vs_chan,
+                                     datacolumn=datacolumn,
+                                     chunk_rows=chunk_rows,
+                                     ms_info=ms_info,
+                                     scan_stats=scan_stats_filename is not None)
+
+    vis = vis if vis is not None else getattr(backend, 'vis', '')
+
+    if scan_stats_filename is not None:
+        meta = {'vis': vis,
+                'field': field_name,
+                'datacolumn': datacolumn,
+                'avgchannel': chanavg_vs_time}
+
+        write_npz_table(scan_stats_filename, columns[SCAN_STATS_KEY], meta)
+
+    for name, product in products.items():
+
+        this_datacolumn = product['ydatacolumn'] or datacolumn
+
+        chanavg = chanavg_vs_chan if product['avgchannel'] == 'chan' else chanavg_vs_time
+
+        meta = {'vis': vis,
+                'field': field_name,
+                'datacolumn': this_datacolumn,
+                'avgchannel': chanavg,
+                'avgtime': product['avgtime'] or '',
+                'avgbaseline': product['avgbaseline']}
+
+        if is_npz_table(filenames[name]):
+            write_npz_table(filenames[name], columns[name], meta)
+        else:
+            write_plotms_txt(filenames[name], columns[name], product, meta=meta)
@@ -7,9 +7,121 @@ Routines for creating additional QA plots.
 
 
 import os
+import time
+import multiprocessing
+from concurrent.futures import as_completed
+from contextlib import nullcontext
 import numpy as np
 
 import quicklook_sma.utilities as utils
+from quicklook_sma.table_io import (plotms_output_name, finalize_plotms_output,
+                                    TABLE_EXTENSIONS)
+from quicklook_sma.parallel import get_executor, get_num_workers
+from quicklook_sma.export_casa_tables.manifest import ExportManifest, ms_stamp
+from quicklook_sma.ms_metadata import get_ms_metadata
+from quicklook_sma.export_casa_tables.ms_export import (CasaTableBackend, read_ms_info,
+                                                         export_field_tables)
+
+
+# Name of the per-field scan statistics table (see `scan_stats`).
+SCAN_STATS_TABLE = 'scan_stats'
+
+
+# plotms settings for each QA table. `avgchannel` selects `chanavg_vs_time`
+# or `chanavg_vs_chan`. `ydatacolumn=None` uses the `datacolumn` given to
+# `make_qa_tables`.
+QA_TABLE_MAPPING = {'amp_time': {'xaxis': 'time',
+                                 'yaxis': 'amp',
+                                 'ydatacolumn': None,
+                                 'avgchannel': 'time',
+                                 'avgtime': None,
+                                 'avgbaseline': True,
+                                 'xlabel': 'Time',
+                                 'ylabel': 'Amp',
+                                 'calibrator_only': False},
+                    'amp_chan': {'xaxis': 'chan',
+                                 'yaxis': 'amp',
+                                 'ydatacolumn': None,
+                                 'avgchannel': 'chan',
+                                 'avgtime': '1e8',
+                                 'avgbaseline': True,
+                                 'xlabel': 'Channel',
+                                 'ylabel': 'Amp',
+                                 'calibrator_only': False},
+                    'amp_uvdist': {'xaxis': 'uvdist',
+                                   'yaxis': 'amp',
+                                   'ydatacolumn': None,
+                                   'avgchannel': 'time',
+                                   'avgtime': '1e8',
+                                   'avgbaseline': False,
+                                   'xlabel': 'uv-dist',
+                                   'ylabel': 'Amp',
+                                   'calibrator_only': False},
+                    'phase_time': {'xaxis': 'time',
+                                   'yaxis': 'phase',
+                                   'ydatacolumn': None,
+                                   'avgchannel': 'time',
+                                   'avgtime': None,
+                                   'avgbaseline': True,
+                                   'xlabel': 'Time',
+                                   'ylabel': 'Phase',
+                                   'calibrator_only': True},
+                    'phase_chan': {'xaxis': 'chan',
+                                   'yaxis': 'phase',
+                                   'ydatacolumn': None,
+                                   'avgchannel': 'chan',
+                                   'avgtime': '1e8',
+                                   'avgbaseline': True,
+                                   'xlabel': 'Chan',
+                                   'ylabel': 'Phase',
+                                   'calibrator_only': True},
+                    'phase_uvdist': {'xaxis': 'uvdist',
+                                     'yaxis': 'phase',
+                                     'ydatacolumn': None,
+                                     'avgchannel': 'time',
+                                     'avgtime': '1e8',
+                                     'avgbaseline': False,
+                                     'xlabel': 'uv-dist',
+                                     'ylabel': 'Phase',
+                                     'calibrator_only': True},
+                    'amp_phase': {'xaxis': 'amp',
+                                  'yaxis': 'phase',
+                                  'ydatacolumn': None,
+                                  'avgchannel': 'time',
+                                  'avgtime': '1e8',
+                                  'avgbaseline': False,
+                                  'xlabel': 'Phase',
+                                  'ylabel': 'Amp',
+                                  'calibrator_only': True},
+                    # Check how good the point-source calibrator model is.
+                    'ampresid_uvwave': {'xaxis': 'uvwave',
+                                        'yaxis': 'amp',
+                                        'ydatacolumn': 'corrected-model_scalar',
+                                        'avgchannel': 'time',
+                                        'avgtime': '1e8',
+                                        'avgbaseline': False,
+                                        'xlabel': 'uv-dist',
+                                        'ylabel': 'Phase',
+                                        'calibrator_only': True},
+                    # Check for ant outliers
+                    'amp_ant1': {'xaxis': 'antenna1',
+                                 'yaxis': 'amp',
+                                 'ydatacolumn': None,
+                                 'avgchannel': 'time',
+                                 'avgtime': '1e8',
+                                 'avgbaseline': False,
+                                 'xlabel': 'antenna 1',
+                                 'ylabel': 'Amp',
+                                 'calibrator_only': True},
+                    'phase_ant1': {'xaxis': 'antenna1',
+                                   'yaxis': 'phase',
+                                   'ydatacolumn': None,
+                                   'avgchannel': 'time',
+                                   'avgtime': '1e8',
+                                   'avgbaseline': False,
+                                   'xlabel': 'antenna 1',
+                                   'ylabel': 'Phase',
+                                   'calibrator_only': True}}
 
 
 def make_qa_tables(config_file,
@@ -18,22 +130,60 @@ def make_qa_tables(config_file,
                    overwrite=True,
                    chanavg_vs_time=16384,
                    chanavg_vs_chan=1,
-                   datacolumn='corrected'):
+                   datacolumn='corrected',
+                   engine='plotms',
+                   chunk_rows=100000,
+                   n_workers=1,
+                   max_readers=None,
+                   scan_stats=False):
 
     '''
     Specifically for saving txt tables. Replace the scan loop in
     `make_qa_scan_figures` to make fewer but larger tables.
 
+    With `outtype='npz'`, each table is saved as a compressed binary table
+    (see `quicklook_sma.table_io`) instead of txt. These are several times
+    smaller and faster to read. 'txt.gz' and 'txt.zst' keep the txt layout
+    but compress it with gzip or zstd.
+
+    Parameters
+    ----------
+    overwrite : bool, optional
+        Redo every table. Otherwise only tables that are missing, were made
+        with other settings or from a changed MS, or were not completely
+        written are redone (see `manifest.ExportManifest`).
+    engine : str, optional
+        'plotms' exports each table in `QA_TABLE_MAPPING` with a separate
+        plotms call. 'numpy' reads the MS once per field and computes all
+        tables with `ms_export`. Only the table types in
+        `table_io.TABLE_EXTENSIONS` are supported by 'numpy'.
+    chunk_rows : int, optional
+        Number of MS rows read at once with `engine='numpy'`.
+    n_workers : int or None, optional
+        Number of processes exporting at once. Jobs are per field for
+        `engine='numpy'` and per field and table for `engine='plotms'`.
+        `None` uses all CPUs.
+    max_readers : int, optional
+        Maximum number of processes reading the MS at the same time.
+        Defaults to `n_workers`. Lower this to limit the I/O load.
+    scan_stats : bool, optional
+        Also save the per-scan, SPW, correlation and antenna statistics of
+        each field to "field_{name}_scan_stats.npz" (see
+        `ms_export.compute_field_products`). Off by default. With
+        `engine='numpy'` these come from the same pass as the other tables.
+        With 'plotms' they need a separate pass over the MS per field.
+
     '''
 
-    from casatools import logsink
+    if engine not in ['plotms', 'numpy']:
+        raise ValueError(f"engine must be 'plotms' or 'numpy'. Received {engine}")
 
-    casalog = logsink()
+    if engine == 'numpy' and outtype not in TABLE_EXTENSIONS:
+        raise ValueError(f"engine='numpy' only writes {TABLE_EXTENSIONS} tables.")
 
-    from casatools import table
-    tb = table()
+    from casatools import logsink
 
-    from casaplotms import plotms
+    casalog = logsink()
 
     casalog.post("Running make_qa_tables to export txt files for QA.")
     print("Running make_qa_tables to export txt files for QA.")
@@ -48,18 +198,23 @@ def make_qa_tables(config_file,
         os.mkdir(output_folder)
     else:
         if overwrite:
-            casalog.post(message="Removing plot tables in {}".format(output_folder), origin='make_qa_tables')
-            print("Removing plot tables in {}".format(output_folder))
-            os.system("rm -r {}/*".format(output_folder))
+            casalog.post(message="Re-exporting all plot tables in {}".format(output_folder),
+                         origin='make_qa_tables')
+            print("Re-exporting all plot tables in {}".format(output_folder))
         else:
-            casalog.post("{} already exists. Will skip existing files.".format(output_folder))
-            # raise ValueError("{} already exists. Enable overwrite=True to rerun.".format(output_folder))
+            casalog.post("{} already exists. Will skip tables that are up to date.".format(output_folder))
+
+    # Records what each table was made from so reruns only redo tables that
+    # are stale or were not completely written.
+    manifest = ExportManifest(output_folder)
+    ms_identity = ms_stamp(ms_name)
 
-    # Read the field names
-    tb.open(os.path.join(ms_name, "FIELD"))
-    names = tb.getcol('NAME')
-    numFields = tb.nrows()
-    tb.close()
+    # Field names and rows from the metadata cache shared with the other
+    # stages (see `ms_metadata`).
+    field_info = get_ms_metadata(ms_name)['fields']
+
+    names = np.array(field_info['names'])
+    numFields = len(names)
 
     # Get calibrator names:
     cal_fields = utils.get_calfields(this_config)
@@ -68,19 +223,15 @@ def make_qa_tables(config_file,
     science_fields = utils.get_mosaicfields(this_config)
 
     # Determine the fields that are calibrators.
-    tb.open(ms_name)
     is_calibrator = np.zeros((numFields,), dtype='bool')
 
-    has_data = np.ones((numFields,), dtype='bool')
+    # Is there any data for this field?
+    has_data = np.array(field_info['nrows']) > 0
 
     for ii in range(numFields):
-        subtable = tb.query('FIELD_ID==%s' % ii)
 
         this_field = names[ii]
 
-        # Is there any data for this field?
-        has_data[ii] = subtable.nrows() > 0
-
         # Is the intent for calibration?
         if this_field in cal_fields.split(","):
             is_calibrator[ii] = True
@@ -91,15 +242,35 @@ def make_qa_tables(config_file,
         if not is_calibrator[ii] and this_field not in science_fields.split(","):
             has_data[ii] = False
 
-    tb.close()
-
     casalog.post(message="Fields are: {}".format(names), origin='make_qa_tables')
     casalog.post(message="Calibrator fields are: {}".format(names[is_calibrator]), origin='make_qa_tables')
 
     print("Fields are: {}".format(names))
     print("Calibrator fields are: {}".format(names[is_calibrator]))
 
+    job_settings = {'engine': engine,
+                    'ms_name': ms_name,
+                    'datacolumn': datacolumn,
+                    'chanavg_vs_time': chanavg_vs_time,
+                    'chanavg_vs_chan': chanavg_vs_chan,
+                    'chunk_rows': chunk_rows,
+                    'ms_info': None}
+
+    # plotms handles a missing MODEL_DATA column itself.
+    has_model = True
+
+    if engine == 'numpy':
+        backend = CasaTableBackend(ms_name)
+        job_settings['ms_info'] = read_ms_info(backend)
+
+        has_model = 'MODEL_DATA' in backend.colnames()
+
+    n_workers = get_num_workers(n_workers)
+
+    jobs = []
+
     # Loop through fields. Make separate tables only for different targets.
+    # The exports are collected as jobs and run below.
 
     for ii in range(numFields):
         casalog.post(message="On field {}".format(names[ii]), origin='make_qa_plots')
@@ -111,361 +282,300 @@ def make_qa_tables(config_file,
                          origin='make_qa_plots')
             continue
 
-        # Amp vs. time
-        amptime_filename = os.path.join(output_folder,
-                                        'field_{0}_amp_time.{1}'.format(names[ii], outtype))
-
-        if not os.path.exists(amptime_filename):
-
-            plotms(vis=ms_name,
-                xaxis='time',
-                yaxis='amp',
-                ydatacolumn=datacolumn,
-                selectdata=True,
-                field=names[ii],
-                scan="",
-                spw="",
-                avgchannel=str(chanavg_vs_time),
-                correlation="",
-                averagedata=True,
-                avgbaseline=True,
-                transform=False,
-                extendflag=False,
-                plotrange=[],
-                # title='Amp vs Time: Field {0} Scan {1}'.format(names[ii], jj),
-                xlabel='Time',
-                ylabel='Amp',
-                showmajorgrid=False,
-                showminorgrid=False,
-                plotfile=amptime_filename,
-                overwrite=True,
-                showgui=False)
-        else:
-            casalog.post(message="File {} already exists. Skipping".format(amptime_filename),
-                         origin='make_qa_tables')
-
-        # Amp vs. channel
-        ampchan_filename = os.path.join(output_folder,
-                                     'field_{0}_amp_chan.{1}'.format(names[ii], outtype))
-
-        if not os.path.exists(ampchan_filename):
-
-            plotms(vis=ms_name,
-                xaxis='chan',
-                yaxis='amp',
-                ydatacolumn=datacolumn,
-                selectdata=True,
-                field=names[ii],
-                scan="",
-                spw="",
-                avgchannel=str(chanavg_vs_chan),
-                avgtime="1e8",
-                correlation="",
-                averagedata=True,
-                avgbaseline=True,
-                transform=False,
-                extendflag=False,
-                plotrange=[],
-                # title='Amp vs Chan: Field {0} Scan {1}'.format(names[ii], jj),
-                xlabel='Channel',
-                ylabel='Amp',
-                showmajorgrid=False,
-                showminorgrid=False,
-                plotfile=ampchan_filename,
-                overwrite=True,
-                showgui=False)
-        else:
-            casalog.post(message="File {0} already exists. Skipping".format(ampchan_filename),
-                        origin='make_qa_tables')
-
-        # Plot amp vs uvdist
-        ampuvdist_filename = os.path.join(output_folder,
-                                     'field_{0}_amp_uvdist.{1}'.format(names[ii], outtype))
-
-        if not os.path.exists(ampuvdist_filename):
-
-            plotms(vis=ms_name,
-                xaxis='uvdist',
-                yaxis='amp',
-                ydatacolumn=datacolumn,
-                selectdata=True,
-                field=names[ii],
-                scan="",
-                spw="",
-                avgchannel=str(chanavg_vs_time),
-                avgtime='1e8',
-                correlation="",
-                averagedata=True,
-                avgbaseline=False,
-                transform=False,
-                extendflag=False,
-                plotrange=[],
-                # title='Amp vs UVDist: Field {0} Scan {1}'.format(names[ii], jj),
-                xlabel='uv-dist',
-                ylabel='Amp',
-                showmajorgrid=False,
-                showminorgrid=False,
-                plotfile=ampuvdist_filename,
-                overwrite=True,
-                showgui=False)
-        else:
-            casalog.post(message="File {} already exists. Skipping".format(ampuvdist_filename),
-                         origin='make_qa_tables')
-
         # Make phase plots if a calibrator source.
-
         if is_calibrator[ii]:
-
             casalog.post("This is a calibrator. Exporting phase info, too.")
             print("This is a calibrator. Exporting phase info, too.")
 
-            # Plot phase vs time
+        products = {}
+        filenames = {}
+        params = {}
 
-            phasetime_filename = os.path.join(output_folder,
-                                         'field_{0}_phase_time.{1}'.format(names[ii], outtype))
+        for key, product in QA_TABLE_MAPPING.items():
 
-            if not os.path.exists(phasetime_filename):
+            if product['calibrator_only'] and not is_calibrator[ii]:
+                continue
 
-                plotms(vis=ms_name,
-                    xaxis='time',
-                    yaxis='phase',
-                    ydatacolumn=datacolumn,
-                    selectdata=True,
-                    field=names[ii],
-                    scan="",
-                    spw="",
-                    correlation="",
-                    avgchannel=str(chanavg_vs_time),
-                    averagedata=True,
-                    avgbaseline=True,
-                    transform=False,
-                    extendflag=False,
-                    plotrange=[],
-                    # title='Phase vs Time: Field {0} Scan {1}'.format(names[ii], jj),
-                    xlabel='Time',
-                    ylabel='Phase',
-                    showmajorgrid=False,
-                    showminorgrid=False,
-                    plotfile=phasetime_filename,
-                    overwrite=True,
-                    showgui=False)
-            else:
-                casalog.post(message="File {} already exists. Skipping".format(phasetime_filename),
-                            origin='make_qa_tables')
+            # Never written, so also kept out of the manifest.
+            if product['ydatacolumn'] == 'corrected-model_scalar' and not has_model:
+                casalog.post(message="No MODEL_DATA column. Skipping {}.".format(key),
+                             origin='make_qa_tables')
+                continue
 
-            # Plot phase vs channel
-            phasechan_filename = os.path.join(output_folder,
-                                         'field_{0}_phase_chan.{1}'.format(names[ii], outtype))
+            this_filename = os.path.join(output_folder,
+                                         'field_{0}_{1}.{2}'.format(names[ii], key, outtype))
 
-            if not os.path.exists(phasechan_filename):
+            this_params = _product_params(ms_identity, names[ii], key, product,
+                                          datacolumn=datacolumn,
+                                          chanavg_vs_time=chanavg_vs_time,
+                                          chanavg_vs_chan=chanavg_vs_chan,
+                                          engine=engine)
 
-                plotms(vis=ms_name,
-                    xaxis='chan',
-                    yaxis='phase',
-                    ydatacolumn=datacolumn,
-                    selectdata=True,
-                    field=names[ii],
-                    scan="",
-                    spw="",
-                    avgchannel=str(chanavg_vs_chan),
-                    avgtime="1e8",
-                    correlation="",
-                    averagedata=True,
-                    avgbaseline=True,
-                    transform=False,
-                    extendflag=False,
-                    plotrange=[],
-                    # title='Phase vs Chan: Field {0} Scan {1}'.format(names[ii], jj),
-                    xlabel='Chan',
-                    ylabel='Phase',
-                    showmajorgrid=False,
-                    showminorgrid=False,
-                    plotfile=phasechan_filename,
-                    overwrite=True,
-                    showgui=False)
-            else:
-                casalog.post(message="File {} already exists. Skipping".format(phasechan_filename),
-                            origin='make_qa_tables')
+            if not overwrite and manifest.is_current(this_filename, this_params):
+                casalog.post(message="File {} is up to date. Skipping".format(this_filename),
+                             origin='make_qa_tables')
+                continue
 
-            # Plot phase vs uvdist
-            phaseuvdist_filename = os.path.join(output_folder,
-                                         'field_{0}_phase_uvdist.{1}'.format(names[ii], outtype))
+            # Drop the old entry so an interrupted rewrite is not reused.
+            manifest.remove(this_filename)
 
-            if not os.path.exists(phaseuvdist_filename):
+            products[key] = product
+            filenames[key] = this_filename
+            params[key] = this_params
 
-                plotms(vis=ms_name,
-                    xaxis='uvdist',
-                    yaxis='phase',
-                    ydatacolumn=datacolumn,
-                    selectdata=True,
-                    field=names[ii],
-                    scan="",
-                    spw="",
-                    correlation="",
-                    avgchannel=str(chanavg_vs_time),
-                    avgtime='1e8',
-                    averagedata=True,
-                    avgbaseline=False,
-                    transform=False,
-                    extendflag=False,
-                    plotrange=[],
-                    # title='Phase vs UVDist: Field {0} Scan {1}'.format(names[ii], jj),
-                    xlabel='uv-dist',
-                    ylabel='Phase',
-                    showmajorgrid=False,
-                    showminorgrid=False,
-                    plotfile=phaseuvdist_filename,
-                    overwrite=True,
-                    showgui=False)
+        if scan_stats:
+            stats_filename = os.path.join(output_folder,
+                                          'field_{0}_{1}.npz'.format(names[ii], SCAN_STATS_TABLE))
 
+            stats_params = _scan_stats_params(ms_identity, names[ii],
+                                              datacolumn=datacolumn,
+                                              chanavg_vs_time=chanavg_vs_time)
+
+            if not overwrite and manifest.is_current(stats_filename, stats_params):
+                casalog.post(message="File {} is up to date. Skipping".format(stats_filename),
+                             origin='make_qa_tables')
             else:
-                casalog.post(message="File {} already exists. Skipping".format(phaseuvdist_filename),
-                            origin='make_qa_tables')
+                manifest.remove(stats_filename)
+
+                filenames[SCAN_STATS_TABLE] = stats_filename
+                params[SCAN_STATS_TABLE] = stats_params
+
+        if engine == 'plotms':
+            # One job per table so the plotms calls for a field can also
+            # run at the same time.
+            for key, product in products.items():
+                jobs.append(dict(job_settings, field_id=ii, field_name=names[ii],
+                                 products={key: product},
+                                 filenames={key: filenames[key]},
+                                 params={key: params[key]}))
+
+            if SCAN_STATS_TABLE in filenames:
+                jobs.append(dict(job_settings, field_id=ii, field_name=names[ii],
+                                 products={},
+                                 filenames={SCAN_STATS_TABLE: filenames[SCAN_STATS_TABLE]},
+                                 params={SCAN_STATS_TABLE: params[SCAN_STATS_TABLE]}))
 
-            # Plot amp vs phase
-            ampphase_filename = os.path.join(output_folder,
-                                         'field_{0}_amp_phase.{1}'.format(names[ii], outtype))
+        else:
 
-            if not os.path.exists(ampphase_filename):
+            if len(filenames) == 0:
+                continue
 
-                plotms(vis=ms_name,
-                    xaxis='amp',
-                    yaxis='phase',
-                    ydatacolumn=datacolumn,
-                    selectdata=True,
-                    field=names[ii],
-                    scan="",
-                    spw="",
-                    correlation="",
-                    avgchannel=str(chanavg_vs_time),
-                    avgtime='1e8',
-                    averagedata=True,
-                    avgbaseline=False,
-                    transform=False,
-                    extendflag=False,
-                    plotrange=[],
-                    # title='Amp vs Phase: Field {0} Scan {1}'.format(names[ii], jj),
-                    xlabel='Phase',
-                    ylabel='Amp',
-                    showmajorgrid=False,
-                    showminorgrid=False,
-                    plotfile=ampphase_filename,
-                    overwrite=True,
-                    showgui=False)
-            else:
-                casalog.post(message="File {} already exists. Skipping".format(ampphase_filename),
-                            origin='make_qa_tables')
+            jobs.append(dict(job_settings, field_id=ii, field_name=names[ii],
+                             products=products, filenames=filenames, params=params))
 
-            # Plot uv-wave vs, amp - model residual
-            # Check how good the point-source calibrator model is.
+    if n_workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            _finish_job(casalog, manifest, job, _export_qa_job(job))
 
-            ampresid_filename = os.path.join(output_folder,
-                                         'field_{0}_ampresid_uvwave.{1}'.format(names[ii],
-                                                                                outtype))
+        return
 
-            if not os.path.exists(ampresid_filename):
+    # Bound the number of processes reading the MS at once.
+    reader_semaphore = multiprocessing.Semaphore(max_readers or n_workers)
 
-                plotms(vis=ms_name,
-                    xaxis='uvwave',
-                    yaxis='amp',
-                    ydatacolumn='corrected-model_scalar',
-                    selectdata=True,
-                    field=names[ii],
-                    scan="",
-                    spw="",
-                    correlation="",
-                    avgchannel=str(chanavg_vs_time),
-                    avgtime='1e8',
-                    averagedata=True,
-                    avgbaseline=False,
-                    transform=False,
-                    extendflag=False,
-                    plotrange=[],
-                    xlabel='uv-dist',
-                    ylabel='Phase',
-                    showmajorgrid=False,
-                    showminorgrid=False,
-                    plotfile=ampresid_filename,
-                    overwrite=True,
-                    showgui=False)
+    with get_executor(min(n_workers, len(jobs)), kind='process',
+                      initializer=_init_export_worker,
+                      initargs=(reader_semaphore,)) as executor:
 
-            else:
-                casalog.post(message="File {} already exists. Skipping".format(ampresid_filename),
-                             origin='make_qa_tables')
+        futures = {executor.submit(_export_qa_job, job): job for job in jobs}
 
-            # Plot amplitude vs antenna 1.
-            # Check for ant outliers
+        for future in as_completed(futures):
+            _finish_job(casalog, manifest, futures[future], future.result())
 
-            ampant_filename = os.path.join(output_folder,
-                                         'field_{0}_amp_ant1.{1}'.format(names[ii],
-                                                                         outtype))
 
-            if not os.path.exists(ampant_filename):
+# Set in each worker process by `_init_export_worker`.
+_READER_SEMAPHORE = None
 
-                plotms(vis=ms_name,
-                    xaxis='antenna1',
-                    yaxis='amp',
-                    ydatacolumn=datacolumn,
-                    selectdata=True,
-                    field=names[ii],
-                    scan="",
-                    spw="",
-                    correlation="",
-                    avgchannel=str(chanavg_vs_time),
-                    avgtime='1e8',
-                    averagedata=True,
-                    avgbaseline=False,
-                    transform=False,
-                    extendflag=False,
-                    plotrange=[],
-                    xlabel='antenna 1',
-                    ylabel='Amp',
-                    showmajorgrid=False,
-                    showminorgrid=False,
-                    plotfile=ampant_filename,
-                    overwrite=True,
-                    showgui=False)
 
-            else:
-                casalog.post(message="File {} already exists. Skipping".format(ampant_filename),
-                             origin='make_qa_tables')
+def _init_export_worker(semaphore):
+    global _READER_SEMAPHORE
+    _READER_SEMAPHORE = semaphore
+
+
+def _finish_job(casalog, manifest, job, result):
+    '''
+    Post the messages returned by `_export_qa_job` to the CASA log and
+    record the tables it completed in the manifest.
+    '''
+
+    messages, completed = result
+
+    for message, origin in messages:
+        casalog.post(message=message, origin=origin)
 
+    for key in completed:
+        manifest.record(job['filenames'][key], job['params'][key])
 
-            # Plot phase vs antenna 1.
-            # Check for ant outliers
 
-            phaseant_filename = os.path.join(output_folder,
-                                         'field_{0}_phase_ant1.{1}'.format(names[ii],
-                                                                         outtype))
+def _remove_old_output(filename):
+    '''
+    Remove an earlier export of `filename`, and any plotms txt file left
+    for it, so a failed export cannot leave the old table in place.
+    '''
+
+    for name in {filename, plotms_output_name(filename)}:
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def _plotms_succeeded(result, plotfile):
+    '''
+    Check that a plotms call returning `result` wrote `plotfile`. plotms
+    returns False when it fails rather than raising.
+    '''
+
+    return result is not False and os.path.exists(plotfile)
 
-            if not os.path.exists(phaseant_filename):
 
-                plotms(vis=ms_name,
-                    xaxis='antenna1',
-                    yaxis='phase',
-                    ydatacolumn=datacolumn,
+def _product_params(ms_identity, field_name, key, product, datacolumn='corrected',
+                    chanavg_vs_time=16384, chanavg_vs_chan=1, engine='plotms'):
+    '''
+    Selection and averaging parameters of one table, as recorded in the
+    export manifest.
+    '''
+
+    return {'vis': ms_identity['vis'],
+            'ms_modified_ns': ms_identity['modified_ns'],
+            'field': str(field_name),
+            'table': key,
+            'datacolumn': product['ydatacolumn'] or datacolumn,
+            'avgchannel': chanavg_vs_chan if product['avgchannel'] == 'chan' else chanavg_vs_time,
+            'avgtime': product['avgtime'],
+            'avgbaseline': product['avgbaseline'],
+            'engine': engine}
+
+
+def _scan_stats_params(ms_identity, field_name, datacolumn='corrected',
+                       chanavg_vs_time=16384):
+    '''
+    Parameters of the scan statistics table, as recorded in the export
+    manifest. These are always made with `ms_export`.
+    '''
+
+    return {'vis': ms_identity['vis'],
+            'ms_modified_ns': ms_identity['modified_ns'],
+            'field': str(field_name),
+            'table': SCAN_STATS_TABLE,
+            'datacolumn': datacolumn,
+            'avgchannel': chanavg_vs_time,
+            'engine': 'numpy'}
+
+
+def _export_qa_job(job):
+    '''
+    Export the tables for one field in `make_qa_tables`.
+
+    Worker processes cannot write to the CASA log of the main process, so
+    the log messages are returned as a list of (message, origin) and posted
+    by the caller. The keys of the tables that were written are returned
+    with them.
+    '''
+
+    messages = []
+    completed = []
+
+    field_name = job['field_name']
+
+    reader_lock = _READER_SEMAPHORE if _READER_SEMAPHORE is not None else nullcontext()
+
+    start_time = time.time()
+
+    # The scan statistics are not a plotms product.
+    stats_filename = job['filenames'].get(SCAN_STATS_TABLE)
+
+    with reader_lock:
+
+        if job['engine'] == 'plotms':
+
+            for key, product in job['products'].items():
+                success = _plotms_qa_table(job['ms_name'], field_name, product,
+                                           job['filenames'][key],
+                                           datacolumn=job['datacolumn'],
+                                           chanavg_vs_time=job['chanavg_vs_time'],
+                                           chanavg_vs_chan=job['chanavg_vs_chan'])
+
+                if success:
+                    completed.append(key)
+                else:
+                    messages.append((f"plotms failed to export {job['filenames'][key]}"
+                                     f" for field {field_name}", 'make_qa_tables'))
+
+        if job['engine'] == 'numpy' or stats_filename is not None:
+
+            products = job['products'] if job['engine'] == 'numpy' else {}
+
+            export_field_tables(CasaTableBackend(job['ms_name']), job['field_id'],
+                                field_name, products, job['filenames'],
+                                chanavg_vs_time=job['chanavg_vs_time'],
+                                chanavg_vs_chan=job['chanavg_vs_chan'],
+                                datacolumn=job['datacolumn'],
+                                chunk_rows=job['chunk_rows'],
+                                ms_info=job['ms_info'],
+                                vis=job['ms_name'],
+                                scan_stats_filename=stats_filename)
+
+            # Errors in the numpy export raise.
+            completed.extend(products)
+            if stats_filename is not None:
+                completed.append(SCAN_STATS_TABLE)
+
+    messages.append((f"Exported {', '.join(completed)} for field {field_name}"
+                     f" in {time.time() - start_time:.1f} s (pid {os.getpid()})",
+                     'make_qa_tables'))
+
+    return messages, completed
+
+
+def _plotms_qa_table(ms_name, field_name, product, filename, datacolumn='corrected',
+                     chanavg_vs_time=16384, chanavg_vs_chan=1):
+    '''
+    Export one table in `QA_TABLE_MAPPING` with plotms. Any earlier export
+    of `filename` is removed first. Returns False when plotms fails.
+    '''
+
+    from casaplotms import plotms
+
+    # plotms only writes txt. Binary or compressed tables are converted
+    # afterwards.
+    plotfile = plotms_output_name(filename)
+
+    avgchannel = chanavg_vs_chan if product['avgchannel'] == 'chan' else chanavg_vs_time
+
+    # avgtime is only set for the tables that average over time.
+    avg_kwargs = {}
+    if product['avgtime'] is not None:
+        avg_kwargs['avgtime'] = product['avgtime']
+
+    _remove_old_output(filename)
+
+    result = plotms(vis=ms_name,
+                    xaxis=product['xaxis'],
+                    yaxis=product['yaxis'],
+                    ydatacolumn=product['ydatacolumn'] or datacolumn,
                     selectdata=True,
-                    field=names[ii],
+                    field=field_name,
                     scan="",
                     spw="",
+                    avgchannel=str(avgchannel),
                     correlation="",
-                    avgchannel=str(chanavg_vs_time),
-                    avgtime='1e8',
                     averagedata=True,
-                    avgbaseline=False,
+                    avgbaseline=product['avgbaseline'],
                     transform=False,
                     extendflag=False,
                     plotrange=[],
-                    xlabel='antenna 1',
-                    ylabel='Phase',
+                    xlabel=product['xlabel'],
+                    ylabel=product['ylabel'],
                     showmajorgrid=False,
                     showminorgrid=False,
-                    plotfile=phaseant_filename,
+                    plotfile=plotfile,
                     overwrite=True,
-                    showgui=False)
+                    showgui=False,
+                    **avg_kwargs)
 
-            else:
-                casalog.post(message="File {} already exists. Skipping".format(phaseant_filename),
-                             origin='make_qa_tables')
+    if not _plotms_succeeded(result, plotfile):
+        # Drop any partial output.
+        _remove_old_output(filename)
+        return False
 
+    finalize_plotms_output(plotfile, filename)
 
+    return True
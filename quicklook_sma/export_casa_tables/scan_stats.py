@@ -0,0 +1,339 @@
+
+'''
+Per-scan summary statistics of the visibilities.
+
+For each field, scan, SPW, correlation and antenna, the table holds the
+median, MAD, minimum and maximum of the channel-averaged amplitudes and
+phases of all baseline integrations that include the antenna, with the
+number of points and the flagged fraction. The statistics are gathered in
+the same pass over the MS as the other QA tables (see
+`ms_export.compute_field_products`) and give a small table for overview
+plots and outlier checks.
+
+Each chunk of rows is reduced to partial statistics (`partial_scan_stats`)
+that are merged as the chunks are read (`merge_scan_stats`), so the samples
+of the whole field are never held at once. The counts, time range, minimum,
+maximum and mean phase are exact. The median and MAD come from a random
+subset of at most `MAX_STAT_SAMPLES` samples per group, and are exact for
+groups with fewer samples.
+
+Autocorrelations are not included.
+'''
+
+import numpy as np
+
+from quicklook_sma.averaging import channel_sums
+
+
+SCAN_STATS_COLNAMES = ['field', 'scan', 'spw', 'corr', 'ant', 'antname',
+                       'time_min', 'time_max', 'npts', 'flag_frac',
+                       'amp_median', 'amp_mad', 'amp_min', 'amp_max',
+                       'phase_median', 'phase_mad']
+
+# Samples kept per scan, antenna and correlation for the median and MAD.
+MAX_STAT_SAMPLES = 10000
+
+# Per-group columns of the partial statistics and how they are merged.
+_GROUP_SUMS = ['nflag', 'ntotal', 'npts', 'phasor_sum']
+_GROUP_MINS = ['time_min', 'amp_min']
+_GROUP_MAXS = ['time_max', 'amp_max']
+
+
+def chunk_stat_samples(chunk, datacolumn, chanavg):
+    '''
+    Channel-averaged samples and flag counts of one chunk of rows.
+
+    Parameters
+    ----------
+    chunk : dict
+        Main table columns in the casatools layout (rows last).
+    datacolumn : str
+        Name of the data column in `chunk`.
+    chanavg : int
+        Number of channels averaged into one sample.
+
+    Returns
+    -------
+    samples : dict
+        Flat 'scan', 'ant', 'corr', 'amp' and 'phase' (deg) arrays of the
+        unflagged samples, with each baseline listed for both antennas.
+    flags : dict
+        Flat 'scan', 'ant', 'corr', 'time', 'nflag' and 'ntotal' arrays for
+        every row and correlation, with each baseline listed for both
+        antennas.
+    '''
+
+    cross = chunk['ANTENNA1'] != chunk['ANTENNA2']
+
+    # casatools layout is (corr, chan, row). Move rows first.
+    data = np.transpose(chunk[datacolumn][..., cross], (2, 1, 0))
+    good = ~np.transpose(chunk['FLAG'][..., cross], (2, 1, 0))
+
+    num_rows, num_chan, num_corr = data.shape
+
+    scans = chunk['SCAN_NUMBER'][cross]
+    ant1 = chunk['ANTENNA1'][cross]
+    ant2 = chunk['ANTENNA2'][cross]
+
+    # Flag counts per row and correlation.
+    row_idx, corr_idx = np.divmod(np.arange(num_rows * num_corr), num_corr)
+
+    nflag = (~good).sum(axis=1).ravel()
+
+    flags = {'scan': np.tile(scans[row_idx], 2),
+             'ant': np.concatenate([ant1[row_idx], ant2[row_idx]]),
+             'corr': np.tile(corr_idx, 2),
+             'time': np.tile(chunk['TIME'][cross][row_idx], 2),
+             'nflag': np.tile(nflag, 2),
+             'ntotal': np.full(2 * len(nflag), num_chan)}
+
+    # Vector average over the channel bins.
+    vis_sum, count = channel_sums(data, good, chanavg)
+
+    num_bins = vis_sum.shape[1]
+
+    keep = count.ravel() > 0
+
+    mean_vis = vis_sum.ravel()[keep] / count.ravel()[keep]
+
+    row_idx, bin_corr_idx = np.divmod(np.flatnonzero(keep), num_bins * num_corr)
+    corr_idx = bin_corr_idx % num_corr
+
+    amp = np.abs(mean_vis)
+    phase = np.rad2deg(np.angle(mean_vis))
+
+    samples = {'scan': np.tile(scans[row_idx], 2),
+               'ant': np.concatenate([ant1[row_idx], ant2[row_idx]]),
+               'corr': np.tile(corr_idx, 2),
+               'amp': np.tile(amp, 2),
+               'phase': np.tile(phase, 2)}
+
+    return samples, flags
+
+
+def grouped_median(group_idx, values, num_groups):
+    '''
+    Median of `values` in each group. Empty groups are NaN.
+
+    Returns the medians with the values sorted by group then value, and the
+    start and size of each group in the sorted values.
+    '''
+
+    order = np.lexsort((values, group_idx))
+    sorted_values = values[order]
+
+    counts = np.bincount(group_idx, minlength=num_groups)
+    starts = np.cumsum(counts) - counts
+
+    has_values = counts > 0
+
+    lower = (starts + (counts - 1) // 2)[has_values]
+    upper = (starts + counts // 2)[has_values]
+
+    medians = np.full(num_groups, np.nan)
+    medians[has_values] = 0.5 * (sorted_values[lower] + sorted_values[upper])
+
+    return medians, sorted_values, starts, counts
+
+
+def grouped_stats(group_idx, values, num_groups):
+    '''
+    Median, median absolute deviation, minimum and maximum of `values` in
+    each group. Empty groups are NaN.
+    '''
+
+    medians, sorted_values, starts, counts = grouped_median(group_idx, values, num_groups)
+
+    mads = grouped_median(group_idx, np.abs(values - medians[group_idx]), num_groups)[0]
+
+    has_values = counts > 0
+
+    mins = np.full(num_groups, np.nan)
+    maxs = np.full(num_groups, np.nan)
+
+    mins[has_values] = sorted_values[starts[has_values]]
+    maxs[has_values] = sorted_values[(starts + counts - 1)[has_values]]
+
+    return medians, mads, mins, maxs
+
+
+def _group_code(cols, num_ant, num_corr):
+    return (cols['scan'].astype(np.int64) * num_ant + cols['ant']) * num_corr + cols['corr']
+
+
+def _merge_groups(tables):
+    '''
+    Merge per-group tables, combining the rows that share a group code.
+    '''
+
+    codes = np.concatenate([table['code'] for table in tables])
+
+    out_codes, idx = np.unique(codes, return_inverse=True)
+    idx = idx.ravel()
+
+    num_groups = len(out_codes)
+
+    out = {'code': out_codes}
+
+    for key in _GROUP_SUMS:
+        values = np.concatenate([table[key] for table in tables])
+
+        if np.iscomplexobj(values):
+            out[key] = (np.bincount(idx, weights=values.real, minlength=num_groups) +
+                        1j * np.bincount(idx, weights=values.imag, minlength=num_groups))
+        else:
+            out[key] = np.bincount(idx, weights=values, minlength=num_groups)
+
+    for keys, init, func in [(_GROUP_MINS, np.inf, np.minimum),
+                             (_GROUP_MAXS, -np.inf, np.maximum)]:
+        for key in keys:
+            out[key] = np.full(num_groups, init)
+            func.at(out[key], idx, np.concatenate([table[key] for table in tables]))
+
+    return out
+
+
+def _keep_samples(samples, max_samples):
+    '''
+    Keep the `max_samples` samples with the smallest random keys in each
+    group. Merging the kept samples of two chunks this way gives a uniform
+    random subset of both.
+    '''
+
+    order = np.lexsort((samples['key'], samples['code']))
+    codes = samples['code'][order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.append(starts, len(codes)))
+
+    rank = np.arange(len(codes)) - np.repeat(starts, counts)
+
+    keep = order[rank < max_samples]
+
+    return {key: values[keep] for key, values in samples.items()}
+
+
+def partial_scan_stats(samples, flags, num_ant, num_corr, max_samples=MAX_STAT_SAMPLES,
+                       rng=None):
+    '''
+    Partial statistics of the `chunk_stat_samples` output of one chunk, to
+    be combined with `merge_scan_stats`.
+
+    Parameters
+    ----------
+    rng : `numpy.random.Generator`, optional
+        Draws the keys that pick the samples kept for the median and MAD.
+    '''
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    num_flags = len(flags['scan'])
+    num_samples = len(samples['scan'])
+
+    flag_rows = {'code': _group_code(flags, num_ant, num_corr),
+                 'nflag': flags['nflag'],
+                 'ntotal': flags['ntotal'],
+                 'npts': np.zeros(num_flags),
+                 'phasor_sum': np.zeros(num_flags, dtype=complex),
+                 'time_min': flags['time'],
+                 'time_max': flags['time'],
+                 'amp_min': np.full(num_flags, np.inf),
+                 'amp_max': np.full(num_flags, -np.inf)}
+
+    sample_code = _group_code(samples, num_ant, num_corr)
+
+    sample_rows = {'code': sample_code,
+                   'nflag': np.zeros(num_samples),
+                   'ntotal': np.zeros(num_samples),
+                   'npts': np.ones(num_samples),
+                   'phasor_sum': np.exp(1j * np.deg2rad(samples['phase'])),
+                   'time_min': np.full(num_samples, np.inf),
+                   'time_max': np.full(num_samples, -np.inf),
+                   'amp_min': samples['amp'],
+                   'amp_max': samples['amp']}
+
+    kept = {'code': sample_code,
+            'key': rng.random(num_samples),
+            'amp': samples['amp'],
+            'phase': samples['phase']}
+
+    return {'groups': _merge_groups([flag_rows, sample_rows]),
+            'samples': _keep_samples(kept, max_samples)}
+
+
+def merge_scan_stats(partials, max_samples=MAX_STAT_SAMPLES):
+    '''
+    Combine partial statistics from `partial_scan_stats` or earlier merges.
+    '''
+
+    samples = {key: np.concatenate([partial['samples'][key] for partial in partials])
+               for key in partials[0]['samples']}
+
+    return {'groups': _merge_groups([partial['groups'] for partial in partials]),
+            'samples': _keep_samples(samples, max_samples)}
+
+
+def reduce_scan_stats(partial, num_ant, num_corr):
+    '''
+    Statistics per scan, antenna and correlation from the merged partial
+    statistics of all chunks for one field and SPW.
+
+    Phases are measured from the circular mean of each group so the wrap
+    at +/-180 deg does not affect the median and MAD.
+    '''
+
+    groups = partial['groups']
+    samples = partial['samples']
+
+    # Every row has flags, so every sample's group is in `groups`.
+    codes = groups['code']
+    num_groups = len(codes)
+
+    sample_idx = np.searchsorted(codes, samples['code'])
+
+    amp_median, amp_mad = grouped_stats(sample_idx, samples['amp'], num_groups)[:2]
+
+    npts = groups['npts'].astype(np.int64)
+    has_values = npts > 0
+
+    amp_min = np.where(has_values, groups['amp_min'], np.nan)
+    amp_max = np.where(has_values, groups['amp_max'], np.nan)
+
+    mean_phase = np.rad2deg(np.angle(groups['phasor_sum']))
+
+    dphase = (samples['phase'] - mean_phase[sample_idx] + 180.) % 360. - 180.
+
+    dphase_median, phase_mad = grouped_stats(sample_idx, dphase, num_groups)[:2]
+
+    return {'scan': codes // (num_ant * num_corr),
+            'ant': (codes // num_corr) % num_ant,
+            'corr': codes % num_corr,
+            'time_min': groups['time_min'],
+            'time_max': groups['time_max'],
+            'npts': npts,
+            'flag_frac': groups['nflag'] / groups['ntotal'],
+            'amp_median': amp_median,
+            'amp_mad': amp_mad,
+            'amp_min': amp_min,
+            'amp_max': amp_max,
+            'phase_median': (mean_phase + dphase_median + 180.) % 360. - 180.,
+            'phase_mad': phase_mad}
+
+
+def scan_stats_columns(reduced, field_id, spw_id, corr_names, ant_names):
+    '''
+    Columns of the scan statistics table, in `SCAN_STATS_COLNAMES` order,
+    for the `reduce_scan_stats` output of one field and SPW.
+    '''
+
+    num_rows = len(reduced['scan'])
+
+    columns = {'field': np.full(num_rows, field_id),
+               'spw': np.full(num_rows, spw_id),
+               'antname': np.asarray(ant_names)[reduced['ant']]}
+    columns.update(reduced)
+
+    columns['corr'] = np.array(corr_names)[reduced['corr']]
+
+    return {colname: columns[colname] for colname in SCAN_STATS_COLNAMES}
@@ -0,0 +1,400 @@
+
+'''
+Track-level metadata cache for an MS.
+
+The field names, intents, SPW frequencies, sideband grouping, scans and
+row counts used by the export and imaging stages are found in one chunked
+pass over the main table and saved as JSON next to the MS (see
+`metadata_cache_name`). Later calls read the JSON instead of opening the
+MS again. The cache is remade when the MS changes (see
+`manifest.ms_stamp`).
+
+The flags of each field and data description are summarized by a digest
+(`compute_flag_digests`), cached the same way, so later stages can tell
+which fields had their flags changed. The digests are made in the same
+pass as the metadata, from a few per-row reductions of the flags, and
+`get_flag_digests` saves both caches.
+'''
+
+import hashlib
+import json
+import os
+import numpy as np
+
+from quicklook_sma.export_casa_tables.ms_export import CasaTableBackend
+from quicklook_sma.export_casa_tables.manifest import ms_stamp
+
+
+METADATA_CACHE_SUFFIX = '.quicklook_metadata.json'
+FLAG_DIGEST_SUFFIX = '.quicklook_flags.json'
+
+# SPWs further apart than this in mean frequency are in different sidebands.
+# Each chunk is ~2 GHz wide.
+SIDEBAND_GAP_GHZ = 2.2
+
+_METADATA_COLUMNS = ['SCAN_NUMBER', 'FIELD_ID', 'DATA_DESC_ID', 'STATE_ID', 'TIME']
+
+
+def metadata_cache_name(vis, suffix=METADATA_CACHE_SUFFIX):
+    '''
+    Cache file for `vis`. It sits next to the MS rather than inside it so
+    writing it does not change the MS modification stamp.
+    '''
+
+    return f"{os.path.abspath(vis).rstrip(os.sep)}{suffix}"
+
+
+def _current_stamp(vis):
+    if os.path.exists(vis):
+        return ms_stamp(vis)
+
+    return {'vis': os.path.abspath(vis), 'modified_ns': None}
+
+
+def _read_cache(cache_file, stamp):
+    '''
+    Contents of `cache_file` if it was made for the MS with `stamp`.
+    Otherwise None.
+    '''
+
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+    except ValueError:
+        return None
+
+    if cached.get('vis') == stamp['vis'] and \
+            cached.get('ms_modified_ns') == stamp['modified_ns']:
+        return cached
+
+    return None
+
+
+def _write_cache(cache_file, cached, stamp):
+    '''
+    Save `cached` with the MS `stamp`. A cache that cannot be written
+    (e.g., a read-only data folder) is skipped.
+    '''
+
+    cached['vis'] = stamp['vis']
+    cached['ms_modified_ns'] = stamp['modified_ns']
+
+    tmp_file = f"{cache_file}.tmp"
+
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(cached, f)
+        os.replace(tmp_file, cache_file)
+
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def group_sidebands(spw_nums, meanfreqs_ghz, max_diff_ghz=SIDEBAND_GAP_GHZ):
+    '''
+    Group the SPWs into sidebands, returned as "min~max" SPW ranges, by
+    gaps in the mean frequency larger than `max_diff_ghz`.
+    '''
+
+    continuum_sidebands = []
+    min_spw = spw_nums[0]
+    for ii, this_diff_freq in enumerate(np.abs(np.diff(meanfreqs_ghz))):
+        if this_diff_freq >= max_diff_ghz:
+            max_spw = spw_nums[ii]
+            continuum_sidebands.append(f"{min_spw}~{max_spw}")
+            min_spw = spw_nums[ii+1]
+
+    # Append the last range:
+    continuum_sidebands.append(f"{min_spw}~{spw_nums[-1]}")
+
+    return continuum_sidebands
+
+
+def _read_intents(backend):
+    '''
+    Intents (OBS_MODE) of each STATE_ID. Empty when the MS has no STATE
+    rows.
+    '''
+
+    try:
+        obs_modes = backend.read_subtable('STATE', ['OBS_MODE'])['OBS_MODE']
+    except (KeyError, RuntimeError):
+        return []
+
+    return [[intent for intent in str(mode).split(",") if intent != ""]
+            for mode in obs_modes]
+
+
+def flag_row_summary(flags):
+    '''
+    Per-row reductions of a (corr, chan, row) FLAG block: the number of
+    flagged channels and the first and last flagged channel of each
+    correlation. Returns a (row, 3 * corr) int32 array.
+
+    These change whenever flags are added or removed, or moved at the
+    edges of a row, but not when flags are only moved within a row.
+    '''
+
+    num_chan = flags.shape[1]
+
+    counts = np.count_nonzero(flags, axis=1)
+    first = np.argmax(flags, axis=1)
+    last = num_chan - 1 - np.argmax(flags[:, ::-1], axis=1)
+
+    return np.concatenate([counts, first, last], axis=0).T.astype(np.int32)
+
+
+def compute_ms_metadata(backend, chunk_rows=5000000, flag_digests=False):
+    '''
+    Metadata of the MS from its subtables and one chunked pass over the
+    scan, field, data description, state and time columns.
+
+    With `flag_digests`, the FLAG column is read in the same pass and the
+    `compute_flag_digests` output is added as 'flag_digests'. Lower
+    `chunk_rows` in that case as the FLAG column has every channel.
+
+    Returns
+    -------
+    metadata : dict
+        'fields': 'names' with the 'nrows', 'time_min', 'time_max',
+        'intents' and 'spws' of each FIELD_ID. The times are None for
+        fields without rows.
+        'spws': 'ids' with the 'mean_freq_ghz' and 'num_chan' of each SPW,
+        and 'ddid_spw', the SPW of each DATA_DESC_ID.
+        'scans': 'numbers' with the 'nrows', 'time_min', 'time_max',
+        'fields' and 'spws' of each scan.
+        'sidebands': "min~max" SPW ranges of the sidebands of the first
+        scan (see `group_sidebands`).
+    '''
+
+    names = [str(name) for name in backend.read_subtable('FIELD', ['NAME'])['NAME']]
+    chan_freqs = [np.ravel(freqs) for freqs in
+                  backend.read_subtable('SPECTRAL_WINDOW', ['CHAN_FREQ'])['CHAN_FREQ']]
+    ddid_spw = [int(val) for val in
+                backend.read_subtable('DATA_DESCRIPTION', ['SPECTRAL_WINDOW_ID'])['SPECTRAL_WINDOW_ID']]
+    state_intents = _read_intents(backend)
+
+    # Rows and time range of each (scan, field, ddid, state) combination.
+    groups = {}
+
+    hashes = {}
+
+    colnames = _METADATA_COLUMNS + ['FLAG'] if flag_digests else _METADATA_COLUMNS
+
+    for chunk in backend.iter_rows(colnames, chunk_rows):
+
+        if flag_digests:
+            _update_flag_hashes(hashes, chunk)
+
+        keys = np.stack([chunk[colname] for colname in _METADATA_COLUMNS[:-1]], axis=1)
+
+        uniq, inv = np.unique(keys, axis=0, return_inverse=True)
+        inv = inv.ravel()
+
+        nrows = np.bincount(inv, minlength=len(uniq))
+        time_min = np.full(len(uniq), np.inf)
+        time_max = np.full(len(uniq), -np.inf)
+        np.minimum.at(time_min, inv, chunk['TIME'])
+        np.maximum.at(time_max, inv, chunk['TIME'])
+
+        for key, this_nrows, this_min, this_max in zip(map(tuple, uniq.tolist()), nrows,
+                                                       time_min, time_max):
+            if key in groups:
+                group = groups[key]
+                groups[key] = [group[0] + int(this_nrows), min(group[1], float(this_min)),
+                               max(group[2], float(this_max))]
+            else:
+                groups[key] = [int(this_nrows), float(this_min), float(this_max)]
+
+    def summarize(index, values):
+        '''
+        Rows, time range, fields, SPWs and states of the groups for each
+        value of the key at `index`.
+        '''
+
+        out = {value: {'nrows': 0, 'time_min': None, 'time_max': None,
+                       'fields': set(), 'spws': set(), 'states': set()}
+               for value in values}
+
+        for key, (nrows, time_min, time_max) in groups.items():
+            entry = out[key[index]]
+
+            entry['nrows'] += nrows
+            entry['time_min'] = time_min if entry['time_min'] is None else min(entry['time_min'], time_min)
+            entry['time_max'] = time_max if entry['time_max'] is None else max(entry['time_max'], time_max)
+            entry['fields'].add(key[1])
+            entry['spws'].add(ddid_spw[key[2]])
+            entry['states'].add(key[3])
+
+        return out
+
+    field_summary = summarize(1, range(len(names)))
+    scan_summary = summarize(0, sorted(set(key[0] for key in groups)))
+
+    def intents_for(states):
+        return sorted(set(intent for state in states if 0 <= state < len(state_intents)
+                          for intent in state_intents[state]))
+
+    fields = {'names': names,
+              'nrows': [field_summary[ii]['nrows'] for ii in range(len(names))],
+              'time_min': [field_summary[ii]['time_min'] for ii in range(len(names))],
+              'time_max': [field_summary[ii]['time_max'] for ii in range(len(names))],
+              'intents': [intents_for(field_summary[ii]['states']) for ii in range(len(names))],
+              'spws': [sorted(field_summary[ii]['spws']) for ii in range(len(names))]}
+
+    spws = {'ids': list(range(len(chan_freqs))),
+            'mean_freq_ghz': [float(np.mean(freqs)) / 1e9 for freqs in chan_freqs],
+            'num_chan': [len(freqs) for freqs in chan_freqs],
+            'ddid_spw': ddid_spw}
+
+    scans = {'numbers': list(scan_summary),
+             'nrows': [entry['nrows'] for entry in scan_summary.values()],
+             'time_min': [entry['time_min'] for entry in scan_summary.values()],
+             'time_max': [entry['time_max'] for entry in scan_summary.values()],
+             'fields': [sorted(entry['fields']) for entry in scan_summary.values()],
+             'spws': [sorted(entry['spws']) for entry in scan_summary.values()]}
+
+    # The sidebands are set from the first scan, as the SPW setup is not
+    # expected to change.
+    sidebands = []
+
+    if len(scans['numbers']) > 0:
+        spw_nums = scans['spws'][0]
+        sidebands = group_sidebands(spw_nums, [spws['mean_freq_ghz'][spw] for spw in spw_nums])
+
+    metadata = {'fields': fields,
+                'spws': spws,
+                'scans': scans,
+                'sidebands': sidebands}
+
+    if flag_digests:
+        metadata['flag_digests'] = {key: this_hash.hexdigest()
+                                    for key, this_hash in hashes.items()}
+
+    return metadata
+
+
+def get_ms_metadata(vis, cache_file=None, backend=None, chunk_rows=5000000):
+    '''
+    Return the `compute_ms_metadata` output for the MS `vis`.
+
+    The metadata are read from `cache_file` (by default
+    `metadata_cache_name(vis)`) if it was made for the same MS since its
+    last change. Otherwise they are computed and saved there.
+    '''
+
+    if cache_file is None:
+        cache_file = metadata_cache_name(vis)
+
+    stamp = _current_stamp(vis)
+
+    metadata = _read_cache(cache_file, stamp)
+
+    if metadata is not None:
+        return metadata
+
+    if backend is None:
+        backend = CasaTableBackend(vis)
+
+    metadata = compute_ms_metadata(backend, chunk_rows=chunk_rows)
+
+    _write_cache(cache_file, metadata, stamp)
+
+    return metadata
+
+
+def _update_flag_hashes(hashes, chunk):
+    '''
+    Add the `flag_row_summary` of each row of the chunk to the hash of its
+    field and data description, in row order.
+    '''
+
+    summary = flag_row_summary(chunk['FLAG'])
+
+    keys = np.stack([chunk['FIELD_ID'], chunk['DATA_DESC_ID']], axis=1)
+
+    uniq, inv = np.unique(keys, axis=0, return_inverse=True)
+    inv = inv.ravel()
+
+    for ii, (field_id, ddid) in enumerate(uniq.tolist()):
+
+        key = f"{field_id}:{ddid}"
+
+        if key not in hashes:
+            hashes[key] = hashlib.blake2b(digest_size=16)
+
+        hashes[key].update(summary[inv == ii].tobytes())
+
+
+def compute_flag_digests(backend, chunk_rows=10000):
+    '''
+    Digest of the flags of each field and data description.
+
+    Each chunk of the FLAG column is reduced to a few values per row
+    (`flag_row_summary`) as it is read, and those are hashed in row order,
+    so the digests do not depend on `chunk_rows`. This is the same pass as
+    `compute_ms_metadata` with `flag_digests=True`.
+
+    Returns
+    -------
+    digests : dict
+        {"field_id:ddid": hex digest}.
+    '''
+
+    return compute_ms_metadata(backend, chunk_rows=chunk_rows,
+                               flag_digests=True)['flag_digests']
+
+
+def get_flag_digests(vis, cache_file=None, backend=None, chunk_rows=10000):
+    '''
+    Return the `compute_flag_digests` output for the MS `vis`, cached in
+    `cache_file` (by default next to the MS) until the MS changes.
+
+    The digests are computed in the same pass as the metadata, so the
+    `get_ms_metadata` cache is also saved when it is out of date.
+    '''
+
+    if cache_file is None:
+        cache_file = metadata_cache_name(vis, suffix=FLAG_DIGEST_SUFFIX)
+
+    stamp = _current_stamp(vis)
+
+    cached = _read_cache(cache_file, stamp)
+
+    if cached is not None:
+        return cached['digests']
+
+    if backend is None:
+        backend = CasaTableBackend(vis)
+
+    metadata = compute_ms_metadata(backend, chunk_rows=chunk_rows, flag_digests=True)
+    digests = metadata.pop('flag_digests')
+
+    _write_cache(cache_file, {'digests': digests}, stamp)
+
+    metadata_file = metadata_cache_name(vis)
+    if _read_cache(metadata_file, stamp) is None:
+        _write_cache(metadata_file, metadata, stamp)
+
+    return digests
+
+
+def combined_flag_digest(flag_digests, metadata, field, spw_ids=None):
+    '''
+    One digest of the flags of `field` in all its data descriptions, or
+    only those of the SPWs in `spw_ids`.
+    '''
+
+    field_id = metadata['fields']['names'].index(field)
+
+    ddid_spw = metadata['spws']['ddid_spw']
+
+    parts = [f"{ddid}={flag_digests.get(f'{field_id}:{ddid}')}"
+             for ddid in range(len(ddid_spw))
+             if spw_ids is None or ddid_spw[ddid] in spw_ids]
+
+    return hashlib.blake2b(",".join(parts).encode(), digest_size=16).hexdigest()
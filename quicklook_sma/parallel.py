@@ -0,0 +1,158 @@
+
+'''
+Shared worker pool helpers for running independent jobs concurrently.
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def get_num_workers(workers):
+    '''
+    Number of workers to use. `None` uses all available CPUs.
+    '''
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    return max(int(workers), 1)
+
+
+def get_executor(workers, kind='process', **kwargs):
+    '''
+    Return a `concurrent.futures` executor.
+
+    Parameters
+    ----------
+    workers : int or None
+        Number of workers. `None` uses all available CPUs.
+    kind : str, optional
+        'process' for CPU-bound jobs or 'thread' for jobs mostly waiting on I/O
+        or external programs.
+    kwargs : dict
+        Passed to the executor (e.g. `initializer`).
+    '''
+
+    workers = get_num_workers(workers)
+
+    if kind == 'process':
+        return ProcessPoolExecutor(max_workers=workers, **kwargs)
+    elif kind == 'thread':
+        return ThreadPoolExecutor(max_workers=workers, **kwargs)
+    else:
+        raise ValueError(f"kind must be 'process' or 'thread'. Received {kind}")
+
+
+def parallel_map(func, iterable, workers=1, kind='process'):
+    '''
+    Apply `func` to every item in `iterable` and return the results in the
+    same order as the inputs.
+
+    With `workers=1` (or a single item) everything runs serially in the
+    current process. Otherwise `func` must be picklable (i.e., defined at
+    module level) when `kind='process'`.
+    '''
+
+    items = list(iterable)
+
+    workers = get_num_workers(workers)
+
+    if workers == 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with get_executor(min(workers, len(items)), kind=kind) as executor:
+        return list(executor.map(func, items))
+
+
+def get_memory_gb():
+    '''
+    Physical memory of the machine in GB, or `None` when it cannot be found.
+    '''
+
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024**3
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def iter_budgeted(func, items, costs, workers=1, budget=None, kind='process',
+                  on_start=None, **kwargs):
+    '''
+    Apply `func` to every item, running at most `workers` items at once and
+    only as many as fit together in `budget`.
+
+    Items are started in order. When the next item does not fit, later items
+    that do fit are started first. An item costing more than the whole
+    budget is run on its own.
+
+    Parameters
+    ----------
+    func : callable
+        Must be picklable (i.e., defined at module level) when
+        `kind='process'` and `workers > 1`.
+    items : list
+        Inputs to `func`.
+    costs : list
+        Cost of each item (e.g., memory in GB), in the units of `budget`.
+    workers : int or None, optional
+        Maximum number of items running at once. `None` uses all CPUs.
+    budget : float, optional
+        Maximum summed cost of the running items. No limit by default.
+    on_start : callable, optional
+        Called with the index of each item when it is started.
+    kwargs : dict
+        Passed to `get_executor`.
+
+    Yields
+    ------
+    index : int
+        Index of the finished item in `items`.
+    result : object
+        Output of `func`.
+    '''
+
+    from concurrent.futures import wait, FIRST_COMPLETED
+
+    items = list(items)
+    costs = list(costs)
+
+    workers = get_num_workers(workers)
+
+    if workers == 1 or len(items) <= 1:
+        for ii, item in enumerate(items):
+            if on_start is not None:
+                on_start(ii)
+            yield ii, func(item)
+
+        return
+
+    pending = list(range(len(items)))
+    running = {}
+
+    def fits(ii):
+        if len(running) == 0 or budget is None:
+            return True
+        return sum(costs[jj] for jj in running.values()) + costs[ii] <= budget
+
+    with get_executor(min(workers, len(items)), kind=kind, **kwargs) as executor:
+
+        while len(pending) > 0 or len(running) > 0:
+
+            for ii in list(pending):
+                if len(running) >= workers:
+                    break
+
+                if not fits(ii):
+                    continue
+
+                pending.remove(ii)
+
+                if on_start is not None:
+                    on_start(ii)
+
+                running[executor.submit(func, items[ii])] = ii
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                yield running.pop(future), future.result()
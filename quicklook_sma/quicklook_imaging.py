@@ -1,11 +1,20 @@
 
 import os
+import json
+import hashlib
+import shutil
+import time
 import datetime
 import numpy as np
 
 
 from quicklook_sma.utilities import (read_config, get_targetfield, get_mosaicfields,
                                     get_gainfield, get_bandpassfield)
+from quicklook_sma.parallel import iter_budgeted, get_memory_gb
+from quicklook_sma.export_casa_tables.manifest import ExportManifest, ms_stamp
+from quicklook_sma.dirty_imaging import dirty_image_to_fits, spw_range_ids
+from quicklook_sma.ms_metadata import (get_ms_metadata, get_flag_digests,
+                                       combined_flag_digest)
 
 def cleanup_misc_quicklook(filename, remove_residual=True,
                            remove_psf=True,
@@ -233,6 +242,275 @@ def cleanup_misc_quicklook(filename, remove_residual=True,
 #     casalog.post(f"Quicklook line imaging took {t1 - t0}")
 
 
+# Rough memory use of one image for each engine: a fixed overhead in GB
+# (the CASA process for tclean, the chunks of visibilities for numpy) plus
+# the image planes and padded gridding buffers for each pixel in bytes.
+IMAGING_MEMORY = {'tclean': {'base_gb': 1.0, 'bytes_per_pixel': 150},
+                  'numpy': {'base_gb': 2.0, 'bytes_per_pixel': 120}}
+
+
+def estimate_imaging_memory_gb(imsize, engine='tclean'):
+    '''
+    Approximate memory (GB) needed to make one `imsize` x `imsize` image.
+    '''
+
+    memory = IMAGING_MEMORY[engine]
+
+    return memory['base_gb'] + memory['bytes_per_pixel'] * imsize**2 / 1024**3
+
+
+def get_continuum_sidebands(myvis):
+    '''
+    Group the SPWs into sidebands, returned as "min~max" SPW ranges, with
+    the mean frequency of each SPW in GHz. Read from the MS metadata cache
+    (see `ms_metadata.get_ms_metadata`).
+    '''
+
+    metadata = get_ms_metadata(myvis)
+
+    meanfreqs_ghz = np.array(metadata['spws']['mean_freq_ghz'])
+
+    return metadata['sidebands'], meanfreqs_ghz
+
+
+# Saved in the output folder by `quicklook_continuum_imaging`.
+IMAGING_PLAN_FILENAME = 'imaging_plan.json'
+IMAGING_MANIFEST_FILENAME = 'imaging_manifest.json'
+
+# Part of the fingerprint of every image. Increase when a change to the
+# imaging code should remake the existing images.
+IMAGING_VERSION = 1
+
+# Job settings that change the image.
+_FINGERPRINT_KEYS = ['field', 'spw', 'cell', 'imsize', 'niter', 'nsigma', 'nmajor',
+                     'pblimit', 'export_fits', 'engine']
+
+
+def load_imaging_plan(plan_file, myvis):
+    '''
+    Read the cached imaging settings for `myvis` from `plan_file`.
+
+    The settings of each field are stored with the digest of its flags
+    (see `ms_metadata.combined_flag_digest`) and are checked by
+    `plan_continuum_imaging`. An empty plan is returned when the file is
+    missing or was made for another MS.
+    '''
+
+    vis = os.path.abspath(myvis)
+
+    if plan_file is not None and os.path.exists(plan_file):
+        try:
+            with open(plan_file, 'r') as f:
+                cached = json.load(f)
+        except ValueError:
+            cached = {}
+
+        if cached.get('vis') == vis:
+            return cached
+
+    return {'vis': vis,
+            'sidebands': None,
+            'meanfreqs_ghz': None,
+            'fields': {}}
+
+
+def save_imaging_plan(plan_file, cached):
+    '''
+    Write the imaging settings to `plan_file`, replacing it only once the
+    new file is complete.
+    '''
+
+    tmp_file = f"{plan_file}.tmp"
+
+    with open(tmp_file, 'w') as f:
+        json.dump(cached, f, indent=1)
+
+    os.replace(tmp_file, plan_file)
+
+
+def _advise_field(myvis, target_field, continuum_sidebands, meanfreqs_ghz):
+    '''
+    Cell size from `imager.advise` and the approximate image size for each
+    sideband of one field. The image size is None for fully flagged
+    sidebands.
+    '''
+
+    from casatools import imager
+    from casatools import synthesisutils
+
+    synthutil = synthesisutils()
+
+    settings = {}
+
+    for thisspw in continuum_sidebands:
+
+        # Ask for cellsize
+        this_im = imager()
+        this_im.selectvis(vis=myvis, field=target_field, spw=str(thisspw))
+
+        image_settings = this_im.advise()
+        this_im.close()
+
+        # NOTE: The advise output seems to be consistently too large for the actual
+        # SMA synthesized beam. We'll divide by 2 here as a lazy patch.
+        # This was first tested  on an EXT track. SUB/COM may be fine.
+        settings[thisspw] = {'cell': [image_settings[2]['value'] * 0.5,
+                                      image_settings[2]['unit']],
+                             'imsize': None}
+
+        # No point in estimating image size for an empty SPW.
+        # When all data is flagged, uvmax = 0 so cellsize = 0.
+        if image_settings[2]['value'] == 0.:
+            continue
+
+        # For the image size, we will do an approx scaling was
+        mean_spw = int(0.5 * (int(thisspw.split("~")[-1]) + int(thisspw.split("~")[0])))
+        mean_freq = meanfreqs_ghz[mean_spw]
+
+        lambda_m = (3e8 / (mean_freq * 1e9))
+        dish_diameter_m = 6.
+        rad_to_arcsec = 206265.
+
+        approx_pbsize = 1.2 * (lambda_m / dish_diameter_m) * rad_to_arcsec
+        # Add padding. This seems to be moderately underestimated.
+        approx_pbsize *= 4.
+        approx_imsize = synthutil.getOptimumSize(int(approx_pbsize / image_settings[2]['value']))
+
+        settings[thisspw]['imsize'] = int(approx_imsize)
+
+    return settings
+
+
+def plan_continuum_imaging(myvis, target_fields, imsize_max=800, plan_file=None):
+    '''
+    Cell and image size for each field and sideband.
+
+    The `imager.advise` settings of each field are cached in `plan_file`
+    and reused while the flags of the field are unchanged, so the target
+    and calibrator passes and reruns do not repeat them. After re-flagging
+    one field, only that field is advised again.
+
+    Parameters
+    ----------
+    myvis : str
+        MS name.
+    target_fields : str
+        Comma-separated field names.
+    imsize_max : int, optional
+        Largest image size.
+    plan_file : str, optional
+        JSON file with the cached settings. Created or updated when
+        fields are missing from it. No caching by default.
+
+    Returns
+    -------
+    plan : list
+        One dict per field and sideband with the 'field', 'spw' range,
+        'cell' size (a string, or None when all the data are flagged) and
+        'imsize'. Fully flagged fields are not included.
+    '''
+
+    from casatools import logsink
+
+    casalog = logsink()
+
+    cached = load_imaging_plan(plan_file, myvis)
+
+    updated = False
+
+    if cached['sidebands'] is None:
+        continuum_sidebands, meanfreqs_ghz = get_continuum_sidebands(myvis)
+
+        cached['sidebands'] = [str(val) for val in continuum_sidebands]
+        cached['meanfreqs_ghz'] = [float(val) for val in meanfreqs_ghz]
+
+        updated = True
+
+    continuum_sidebands = cached['sidebands']
+
+    # The flag digests also save the metadata cache, so the MS is only
+    # read once.
+    flag_digests = get_flag_digests(myvis)
+    metadata = get_ms_metadata(myvis)
+
+    plan = []
+
+    for target_field in target_fields.split(","):
+
+        flag_digest = combined_flag_digest(flag_digests, metadata, target_field)
+
+        entry = cached['fields'].get(target_field)
+
+        if entry is None or entry.get('flag_digest') != flag_digest:
+            casalog.post(f"Finding the imaging settings for {target_field}")
+
+            cached['fields'][target_field] = {'flag_digest': flag_digest,
+                                              'settings': _advise_field(myvis, target_field,
+                                                                        continuum_sidebands,
+                                                                        cached['meanfreqs_ghz'])}
+            updated = True
+
+        settings = cached['fields'][target_field]['settings']
+
+        imsizes = [settings[thisspw]['imsize'] for thisspw in continuum_sidebands
+                   if settings[thisspw]['imsize'] is not None]
+
+        if len(imsizes) == 0:
+            casalog.post(f"{target_field} is fully flagged. Skipping.")
+            continue
+
+        this_imsize = int(min(imsize_max, max(imsizes)))
+
+        for thisspw in continuum_sidebands:
+
+            cell_value, cell_unit = settings[thisspw]['cell']
+
+            if cell_value == 0:
+                this_cellsize = None
+            else:
+                this_cellsize = f"{round(cell_value * 0.8, 1)}{cell_unit}"
+
+            plan.append({'field': target_field,
+                         'spw': thisspw,
+                         'cell': this_cellsize,
+                         'imsize': this_imsize})
+
+    if updated and plan_file is not None:
+        save_imaging_plan(plan_file, cached)
+
+    return plan
+
+
+def imaging_fingerprint(job, flag_digests, metadata, ms_identity=None):
+    '''
+    Digest of the inputs of one imaging job: the MS and its modification
+    stamp (`manifest.ms_stamp`), the flags of the field in the SPW range,
+    the job settings that change the image and `IMAGING_VERSION`.
+
+    The visibilities themselves are not hashed. Any write to the MS data
+    files (e.g., applycal filling CORRECTED_DATA) changes the stamp, and
+    so the fingerprint, even when the flags are unchanged.
+
+    Parameters
+    ----------
+    ms_identity : dict, optional
+        Output of `ms_stamp` for `job['vis']`. Read when not given.
+    '''
+
+    if ms_identity is None:
+        ms_identity = ms_stamp(job['vis'])
+
+    inputs = {key: job[key] for key in _FINGERPRINT_KEYS}
+    inputs['vis'] = ms_identity['vis']
+    inputs['ms_modified_ns'] = ms_identity['modified_ns']
+    inputs['flags'] = combined_flag_digest(flag_digests, metadata, job['field'],
+                                           spw_ids=spw_range_ids(job['spw']))
+    inputs['imaging_version'] = IMAGING_VERSION
+
+    return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(),
+                           digest_size=16).hexdigest()
+
+
 def quicklook_continuum_imaging(config_filename,
                                 nmajor=1,
                                 niter=0, nsigma=5.,
@@ -240,21 +518,70 @@ def quicklook_continuum_imaging(config_filename,
                                 overwrite_imaging=False,
                                 export_fits=True,
                                 image_type='target',
-                                output_folder="quicklook_imaging"):
+                                output_folder="quicklook_imaging",
+                                n_workers=1,
+                                memory_budget_gb=None,
+                                plan_file=None,
+                                plan_only=False,
+                                engine='tclean'):
     '''
     Per-SPW MFS, nterm=1, dirty images of the targets
+
+    Each field and sideband is a separate tclean job. Jobs run in a pool
+    of processes bounded by `n_workers` and `memory_budget_gb`. The images
+    are made under a temporary name and moved into place when complete, so
+    an interrupted run never leaves a partial image under the final name.
+
+    Each finished image is recorded in `IMAGING_MANIFEST_FILENAME` in
+    `output_folder` with the fingerprint of its inputs (see
+    `imaging_fingerprint`). Images are only remade when the fingerprint
+    changes (e.g., the field was re-flagged, a calibration was applied or
+    the settings changed) or the image is missing from the manifest.
+
+    Parameters
+    ----------
+    overwrite_imaging : bool, optional
+        Remake all the images, including those with a current fingerprint.
+    n_workers : int or None, optional
+        Number of tclean jobs run at the same time, each using one CPU.
+        `None` uses all CPUs.
+    memory_budget_gb : float, optional
+        Limit on the summed memory estimate (`estimate_imaging_memory_gb`)
+        of the running jobs. Defaults to 75% of the physical memory.
+    plan_file : str, optional
+        JSON file caching the cell and image size settings (see
+        `plan_continuum_imaging`). Defaults to `IMAGING_PLAN_FILENAME` in
+        `output_folder`. Pass the same file to the target and calibrator
+        passes to share it.
+    plan_only : bool, optional
+        Only make the plan and log the jobs that would be run, without
+        imaging.
+    engine : str, optional
+        'tclean', or 'numpy' to grid and FFT the data with
+        `dirty_imaging.dirty_image_to_fits`. 'numpy' only makes dirty
+        images (`niter` is ignored) and writes FITS directly, so
+        `export_fits` must be enabled.
+
+    Returns
+    -------
+    jobs : list
+        Settings of each tclean job, when `plan_only` is enabled.
     '''
 
-    from casatasks import tclean, rmtables, exportfits
+    if engine not in IMAGING_MEMORY:
+        raise ValueError(f"engine must be 'tclean' or 'numpy'. Received {engine}")
 
-    from casatools import ms
-    from casatools import imager
-    from casatools import synthesisutils
+    if engine == 'numpy' and not export_fits:
+        raise ValueError("engine='numpy' only writes FITS images. Set export_fits=True.")
 
     from casatools import logsink
 
     casalog = logsink()
 
+    if engine == 'numpy' and niter > 0:
+        casalog.post(f"engine='numpy' makes dirty images only. Ignoring niter={niter}.",
+                     'WARN')
+
     this_config = read_config(config_filename)
 
     if not os.path.exists(output_folder):
@@ -262,37 +589,8 @@ def quicklook_continuum_imaging(config_filename,
 
     myvis = this_config['myvis']
 
-    # Select our target fields. We will loop through
-    # to avoid the time + memory needed for mosaics.
-
-    synthutil = synthesisutils()
-
-    myms = ms()
-    myms.open(myvis)
-    mymsmd = myms.metadata()
-
-    # Get total SPWs and map to sidebands:
-    # Don't expect changes in the number of SPWs.
-    spw_nums = mymsmd.spwsforscan(1)
-
-    meanfreqs_ghz = np.array([mymsmd.meanfreq(val) for val in spw_nums]) / 1e9
-
-    mymsmd.close()
-    myms.close()
-
-    # Classify sidebands by gaps larger than 2 and a bit GHz
-    # as each chunk is ~2 GHz.
-    continuum_sidebands = []
-    max_diff_ghz = 2.2
-    min_spw = spw_nums[0]
-    for ii, this_diff_freq in enumerate(np.abs(np.diff(meanfreqs_ghz))):
-        if this_diff_freq >= max_diff_ghz:
-            max_spw = spw_nums[ii]
-            continuum_sidebands.append(f"{min_spw}~{max_spw}")
-            min_spw = spw_nums[ii+1]
-
-    # Append the last range:
-    continuum_sidebands.append(f"{min_spw}~{spw_nums[-1]}")
+    if plan_file is None:
+        plan_file = os.path.join(output_folder, IMAGING_PLAN_FILENAME)
 
     if image_type == 'target':
         if this_config['is_mosaic']:
@@ -311,122 +609,230 @@ def quicklook_continuum_imaging(config_filename,
     casalog.post(f"Imaging the following fields: {target_fields}.")
     print(f"Imaging the following fields: {target_fields}.")
 
-    # Loop through targets and line SPWs
-    for target_field in target_fields.split(","):
-
-        casalog.post(f"Quick look imaging of field {target_field}")
-
-        cell_size = {}
-        imsizes = []
-
-        for thisspw in continuum_sidebands:
+    # Select our target fields. Each field and sideband is imaged separately
+    # to avoid the time + memory needed for mosaics.
+    plan = plan_continuum_imaging(myvis, target_fields, imsize_max=imsize_max,
+                                  plan_file=plan_file)
 
-            # Ask for cellsize
-            this_im = imager()
-            this_im.selectvis(vis=myvis, field=target_field, spw=str(thisspw))
+    # The flag digests also save the metadata cache, so the MS is only
+    # read once.
+    flag_digests = get_flag_digests(myvis)
+    metadata = get_ms_metadata(myvis)
+    ms_identity = ms_stamp(myvis)
 
-            image_settings = this_im.advise()
-            this_im.close()
+    manifest = ExportManifest(output_folder, filename=IMAGING_MANIFEST_FILENAME)
 
-            # When all data is flagged, uvmax = 0 so cellsize = 0.
-            # Check for that case to avoid tclean failures
-            # if image_settings[2]['value'] == 0.:
-            #     casalog.post(f"All data flagged for {this_imagename}. Skipping")
-            #     continue
+    jobs = []
 
-            # NOTE: The advise output seems to be consistently too large for the actual
-            # SMA synthesized beam. We'll divide by 2 here as a lazy patch.
-            # This was first tested  on an EXT track. SUB/COM may be fine.
-            cell_size[thisspw] = [image_settings[2]['value'] * 0.5,
-                                  image_settings[2]['unit']]
+    for entry in plan:
 
-            # No point in estimating image size for an empty SPW.
-            if image_settings[2]['value'] == 0.:
-                continue
+        target_field_label = entry['field'].replace('-', '_')
 
-            # For the image size, we will do an approx scaling was
-            mean_spw = int(0.5 * (int(thisspw.split("~")[-1]) + int(thisspw.split("~")[0])))
-            mean_freq = meanfreqs_ghz[mean_spw]
+        this_imagename = f"{output_folder}/quicklook-{target_field_label}-spw{entry['spw']}-continuum-{myvis}"
 
-            lambda_m = (3e8 / (mean_freq * 1e9))
-            dish_diameter_m = 6.
-            rad_to_arcsec = 206265.
+        if entry['cell'] is None:
+            casalog.post(f"All data flagged for {this_imagename}. Skipping")
+            continue
 
-            approx_pbsize = 1.2 * (lambda_m / dish_diameter_m) * rad_to_arcsec
-            # Add padding. This seems to be moderately underestimated.
-            approx_pbsize *= 4.
-            approx_imsize = synthutil.getOptimumSize(int(approx_pbsize / image_settings[2]['value']))
-            imsizes.append(approx_imsize)
+        job = {'vis': myvis,
+               'field': entry['field'],
+               'spw': entry['spw'],
+               'cell': entry['cell'],
+               'imsize': entry['imsize'],
+               'imagename': this_imagename,
+               'niter': niter,
+               'nsigma': nsigma,
+               'nmajor': nmajor,
+               'pblimit': 0.5,
+               'export_fits': export_fits,
+               'engine': engine}
+
+        job['fingerprint'] = imaging_fingerprint(job, flag_digests, metadata,
+                                                 ms_identity=ms_identity)
+
+        if export_fits:
+            job['output'] = f"{this_imagename}.image.fits"
+        else:
+            job['output'] = f"{this_imagename}.image"
 
-        if len(imsizes) == 0:
-            casalog.post(f"{target_field} is fully flagged. Skipping.")
+        if not overwrite_imaging and \
+                manifest.is_current(job['output'], {'fingerprint': job['fingerprint']}):
+            casalog.post(f"Found {this_imagename} with unchanged inputs. Skipping imaging.")
             continue
 
-        this_imsize = min(imsize_max, max(imsizes))
+        if os.path.exists(job['output']):
+            casalog.post(f"Remaking {this_imagename}: its inputs changed.")
 
-        for thisspw in continuum_sidebands:
+        jobs.append(job)
 
-            casalog.post(f"Quick look imaging of field {target_field} SPW {thisspw}")
+    if plan_only:
+        casalog.post(f"Imaging plan saved to {plan_file}. {len(jobs)} images to make:")
+        print(f"Imaging plan saved to {plan_file}. {len(jobs)} images to make:")
 
-            target_field_label = target_field.replace('-', '_')
+        for job in jobs:
+            message = (f"  {job['field']} SPW {job['spw']}: cell {job['cell']},"
+                       f" imsize {job['imsize']},"
+                       f" ~{estimate_imaging_memory_gb(job['imsize'], engine):.1f} GB")
+            casalog.post(message)
+            print(message)
 
-            this_imagename = f"{output_folder}/quicklook-{target_field_label}-spw{thisspw}-continuum-{myvis}"
+        return jobs
 
-            if export_fits:
-                check_exists = os.path.exists(f"{this_imagename}.image.fits")
-            else:
-                check_exists = os.path.exists(f"{this_imagename}.image")
-
-            if check_exists:
-                if overwrite_imaging:
-                    rmtables(f"{this_imagename}*")
-                    os.remove(f"{this_imagename}.image.fits")
-                else:
-                    casalog.post(f"Found {this_imagename}. Skipping imaging.")
-                    continue
-
-            if cell_size[thisspw][0] == 0:
-                casalog.post(f"All data flagged for {this_imagename}. Skipping")
-                continue
-
-            this_cellsize = f"{round(cell_size[thisspw][0] * 0.8, 1)}{cell_size[thisspw][1]}"
-
-            this_pblim = 0.5
-
-            this_nsigma = nsigma
-            this_niter = niter
-            this_nmajor = nmajor
-
-            # Clean up any possible imaging remnants first
-            rmtables(f"{this_imagename}*")
-
-            tclean(vis=myvis,
-                   field=target_field,
-                   spw=str(thisspw),
-                   cell=this_cellsize,
-                   imsize=this_imsize,
-                   specmode='mfs',
-                   nterms=1,
-                   weighting='briggs',
-                   robust=0.0,
-                   niter=this_niter,
-                   nsigma=this_nsigma,
-                #    nmajor=this_nmajor,  # TODO: in newer casa versions, set this to avoid long runtimes
-                   fastnoise=True,
-                   imagename=this_imagename,
-                   pblimit=this_pblim)
-
-            if export_fits:
-                exportfits(imagename=f"{this_imagename}.image",
-                           fitsimage=f"{this_imagename}.image.fits",
-                           history=False,
-                           overwrite=True)
-
-            # Clean-up extra imaging products if they are not needed.
-            cleanup_misc_quicklook(this_imagename, remove_psf=True,
-                                   remove_residual=True,
-                                   remove_image=True if export_fits else False)
+    run_imaging_jobs(jobs, n_workers=n_workers, memory_budget_gb=memory_budget_gb,
+                     manifest=manifest)
 
     t1 = datetime.datetime.now()
 
     casalog.post(f"Quicklook continuum imaging took {t1 - t0}")
+
+
+def run_imaging_jobs(jobs, n_workers=1, memory_budget_gb=None, manifest=None):
+    '''
+    Run the tclean jobs from `quicklook_continuum_imaging`, logging the
+    start and end of each one. A failed job is logged and does not stop
+    the others.
+
+    When `manifest` is given, the 'output' of each finished job is
+    recorded there with its 'fingerprint'.
+
+    Returns
+    -------
+    failed : list
+        Image names of the jobs that failed.
+    '''
+
+    from casatools import logsink
+
+    casalog = logsink()
+
+    if memory_budget_gb is None:
+        memory_gb = get_memory_gb()
+        memory_budget_gb = 0.75 * memory_gb if memory_gb is not None else None
+
+    costs = [estimate_imaging_memory_gb(job['imsize'], job.get('engine', 'tclean'))
+             for job in jobs]
+
+    def log_start(ii):
+        message = (f"Quick look imaging of field {jobs[ii]['field']} SPW {jobs[ii]['spw']}"
+                   f" (job {ii + 1} of {len(jobs)}, ~{costs[ii]:.1f} GB)")
+        casalog.post(message, origin='quicklook_continuum_imaging')
+        print(message)
+
+    failed = []
+
+    for ii, (messages, success) in iter_budgeted(_continuum_imaging_job, jobs, costs,
+                                                 workers=n_workers,
+                                                 budget=memory_budget_gb,
+                                                 on_start=log_start):
+
+        for message, priority in messages:
+            casalog.post(message, priority, origin='quicklook_continuum_imaging')
+            print(message)
+
+        if not success:
+            failed.append(jobs[ii]['imagename'])
+
+        elif manifest is not None:
+            manifest.record(jobs[ii]['output'], {'fingerprint': jobs[ii]['fingerprint']})
+
+    if len(failed) > 0:
+        casalog.post(f"Imaging failed for: {failed}", 'WARN',
+                     origin='quicklook_continuum_imaging')
+
+    return failed
+
+
+def _continuum_imaging_job(job):
+    '''
+    Make one image for `run_imaging_jobs`.
+
+    The image is made under a temporary name in the output folder and
+    renamed to `job['imagename']` when finished. Worker processes cannot
+    write to the CASA log of the main process, so the log messages are
+    returned as a list of (message, priority) with whether the job
+    succeeded.
+    '''
+
+    imagename = job['imagename']
+
+    if job.get('engine', 'tclean') == 'numpy':
+        return _numpy_imaging_job(job)
+
+    from casatasks import tclean, rmtables, exportfits
+
+    tmp_imagename = os.path.join(os.path.dirname(imagename),
+                                 f".tmp-{os.path.basename(imagename)}")
+
+    start_time = time.time()
+
+    # Clean up any remnants of an interrupted run first.
+    rmtables(f"{tmp_imagename}*")
+
+    try:
+        tclean(vis=job['vis'],
+               field=job['field'],
+               spw=str(job['spw']),
+               cell=job['cell'],
+               imsize=job['imsize'],
+               specmode='mfs',
+               nterms=1,
+               weighting='briggs',
+               robust=0.0,
+               niter=job['niter'],
+               nsigma=job['nsigma'],
+            #    nmajor=job['nmajor'],  # TODO: in newer casa versions, set this to avoid long runtimes
+               fastnoise=True,
+               imagename=tmp_imagename,
+               pblimit=job['pblimit'])
+
+        if job['export_fits']:
+            exportfits(imagename=f"{tmp_imagename}.image",
+                       fitsimage=f"{tmp_imagename}.image.fits",
+                       history=False,
+                       overwrite=True)
+
+            os.replace(f"{tmp_imagename}.image.fits", f"{imagename}.image.fits")
+
+        # Clean-up extra imaging products if they are not needed.
+        cleanup_misc_quicklook(tmp_imagename, remove_psf=True,
+                               remove_residual=True,
+                               remove_image=True if job['export_fits'] else False)
+
+        if not job['export_fits']:
+            # CASA images are directories. Replace any older image.
+            if os.path.exists(f"{imagename}.image"):
+                shutil.rmtree(f"{imagename}.image")
+
+            os.replace(f"{tmp_imagename}.image", f"{imagename}.image")
+
+    except Exception as exc:
+        rmtables(f"{tmp_imagename}*")
+
+        return [(f"Imaging of field {job['field']} SPW {job['spw']} failed: {exc}",
+                 'SEVERE')], False
+
+    return [(f"Finished imaging of field {job['field']} SPW {job['spw']}"
+             f" in {time.time() - start_time:.1f} s (pid {os.getpid()})", 'INFO')], True
+
+
+def _numpy_imaging_job(job):
+    '''
+    Make one dirty image with `dirty_imaging.dirty_image_to_fits` for
+    `run_imaging_jobs`. The FITS file is written to a temporary name and
+    renamed when complete.
+    '''
+
+    start_time = time.time()
+
+    try:
+        beam = dirty_image_to_fits(job['vis'], job['field'], job['spw'], job['cell'],
+                                   job['imsize'], f"{job['imagename']}.image.fits",
+                                   weighting='briggs', robust=0.0)
+
+    except Exception as exc:
+        return [(f"Imaging of field {job['field']} SPW {job['spw']} failed: {exc}",
+                 'SEVERE')], False
+
+    return [(f"Finished imaging of field {job['field']} SPW {job['spw']}"
+             f" in {time.time() - start_time:.1f} s (pid {os.getpid()}). Beam"
+             f" {beam[0]:.2f}x{beam[1]:.2f} arcsec, PA {beam[2]:.1f} deg", 'INFO')], True
@@ -1,387 +1,1056 @@
 
 import os
-from glob import glob
+import re
+import warnings
+from collections.abc import Mapping
+from functools import partial
+from itertools import islice
 import numpy as np
-from astropy.table import Table
+from astropy.table import Column, Table
+from astropy.io import ascii
+
+from quicklook_sma import table_cache
+from quicklook_sma.table_io import (make_meta_dict, is_npz_table, read_npz_table,
+                                    read_npz_meta, read_txt_columns,
+                                    open_table_text, uncompressed_size,
+                                    columns_from_structured, TABLE_EXTENSIONS,
+                                    _read_header_lines, _read_sample_lines,
+                                    _sample_column_kinds, _make_dtype)
+from quicklook_sma.parallel import parallel_map
+from quicklook_sma.downsample import (DOWNSAMPLE_METHODS, bin_starts, bin_mean,
+                                      minmax_indices, lttb_indices)
+from quicklook_sma.averaging import group_sums, time_bin_ids, circular_mean_deg
 
 osjoin = os.path.join
 
-from qaplotter.utils.read_data import read_casa_txt
+# Per-field table types written by `qa_plot_tools.make_qa_tables`.
+# Target fields will not have the phase tables. Cal fields should have all.
+FIELD_TABLE_TYPES = ["amp_chan", "amp_phase", "amp_time", "amp_uvdist", "phase_chan",
+                     "phase_time", "phase_uvdist", "ampresid_uvwave", "amp_ant1",
+                     "phase_ant1"]
 
+# Per-field table types (see `read_field_data_tables`) with phases on the y axis.
+PHASE_TABLE_TYPES = ["amp_phase", "phase_chan", "phase_time", "phase_uvdist",
+                     "phase_ant1"]
 
-def read_casa_txt(filename):
+# Columns averaged with `method='mean'` in `read_casa_txt_downsampled`, on top
+# of `xcol` and `ycol`. All other columns keep the value of the first row.
+MEAN_COLUMNS = ['time', 'chan', 'freq']
 
-    # Grab the meta-data from the header
-    meta_lines = skim_header_metadata(filename)
+# Extra columns the 'mean' bins are grouped on, so bins do not cross a scan
+# or baseline.
+MEAN_GROUP_COLUMNS = ['scan', 'ant1', 'ant2']
 
-    meta_dict = make_meta_dict(meta_lines)
+# Columns separating the rows of a table into series when re-binning with
+# `rebin_table_channels` and `rebin_table_time`.
+REBIN_GROUP_COLUMNS = ['scan', 'field', 'ant1', 'ant2', 'spw', 'corr', 'obs']
 
-    # After the plot 0 line
-    header_start = len(meta_lines) + 1
-    # One for column names, another for units.
-    data_start = len(meta_lines) + 3
+# Per-field table types re-binned by the `chanavg` and `timebin` options of
+# `read_field_data_tables`.
+CHAN_TABLE_TYPES = ["amp_chan", "phase_chan"]
+TIME_TABLE_TYPES = ["amp_time", "phase_time"]
 
-    tab = Table.read(filename,
-                     format='ascii.commented_header',
-                     header_start=header_start,
-                     data_start=data_start)
+
+def read_casa_txt(filename, engine='numpy', use_cache=True, compact=False,
+                  mmap=False):
+    '''
+    Read a plotms txt export into an astropy Table and a dictionary of the
+    header metadata. Files ending in ".npz" are read as binary tables
+    written by `table_io.write_npz_table`. gzip (".gz") and zstd (".zst")
+    compressed txt files are decompressed while they are read.
+
+    The file is opened once: the metadata block is parsed from the same
+    handle that the data block is then streamed from.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the plotms txt file.
+    engine : str, optional
+        Parser for the data block. 'numpy' tokenizes the whole block in bulk
+        with `numpy.loadtxt` into typed column arrays. 'astropy' uses the
+        `astropy.io.ascii` reader. The 'numpy' engine falls back to 'astropy'
+        when it cannot parse the file.
+    use_cache : bool, optional
+        Load the table from the binary cache in `quicklook_sma.table_cache`
+        when the txt file is unchanged, and store newly parsed tables there.
+    compact : bool, optional
+        Return the table with smaller dtypes. See `compact_table`.
+    mmap : bool, optional
+        Return a Table whose columns are read-only memory maps of the cached
+        binary columns instead of copies in memory. Processes working on the
+        same tables then share one physical copy through the page cache.
+        Requires `use_cache=True`, and has no effect with `compact=True` or
+        npz tables.
+
+    Returns
+    -------
+    tab : `~astropy.table.Table`
+        Table of the data columns.
+    meta_dict : dict
+        Metadata from the header lines.
+    '''
+
+    if engine not in ['numpy', 'astropy']:
+        raise ValueError(f"engine must be 'numpy' or 'astropy'. Received {engine}")
+
+    if mmap and not use_cache:
+        raise ValueError("mmap=True requires use_cache=True.")
+
+    mmap_mode = 'r' if mmap else None
+
+    # Binary tables are read directly and not cached.
+    if is_npz_table(filename):
+        columns, meta_dict = read_npz_table(filename)
+
+        tab = Table(list(columns.values()), names=list(columns.keys()), copy=False)
+
+        if compact:
+            tab = compact_table(tab)
+
+        return tab, meta_dict
+
+    cached = table_cache.load_cached_table(filename, mmap_mode=mmap_mode) if use_cache else None
+
+    if cached is not None:
+        tab, meta_dict = cached
+    else:
+        tab, meta_dict = _parse_casa_txt(filename, engine)
+
+        if use_cache:
+            try:
+                table_cache.save_cached_table(filename, tab, meta_dict)
+            except OSError as exc:
+                warnings.warn(f"Unable to cache {filename}: {exc}")
+
+            # Swap the parsed copy for the shared memory map.
+            if mmap:
+                cached = table_cache.load_cached_table(filename, mmap_mode=mmap_mode)
+                if cached is not None:
+                    tab = cached[0]
+
+    # The cache always holds the full precision table.
+    if compact:
+        tab = compact_table(tab)
 
     return tab, meta_dict
 
 
-def skim_header_metadata(filename):
+def compact_table(tab, float_max=1e6):
     '''
-    Search for "From plot 0"
+    Return a copy of `tab` with smaller dtypes to reduce memory use:
+
+    * float64 columns become float32 when all values are below `float_max` in
+      magnitude. Columns like the MJD time in seconds are kept as float64
+      because float32 cannot resolve them.
+    * Integer columns use the smallest signed integer type that holds them.
+    * String columns become integer codes. The labels are stored in
+      `tab[name].meta['categories']` so that
+      `tab[name].meta['categories'][tab[name]]` gives the strings back.
+      Use `expand_categorical` to convert back.
     '''
-    search_str = "# From plot 0"
 
-    # Should be close to ~10 or below, I think
-    # This just stops reading too far if something
-    # goes wrong.
-    max_line = 50
+    out = Table(meta=tab.meta)
 
-    meta_lines = []
+    for name in tab.colnames:
 
-    with open(filename, 'r') as f:
+        col = np.asarray(tab[name])
 
-        for i, line in enumerate(f):
-            if search_str in line:
-                break
+        if col.dtype.kind == 'f' and col.dtype.itemsize > 4:
 
-            meta_lines.append(line)
+            finite = col[np.isfinite(col)]
 
-            if i > max_line:
-                raise ValueError(f"Could not find header in {filename}")
+            if finite.size == 0 or np.abs(finite).max() < float_max:
+                col = col.astype(np.float32)
 
-    return meta_lines
+            out[name] = col
+
+        elif col.dtype.kind in 'iu':
+
+            out[name] = col.astype(_smallest_int_dtype(col))
+
+        elif col.dtype.kind in 'US':
 
+            categories, codes = np.unique(col, return_inverse=True)
+            codes = codes.ravel()
 
-def make_meta_dict(meta_lines):
+            out[name] = Column(codes.astype(_smallest_int_dtype(codes)),
+                               meta={'categories': categories})
+
+        else:
+            out[name] = col
+
+    return out
+
+
+def _smallest_int_dtype(col):
     '''
-    Convert the meta lines into something nice.
+    Smallest signed integer dtype that holds all values in `col`.
     '''
 
-    data_dict = {}
+    if col.size == 0:
+        return np.int8
 
-    for line in meta_lines:
+    low, high = col.min(), col.max()
 
-        # Skip "# "
-        line = line[2:]
+    for dtype in [np.int8, np.int16, np.int32]:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
 
-        # Some plotms output will have multiple name:value pairs
-        num_names = len(line.split(": ")) // 2
+    return np.int64
 
-        for ii in range(num_names):
 
-            name, value = line.split(": ")[2*ii:2*(ii)+2]
+def expand_categorical(tab):
+    '''
+    Convert categorical code columns from `compact_table` back to strings.
+    '''
+
+    out = tab.copy(copy_data=False)
 
-            name = name.strip(" ")
-            value = value.strip(" ")
-            value = value.strip("\n")
+    for name in out.colnames:
+        categories = out[name].meta.get('categories')
 
-            data_dict[name] = value
+        if categories is not None:
+            out.replace_column(name, Column(np.asarray(categories)[np.asarray(out[name])],
+                                            name=name))
 
-    return data_dict
+    return out
 
 
-def read_field_data_tables(fieldname, inp_path):
+def _parse_casa_txt(filename, engine):
     '''
-    Read in a set of tables for a given `fieldname`. Note that this depends on the function:
-    https://github.com/e-koch/quicklook-sma/blob/main/quicklook_sma/export_casa_tables/qa_plot_tools.py#L15
-    Because of this, the read-in is not generalized and may need to be updated.
+    Parse the plotms txt file. See `read_casa_txt`.
+    '''
+
+    with open_table_text(filename) as f:
+
+        # Grab the meta-data from the header
+        meta_lines = _read_header_lines(f, filename)
+
+        meta_dict = make_meta_dict(meta_lines)
+
+        # After the plot 0 line: one for column names, another for units.
+        colnames = f.readline().lstrip("#").split()
+        f.readline()
+
+        data_pos = f.tell()
+
+        if engine == 'numpy':
+            try:
+                tab = _read_data_numpy(f, colnames)
+                return tab, meta_dict
+            except ValueError as exc:
+                warnings.warn(f"Unable to parse {filename} with the numpy engine."
+                              f" Falling back to astropy. Raised exception: {exc}")
+                f.seek(data_pos)
+
+        tab = ascii.read(f.read(),
+                         format='no_header',
+                         names=colnames,
+                         guess=False)
+
+    return tab, meta_dict
+
 
+def _read_data_numpy(f, colnames, num_sample_rows=1000):
+    '''
+    Parse the data block of a plotms txt file into a Table. See
+    `table_io.read_txt_columns`.
     '''
 
-    table_dict = dict()
-    meta_dict = dict()
+    columns = read_txt_columns(f, colnames, num_sample_rows=num_sample_rows)
 
-    # Table types:
-    tab_types = ["amp_chan", "amp_phase", "amp_time", "amp_uvdist", "phase_chan",
-                 "phase_time", "phase_uvdist", "ampresid_uvwave", "amp_ant1",
-                 "phase_ant1"]
-    # Target fields will not have the phase tables.
-    # Cal fields should have all
+    return Table(list(columns.values()), names=list(columns.keys()), copy=False)
 
-    for tab_type in tab_types:
-        tabname = osjoin(inp_path, f"field_{fieldname}_{tab_type}.txt")
-        if os.path.exists(tabname):
-            out = read_casa_txt(tabname)
 
-            table_dict[tab_type] = out[0]
-            meta_dict[tab_type] = out[1]
+def _table_from_structured(data, col_kinds):
+    '''
+    Split the structured array into the columns of a Table.
+    '''
 
-    return table_dict, meta_dict
+    columns = columns_from_structured(data, col_kinds)
+
+    return Table(list(columns.values()), names=list(columns.keys()), copy=False)
 
 
-def read_bpcal_data_tables(inp_path, table_key='bcal_freq'):
+def read_casa_txt_downsampled(filename, max_points, method='minmax',
+                              chunk_rows=200000,
+                              group_cols=['field', 'spw', 'corr'],
+                              xcol='x', ycol='y',
+                              phase_cols=[],
+                              compact=False):
     '''
-    Read in the BP txt files for amp and phase.
+    Stream a plotms txt file in chunks of `chunk_rows` rows and reduce each
+    chunk so the output has roughly `max_points` rows. Memory use depends on
+    `chunk_rows` and `max_points`, not on the file size. npz tables are read
+    in full and then reduced.
+
+    Rows are reduced separately for each combination of `group_cols` (for
+    example per SPW and correlation). Points are not combined across chunk
+    boundaries.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the plotms txt file.
+    max_points : int
+        Approximate number of rows to return. The reduction factor is set
+        from the file size and the length of the first rows.
+    method : str, optional
+        'mean' averages `xcol`, `ycol` and `MEAN_COLUMNS` in bins of rows,
+        with the bins also split by `MEAN_GROUP_COLUMNS`. The ID columns
+        (e.g., scan and antennas) keep the value of the first row in each
+        bin. 'minmax' keeps the minimum and maximum
+        of `ycol` in each bin so that outliers stay visible. 'lttb' uses the
+        Largest-Triangle-Three-Buckets selection on (`xcol`, `ycol`).
+    chunk_rows : int, optional
+        Number of rows to parse at a time.
+    phase_cols : list, optional
+        Columns holding phases in degrees. These use a circular mean with
+        `method='mean'`.
+    compact : bool, optional
+        Return the table with smaller dtypes. See `compact_table`.
+
+    Returns
+    -------
+    tab : `~astropy.table.Table`
+        Reduced table. `tab.meta['downsample']` gives the method and factor.
+    meta_dict : dict
+        Metadata from the header lines.
     '''
 
-    table_dict = dict()
-    meta_dict = dict()
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"method must be one of {DOWNSAMPLE_METHODS}. Received {method}")
 
-    # Table types:
-    tab_types = ["amp", "phase"]
+    # Binary tables are small enough to reduce in one chunk.
+    if is_npz_table(filename):
+        tab, meta_dict = read_casa_txt(filename)
 
-    for tab_type in tab_types:
-        table_dict[tab_type] = {}
-        meta_dict[tab_type] = {}
+        data = tab.as_array()
 
-    amp_tab_names = glob(f"{inp_path}/*{table_key}_amp*.txt")
-    phase_tab_names = glob(f"{inp_path}/*{table_key}_phase*.txt")
+        factor = max(1, int(np.ceil(len(data) / max_points)))
 
-    if len(amp_tab_names) != len(phase_tab_names):
-        raise ValueError("Number of BP amp tables does not match BP phase tables.: "
-                         f"Num amp tables: {len(amp_tab_names)}. Num phase tables: {len(phase_tab_names)}")
+        if factor > 1:
+            these_group_cols = [col for col in group_cols if col in tab.colnames]
 
-    # Sort by SPW and create a text
+            data, keep = _reduce_chunk(data, factor, method, these_group_cols, xcol, ycol,
+                                       phase_cols=phase_cols)
+            data = data[np.argsort(keep, kind='stable')]
 
-    spw_nums = [int(tab.rstrip(".txt").split("spw")[1]) for tab in amp_tab_names]
+        tab = Table(data)
 
-    for spw in spw_nums:
+        tab.meta['downsample'] = {'method': method, 'factor': factor}
 
-        # There aren't many to loop through.
-        for amp_name in amp_tab_names:
+        if compact:
+            tab = compact_table(tab)
 
-            if f"_spw{spw}.txt" in amp_name:
-                break
+        return tab, meta_dict
 
-        for phase_name in phase_tab_names:
+    with open_table_text(filename) as f:
 
-            if f"_spw{spw}.txt" in phase_name:
+        meta_lines = _read_header_lines(f, filename)
+
+        meta_dict = make_meta_dict(meta_lines)
+
+        colnames = f.readline().lstrip("#").split()
+        f.readline()
+
+        data_pos = f.tell()
+
+        sample_lines = _read_sample_lines(f, 1000)
+
+        col_kinds, str_widths = _sample_column_kinds(sample_lines, colnames)
+
+        # Numeric columns are all parsed as floats so each chunk has the same
+        # dtype. Integer columns are restored at the end.
+        dtype = _make_dtype(colnames, col_kinds, str_widths, allow_int=False)
+
+        # Estimate the number of rows from the size of the data block.
+        data_size = uncompressed_size(filename) - data_pos
+        row_size = np.mean([len(line) for line in sample_lines])
+
+        factor = max(1, int(np.ceil(data_size / row_size / max_points)))
+
+        these_group_cols = [col for col in group_cols if col in colnames]
+
+        f.seek(data_pos)
+
+        reduced = []
+        row_index = []
+        offset = 0
+
+        while True:
+
+            lines = list(islice(f, chunk_rows))
+
+            if len(lines) == 0:
                 break
 
-        amp_out = read_casa_txt(amp_name)
-        phase_out = read_casa_txt(phase_name)
+            chunk = np.loadtxt(lines, dtype=dtype, comments="#", ndmin=1)
 
-        table_dict['amp'][spw] = amp_out[0]
-        table_dict['phase'][spw] = phase_out[0]
+            if factor > 1:
+                chunk, keep = _reduce_chunk(chunk, factor, method,
+                                            these_group_cols, xcol, ycol,
+                                            phase_cols=phase_cols)
+            else:
+                keep = np.arange(len(chunk))
 
-        meta_dict['amp'][spw] = amp_out[1]
-        meta_dict['phase'][spw] = phase_out[1]
+            reduced.append(chunk)
+            row_index.append(keep + offset)
 
-    return table_dict, meta_dict
+            offset += len(lines)
+
+    if len(reduced) == 0:
+        raise ValueError(f"No data rows found in {filename}.")
+
+    data = np.concatenate(reduced)
+
+    # Restore the order of the rows in the file.
+    data = data[np.argsort(np.concatenate(row_index), kind='stable')]
+
+    tab = _table_from_structured(data, col_kinds)
+
+    tab.meta['downsample'] = {'method': method, 'factor': factor}
+
+    if compact:
+        tab = compact_table(tab)
+
+    return tab, meta_dict
 
 
-def read_BPinitialgain_data_tables(inp_path, table_key="bpself.ap.gcal"):
+def _reduce_chunk(chunk, factor, method, group_cols, xcol, ycol, phase_cols=[]):
     '''
-    Read in the BP txt files for amp and phase.
+    Reduce the rows of a parsed chunk by `factor` for each group. Returns the
+    reduced rows and their row index in the chunk.
     '''
 
-    table_dict = dict()
-    meta_dict = dict()
+    if method == 'mean':
+        group_cols = list(group_cols) + [col for col in MEAN_GROUP_COLUMNS
+                                         if col in chunk.dtype.names and col not in group_cols]
 
-    # Table types:
-    tab_types = ["phase"]
+        mean_cols = [col for col in dict.fromkeys([xcol, ycol] + MEAN_COLUMNS)
+                     if col in chunk.dtype.names and chunk.dtype[col].kind == 'f']
 
-    for tab_type in tab_types:
-        table_dict[tab_type] = {}
-        meta_dict[tab_type] = {}
+    # Combine the per-column codes into one group id. This is much faster
+    # than np.unique on the structured columns.
+    group_ids = np.zeros(len(chunk), dtype=np.int64)
 
-    bpinitial_tab_names = glob(f"{inp_path}/*{table_key}_time_phase*.txt")
+    for col in group_cols:
+        uniq, codes = np.unique(chunk[col], return_inverse=True)
+        group_ids = group_ids * len(uniq) + codes.ravel()
 
-    # Sort by SPW and create a text
-    ant_nums = [int(tab.rstrip(".txt").split("ant")[1]) for tab in bpinitial_tab_names]
+    out = []
+    out_index = []
 
-    for ant in ant_nums:
+    # Rows of each group, in file order, from one sort.
+    order = np.argsort(group_ids, kind='stable')
+    bounds = np.flatnonzero(np.diff(group_ids[order])) + 1
 
-        # There aren't many to loop through.
-        for ant_name in bpinitial_tab_names:
+    for rows in np.split(order, bounds):
 
-            if f"_ant{ant}.txt" in ant_name:
-                break
+        if method == 'mean':
+            starts = bin_starts(len(rows), factor)
 
-        phase_out = read_casa_txt(ant_name)
+            this_out = chunk[rows[starts]]
 
-        table_dict['phase'][ant] = phase_out[0]
+            for name in mean_cols:
+                if name in phase_cols:
+                    bin_ids = np.arange(len(rows)) // factor
+                    this_out[name] = circular_mean_deg(chunk[name][rows], bin_ids)[1]
+                else:
+                    this_out[name] = bin_mean(chunk[name][rows], factor)
 
-        meta_dict['phase'][ant] = phase_out[1]
+            out.append(this_out)
+            out_index.append(rows[starts])
 
-    return table_dict, meta_dict
+            continue
 
+        if method == 'minmax':
+            # Two points are kept per bin.
+            keep = rows[minmax_indices(chunk[ycol][rows], 2 * factor)]
+        else:
+            num_out = int(np.ceil(len(rows) / factor))
+            keep = rows[lttb_indices(chunk[xcol][rows], chunk[ycol][rows], num_out)]
 
-def read_phaseshortgaincal_data_tables(inp_path, table_key="intphase_combinespw.gcal"):
+        out.append(chunk[keep])
+        out_index.append(keep)
+
+    return np.concatenate(out), np.concatenate(out_index)
+
+
+def _rebin_table(tab, bin_ids, phase_cols=[], group_cols=REBIN_GROUP_COLUMNS):
     '''
-    Read in the BP txt files for amp and phase.
+    Average the rows of `tab` that share the `group_cols` and `bin_ids`.
     '''
 
-    table_dict = dict()
-    meta_dict = dict()
+    group_cols = [col for col in group_cols if col in tab.colnames]
 
-    # Table types:
-    tab_types = ["phase"]
+    keys = [np.asarray(tab[col]) for col in group_cols] + [np.asarray(bin_ids)]
 
-    for tab_type in tab_types:
-        table_dict[tab_type] = {}
-        meta_dict[tab_type] = {}
+    mean_cols = [col for col in tab.colnames
+                 if col not in group_cols and np.asarray(tab[col]).dtype.kind in 'fiu']
 
-    phaseshort_tab_names = glob(f"{inp_path}/*{table_key}_time_phase*.txt")
+    values = [np.ones(len(tab))]
+    for col in mean_cols:
+        col_vals = np.asarray(tab[col], dtype=float)
 
-    # Sort by SPW and create a text
-    ant_nums = [int(tab.rstrip(".txt").split("ant")[1]) for tab in phaseshort_tab_names]
+        if col in phase_cols:
+            values.append(np.exp(1j * np.deg2rad(col_vals)))
+        else:
+            values.append(col_vals)
 
-    for ant in ant_nums:
+    out_keys, out_values, first = group_sums(keys, values, return_first=True)
 
-        # There aren't many to loop through.
-        for ant_name in phaseshort_tab_names:
+    out = Table()
 
-            if f"_ant{ant}.txt" in ant_name:
-                break
+    counts = out_values[0]
 
-        phase_out = read_casa_txt(ant_name)
+    for col in tab.colnames:
+        if col in group_cols:
+            out[col] = out_keys[group_cols.index(col)]
+        elif col in mean_cols:
+            value = out_values[1 + mean_cols.index(col)]
 
-        table_dict['phase'][ant] = phase_out[0]
+            if col in phase_cols:
+                out[col] = np.rad2deg(np.angle(value))
+            else:
+                out[col] = value / counts
+        else:
+            out[col] = tab[col][first]
 
-        meta_dict['phase'][ant] = phase_out[1]
+    out.meta = dict(tab.meta)
 
-    return table_dict, meta_dict
+    return out
 
 
-def read_ampgaincal_time_data_tables(inp_path, table_key="amp_final.gcal"):
+def rebin_table_channels(tab, chanavg, phase_cols=[], group_cols=REBIN_GROUP_COLUMNS):
     '''
-    Read in the BP txt files for amp and phase.
+    Average a table read by `read_casa_txt` further in channel, in bins of
+    `chanavg` of the exported channels.
+
+    The amplitudes in the table are already averaged, so this is a scalar
+    average. Columns in `phase_cols` (e.g., ['y'] for a phase table) use a
+    circular mean. Numeric columns that are not grouped on are averaged and
+    the other columns keep the value of the first row in each bin.
+
+    Parameters
+    ----------
+    tab : `~astropy.table.Table`
+        Table with a "chan" column.
+    chanavg : int
+        Number of exported channels to average together.
+    phase_cols : list, optional
+        Columns holding phases in degrees.
+    group_cols : list, optional
+        Columns that separate the rows into series.
+
+    Returns
+    -------
+    out : `~astropy.table.Table`
+        The re-binned table, sorted by the group columns and channel bin.
     '''
 
-    table_dict = dict()
-    meta_dict = dict()
+    # The "chan" column holds the centre of each exported channel bin in the
+    # original channels, so bin on the order of the exported channels.
+    chan_bin = np.unique(np.asarray(tab['chan']), return_inverse=True)[1].ravel() // chanavg
 
-    # Table types:
-    tab_types = ["amp"]
+    out = _rebin_table(tab, chan_bin, phase_cols=phase_cols, group_cols=group_cols)
+    out.meta['chanavg'] = chanavg
 
-    for tab_type in tab_types:
-        table_dict[tab_type] = {}
-        meta_dict[tab_type] = {}
+    return out
 
-    ampgaincal_tab_names = glob(f"{inp_path}/*{table_key}_time_amp*.txt")
 
-    # Sort by SPW and create a text
-    ant_nums = [int(tab.rstrip(".txt").split("ant")[1]) for tab in ampgaincal_tab_names]
+def rebin_table_time(tab, interval=None, phase_cols=[], group_cols=REBIN_GROUP_COLUMNS):
+    '''
+    Average a table read by `read_casa_txt` further in time, in bins of
+    `interval` seconds that do not cross a scan. With `interval=None`, each
+    scan is averaged into one row, like plotms with `avgtime='1e8'`.
+
+    Averaging follows `rebin_table_channels`. Rows of different channels
+    are kept apart. The "time" column is averaged.
+
+    Parameters
+    ----------
+    tab : `~astropy.table.Table`
+        Table with "time" and "scan" columns.
+    interval : float, optional
+        Bin width in seconds.
+    phase_cols : list, optional
+        Columns holding phases in degrees.
+    group_cols : list, optional
+        Columns that separate the rows into series.
+
+    Returns
+    -------
+    out : `~astropy.table.Table`
+        The re-binned table, sorted by the group columns and time bin.
+    '''
 
-    for ant in ant_nums:
+    time_bin = time_bin_ids(tab['time'], scans=tab['scan'], interval=interval)
 
-        # There aren't many to loop through.
-        for ant_name in ampgaincal_tab_names:
+    group_cols = [col for col in group_cols if col != 'time']
+    if 'chan' not in group_cols:
+        group_cols.append('chan')
 
-            if f"_ant{ant}.txt" in ant_name:
-                break
+    out = _rebin_table(tab, time_bin, phase_cols=phase_cols, group_cols=group_cols)
+    out.meta['timebin'] = 'scan' if interval is None else interval
 
-        amp_out = read_casa_txt(ant_name)
+    return out
 
-        table_dict['amp'][ant] = amp_out[0]
 
-        meta_dict['amp'][ant] = amp_out[1]
+def _read_rebinned(read_func, chanavg=None, timebin=None, phase_cols=[]):
+    '''
+    Call `read_func` and re-bin the table it returns in channel and/or time.
+    '''
 
-    return table_dict, meta_dict
+    tab, meta_dict = read_func()
+
+    if chanavg is not None:
+        tab = rebin_table_channels(tab, chanavg, phase_cols=phase_cols)
+
+    if timebin is not None:
+        interval = None if timebin == 'scan' else timebin
+        tab = rebin_table_time(tab, interval=interval, phase_cols=phase_cols)
+
+    return tab, meta_dict
 
 
-def read_ampgaincal_freq_data_tables(inp_path, table_key="amp_final.gcal"):
+def skim_header_metadata(filename):
     '''
-    Read in the BP txt files for amp and phase.
+    Search for "From plot 0"
+    '''
+
+    with open_table_text(filename) as f:
+        meta_lines = _read_header_lines(f, filename)
+
+    return meta_lines
+
+
+def _call(func):
+    return func()
+
+
+class LazyTableDict(Mapping):
+    '''
+    Read-only mapping of table type to Table that only reads a table file
+    when its key is indexed.
+
+    The keys, `len` and membership checks only use the list of files that
+    exist, so they do not trigger any parsing.
+
+    Parameters
+    ----------
+    read_funcs : dict
+        Table type to a function with no arguments that returns
+        (Table, meta_dict).
+    keep_tables : bool, optional
+        Keep the parsed Table after the first access. When False, every
+        access parses the file again (or loads it from the table cache),
+        so only tables that are in use are held in memory.
+    '''
+
+    def __init__(self, read_funcs, keep_tables=True):
+
+        self._read_funcs = dict(read_funcs)
+        self._tables = dict()
+
+        self.keep_tables = keep_tables
+
+    @property
+    def loaded(self):
+        '''
+        Table types that are held in memory.
+        '''
+        return list(self._tables)
+
+    def __getitem__(self, key):
+
+        if key in self._tables:
+            return self._tables[key]
+
+        tab = self._read_funcs[key]()[0]
+
+        if self.keep_tables:
+            self._tables[key] = tab
+
+        return tab
+
+    def __iter__(self):
+        return iter(self._read_funcs)
+
+    def __len__(self):
+        return len(self._read_funcs)
+
+    def __contains__(self, key):
+        return key in self._read_funcs
+
+    def load(self, keys=None, workers=1):
+        '''
+        Read the tables for `keys` (all by default) that are not held yet,
+        with `workers` processes, and keep them.
+        '''
+
+        keys = [key for key in (self if keys is None else keys) if key not in self._tables]
+
+        outs = parallel_map(_call, [self._read_funcs[key] for key in keys], workers=workers)
+
+        for key, out in zip(keys, outs):
+            self._tables[key] = out[0]
+
+    def release(self, key=None):
+        '''
+        Drop the parsed Table for `key`, or all parsed tables if `key` is None.
+        '''
+
+        if key is None:
+            self._tables.clear()
+        else:
+            self._tables.pop(key, None)
+
+
+def read_field_data_tables(fieldname, inp_path, workers=1, max_points=None,
+                           downsample_method='minmax',
+                           compact=False,
+                           mmap=False,
+                           lazy=False,
+                           keep_tables=True,
+                           chanavg=None,
+                           timebin=None):
+    '''
+    Read in a set of tables for a given `fieldname`. Note that this depends on the function:
+    https://github.com/e-koch/quicklook-sma/blob/main/quicklook_sma/export_casa_tables/qa_plot_tools.py#L15
+    Because of this, the read-in is not generalized and may need to be updated.
+
+    Parameters
+    ----------
+    fieldname : str
+        Name of the field.
+    inp_path : str
+        Folder with the txt tables.
+    workers : int or None, optional
+        Number of processes used to parse the tables. `None` uses all CPUs.
+        Not used when `lazy=True` (see `LazyTableDict.load`).
+    max_points : int, optional
+        Stream each table in chunks and reduce it to roughly this many rows
+        with `read_casa_txt_downsampled`. Tables are read in full by default.
+    downsample_method : str, optional
+        Reduction used with `max_points`. See `read_casa_txt_downsampled`.
+    compact : bool, optional
+        Return tables with smaller dtypes and categorical string columns.
+        See `compact_table`.
+    mmap : bool, optional
+        Return tables backed by read-only memory maps of the binary table
+        cache. See `read_casa_txt`. Tables returned from worker processes
+        (`workers > 1`) are copies.
+    lazy : bool, optional
+        Return a `LazyTableDict` that reads each table on first access.
+        Only the header metadata is read up front.
+    keep_tables : bool, optional
+        Passed to `LazyTableDict` when `lazy=True`.
+    chanavg : int, optional
+        Average the tables versus channel (`CHAN_TABLE_TYPES`) further in
+        bins of this many exported channels. See `rebin_table_channels`.
+    timebin : float or str, optional
+        Average the tables versus time (`TIME_TABLE_TYPES`) further in bins
+        of this many seconds, or per scan with 'scan'. See
+        `rebin_table_time`.
     '''
 
     table_dict = dict()
     meta_dict = dict()
 
-    # Table types:
-    tab_types = ["amp"]
+    tabnames = dict()
 
-    for tab_type in tab_types:
-        table_dict[tab_type] = {}
-        meta_dict[tab_type] = {}
+    for tab_type in FIELD_TABLE_TYPES:
+        for ext in TABLE_EXTENSIONS:
+            tabname = osjoin(inp_path, f"field_{fieldname}_{tab_type}.{ext}")
+            if os.path.exists(tabname):
+                tabnames[tab_type] = tabname
+                break
 
-    ampgaincal_tab_names = glob(f"{inp_path}/*{table_key}_freq_amp*.txt")
+    if max_points is None:
+        read_funcs = [partial(read_casa_txt, tabname, compact=compact, mmap=mmap)
+                      for tabname in tabnames.values()]
+    else:
+        read_funcs = [partial(read_casa_txt_downsampled, tabname, max_points=max_points,
+                              method=downsample_method, compact=compact,
+                              phase_cols=['y'] if tab_type in PHASE_TABLE_TYPES else [])
+                      for tab_type, tabname in tabnames.items()]
 
-    # Sort by SPW and create a text
-    ant_nums = [int(tab.rstrip(".txt").split("ant")[1]) for tab in ampgaincal_tab_names]
+    for ii, tab_type in enumerate(tabnames):
+        this_chanavg = chanavg if tab_type in CHAN_TABLE_TYPES else None
+        this_timebin = timebin if tab_type in TIME_TABLE_TYPES else None
 
-    for ant in ant_nums:
+        if this_chanavg is None and this_timebin is None:
+            continue
 
-        # There aren't many to loop through.
-        for ant_name in ampgaincal_tab_names:
+        read_funcs[ii] = partial(_read_rebinned, read_funcs[ii], chanavg=this_chanavg,
+                                 timebin=this_timebin,
+                                 phase_cols=['y'] if tab_type in PHASE_TABLE_TYPES else [])
 
-            if f"_ant{ant}.txt" in ant_name:
-                break
+    if lazy:
+        for tab_type, tabname in tabnames.items():
+            if is_npz_table(tabname):
+                meta_dict[tab_type] = read_npz_meta(tabname)[1]
+            else:
+                meta_dict[tab_type] = make_meta_dict(skim_header_metadata(tabname))
 
-        amp_out = read_casa_txt(ant_name)
+        return LazyTableDict(dict(zip(tabnames, read_funcs)),
+                             keep_tables=keep_tables), meta_dict
 
-        table_dict['amp'][ant] = amp_out[0]
+    outs = parallel_map(_call, read_funcs, workers=workers)
 
-        meta_dict['amp'][ant] = amp_out[1]
+    for tab_type, out in zip(tabnames, outs):
+        table_dict[tab_type] = out[0]
+        meta_dict[tab_type] = out[1]
 
     return table_dict, meta_dict
 
 
-def read_phasegaincal_data_tables(inp_path, table_key='scanphase_combinespw.gcal'):
+def find_field_names(inp_path):
     '''
-    Read in the BP txt files for amp and phase.
+    Names of the fields with QA tables ("field_{name}_{table type}.{ext}")
+    in `inp_path`, for any of the `table_io.TABLE_EXTENSIONS`. Other files,
+    like the scan statistics tables and the export manifest, are skipped.
+
+    Returns
+    -------
+    fieldnames : list
+        Sorted unique field names.
     '''
 
-    table_dict = dict()
+    suffixes = [f"_{tab_type}.{ext}" for tab_type in FIELD_TABLE_TYPES
+                for ext in TABLE_EXTENSIONS]
+
+    fieldnames = set()
+
+    for filename in os.listdir(inp_path):
+        if not filename.startswith("field_"):
+            continue
+
+        for suffix in suffixes:
+            if filename.endswith(suffix):
+                fieldnames.add(filename[len("field_"):-len(suffix)])
+                break
+
+    return sorted(fieldnames)
+
+
+def read_scan_stats(inp_path, fieldnames=None):
+    '''
+    Read the per-scan statistics tables ("field_{name}_scan_stats.npz")
+    written by `qa_plot_tools.make_qa_tables` into one table. See
+    `export_casa_tables.scan_stats` for the columns.
+
+    Parameters
+    ----------
+    inp_path : str
+        Folder with the QA tables.
+    fieldnames : list, optional
+        Fields to read. All fields with a statistics table by default.
+
+    Returns
+    -------
+    tab : `~astropy.table.Table`
+        Statistics of all fields, with a 'fieldname' column added.
+    meta_dict : dict
+        {field name: header metadata}.
+    '''
+
+    suffix = "_scan_stats.npz"
+
+    if fieldnames is None:
+        fieldnames = sorted(filename[len("field_"):-len(suffix)]
+                            for filename in os.listdir(inp_path)
+                            if filename.startswith("field_") and filename.endswith(suffix))
+
+    all_columns = []
     meta_dict = dict()
 
-    # Table types:
-    tab_types = ["phase"]
+    for fieldname in fieldnames:
+        tabname = osjoin(inp_path, f"field_{fieldname}{suffix}")
 
-    for tab_type in tab_types:
-        table_dict[tab_type] = {}
-        meta_dict[tab_type] = {}
+        if not os.path.exists(tabname):
+            continue
 
-    phaseshort_tab_names = glob(f"{inp_path}/*{table_key}_time_phase*.txt")
+        columns, meta_dict[fieldname] = read_npz_table(tabname)
 
-    # Sort by SPW and create a text
-    ant_nums = [int(tab.rstrip(".txt").split("ant")[1]) for tab in phaseshort_tab_names]
+        columns['fieldname'] = np.full(len(columns['scan']), fieldname)
 
-    for ant in ant_nums:
+        all_columns.append(columns)
 
-        # There aren't many to loop through.
-        for ant_name in phaseshort_tab_names:
+    if len(all_columns) == 0:
+        return Table(), meta_dict
 
-            if f"_ant{ant}.txt" in ant_name:
-                break
+    colnames = list(all_columns[0].keys())
+
+    tab = Table([np.concatenate([columns[colname] for columns in all_columns])
+                 for colname in colnames], names=colnames, copy=False)
+
+    return tab, meta_dict
+
+
+# Filenames from `caltable_plots.make_caltable_txt`:
+# {caltable}_{xaxis}_{yaxis}_{iteraxis}{index}.{txt,txt.gz,txt.zst,npz}
+CALTABLE_TXT_REGEX = re.compile(r"^(?P<caltable>.+)_(?P<xaxis>[A-Za-z0-9]+)_"
+                                r"(?P<yaxis>[A-Za-z0-9]+)_(?P<iteraxis>spw|ant)"
+                                r"(?P<index>\d+)\.(?:txt|txt\.gz|txt\.zst|npz)$")
+
+
+def build_caltable_index(inp_path):
+    '''
+    Scan `inp_path` once and parse every caltable txt filename into
+    (caltable, xaxis, yaxis, iteraxis, index).
+
+    Returns
+    -------
+    index : dict
+        Keys are (caltable, xaxis, yaxis, iteraxis) and values are a dictionary
+        of {index: filename}.
+    '''
+
+    index = dict()
+
+    if not os.path.isdir(inp_path):
+        return index
+
+    for entry in os.scandir(inp_path):
+
+        match = CALTABLE_TXT_REGEX.match(entry.name)
+
+        if match is None:
+            continue
+
+        key = (match['caltable'], match['xaxis'], match['yaxis'], match['iteraxis'])
+
+        if key not in index:
+            index[key] = dict()
+
+        index[key][int(match['index'])] = osjoin(inp_path, entry.name)
+
+    return index
+
+
+def query_caltable_index(index, search_key):
+    '''
+    Return {index: filename} for all tables where "{caltable}_{xaxis}_{yaxis}"
+    ends with `search_key` (e.g. "amp_final.gcal_time_amp"), sorted by index.
+    '''
 
-        phase_out = read_casa_txt(ant_name)
+    matches = dict()
 
-        table_dict['phase'][ant] = phase_out[0]
+    for (caltable, xaxis, yaxis, iteraxis), filenames in index.items():
+        if f"{caltable}_{xaxis}_{yaxis}".endswith(search_key):
+            matches.update(filenames)
 
-        meta_dict['phase'][ant] = phase_out[1]
+    return {num: matches[num] for num in sorted(matches)}
+
+
+def _read_indexed_tables(inp_path, search_key, tab_type, index=None, workers=1):
+    '''
+    Read all tables matching `search_key` in the caltable index into
+    dictionaries keyed by `tab_type` and the SPW or antenna number.
+    '''
+
+    if index is None:
+        index = build_caltable_index(inp_path)
+
+    table_dict = {tab_type: {}}
+    meta_dict = {tab_type: {}}
+
+    filenames = query_caltable_index(index, search_key)
+
+    outs = parallel_map(read_casa_txt, filenames.values(), workers=workers)
+
+    for num, out in zip(filenames, outs):
+
+        table_dict[tab_type][num] = out[0]
+        meta_dict[tab_type][num] = out[1]
 
     return table_dict, meta_dict
 
 
-def read_blcal_freq_data_tables(inp_path, table_key='blcal'):
+def read_bpcal_data_tables(inp_path, table_key='bcal_freq', index=None, workers=1):
     '''
     Read in the BP txt files for amp and phase.
     '''
 
-    table_dict = dict()
-    meta_dict = dict()
+    if index is None:
+        index = build_caltable_index(inp_path)
+
+    amp_tab_names = query_caltable_index(index, f"{table_key}_amp")
+    phase_tab_names = query_caltable_index(index, f"{table_key}_phase")
+
+    if len(amp_tab_names) != len(phase_tab_names):
+        raise ValueError("Number of BP amp tables does not match BP phase tables.: "
+                         f"Num amp tables: {len(amp_tab_names)}. Num phase tables: {len(phase_tab_names)}")
 
-    # Table types:
-    tab_types = ["amp"]
+    table_dict, meta_dict = _read_indexed_tables(inp_path, f"{table_key}_amp", 'amp',
+                                                 index=index, workers=workers)
 
-    for tab_type in tab_types:
-        table_dict[tab_type] = {}
-        meta_dict[tab_type] = {}
+    phase_out = _read_indexed_tables(inp_path, f"{table_key}_phase", 'phase',
+                                     index=index, workers=workers)
 
-    ampgaincal_tab_names = glob(f"{inp_path}/*{table_key}_freq_amp*.txt")
+    table_dict.update(phase_out[0])
+    meta_dict.update(phase_out[1])
 
-    # Sort by SPW and create a text
-    ant_nums = [int(tab.rstrip(".txt").split("ant")[1]) for tab in ampgaincal_tab_names]
+    return table_dict, meta_dict
 
-    for ant in ant_nums:
 
-        # There aren't many to loop through.
-        for ant_name in ampgaincal_tab_names:
+def read_BPinitialgain_data_tables(inp_path, table_key="bpself.ap.gcal", index=None,
+                                   workers=1):
+    '''
+    Read in the BP initial gain txt files for phase vs. time per antenna.
+    '''
 
-            if f"_ant{ant}.txt" in ant_name:
-                break
+    return _read_indexed_tables(inp_path, f"{table_key}_time_phase", 'phase',
+                                index=index, workers=workers)
 
-        amp_out = read_casa_txt(ant_name)
 
-        table_dict['amp'][ant] = amp_out[0]
+def read_phaseshortgaincal_data_tables(inp_path, table_key="intphase_combinespw.gcal",
+                                       index=None, workers=1):
+    '''
+    Read in the short phase gain txt files for phase vs. time per antenna.
+    '''
 
-        meta_dict['amp'][ant] = amp_out[1]
+    return _read_indexed_tables(inp_path, f"{table_key}_time_phase", 'phase',
+                                index=index, workers=workers)
 
-    return table_dict, meta_dict
 
+def read_ampgaincal_time_data_tables(inp_path, table_key="amp_final.gcal", index=None,
+                                     workers=1):
+    '''
+    Read in the amp gain txt files for amp vs. time per antenna.
+    '''
+
+    return _read_indexed_tables(inp_path, f"{table_key}_time_amp", 'amp',
+                                index=index, workers=workers)
+
+
+def read_ampgaincal_freq_data_tables(inp_path, table_key="amp_final.gcal", index=None,
+                                     workers=1):
+    '''
+    Read in the amp gain txt files for amp vs. frequency per antenna.
+    '''
+
+    return _read_indexed_tables(inp_path, f"{table_key}_freq_amp", 'amp',
+                                index=index, workers=workers)
+
+
+def read_phasegaincal_data_tables(inp_path, table_key='scanphase_combinespw.gcal',
+                                  index=None, workers=1):
+    '''
+    Read in the phase gain txt files for phase vs. time per antenna.
+    '''
+
+    return _read_indexed_tables(inp_path, f"{table_key}_time_phase", 'phase',
+                                index=index, workers=workers)
+
+
+def read_blcal_freq_data_tables(inp_path, table_key='blcal', index=None, workers=1):
+    '''
+    Read in the baseline-based cal txt files for amp vs. frequency per antenna.
+    '''
+
+    return _read_indexed_tables(inp_path, f"{table_key}_freq_amp", 'amp',
+                                index=index, workers=workers)
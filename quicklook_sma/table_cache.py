@@ -0,0 +1,366 @@
+
+'''
+On-disk cache of the parsed QA tables.
+
+Each txt table read by `read_data_sma.read_casa_txt` is stored in a shared
+cache folder as a folder holding one `.npy` file per column and an
+`info.json` file with the header metadata. Entries are keyed on the absolute
+path of the txt file and are valid while its size, modification time and
+a hash of its first and last `SAMPLE_BLOCK_BYTES` match. The sampled hash
+also catches a file rewritten with the same size within the resolution of
+the modification time, as long as the header or the last rows differ.
+Changes confined to the middle of such a file are not detected. Only the
+sampled blocks are read, so checking or saving an entry stays cheap for
+large tables.
+
+The folder is capped in size and the least recently used entries are
+removed first. Each process lists the cache folder once, keeps a running
+total of what it adds, and only evicts when that total passes the cap. The
+eviction then goes down to `EVICT_TO_FRACTION` of the cap so the next
+eviction is many tables later.
+
+The `.npy` columns can be opened with `numpy.memmap` (`mmap_mode='r'`) so
+that processes building figures from the same tables share one copy
+through the page cache.
+
+The cache can be cleared from the command line with:
+
+    python -m quicklook_sma.table_cache --clear
+
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+from astropy.table import Table
+
+
+CACHE_DIR_ENV = "QUICKLOOK_SMA_CACHE_DIR"
+CACHE_MAX_MB_ENV = "QUICKLOOK_SMA_CACHE_MAX_MB"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "quicklook_sma")
+DEFAULT_CACHE_MAX_MB = 2048
+
+# Evict down to this fraction of the size cap.
+EVICT_TO_FRACTION = 0.8
+
+# Bytes hashed from each end of the txt file to validate an entry. The
+# start of the file holds the header.
+SAMPLE_BLOCK_BYTES = 65536
+
+_INFO_NAME = "info.json"
+
+# Estimated size of each cache folder written to by this process.
+_CACHE_SIZES = {}
+
+
+def get_cache_dir(cache_dir=None):
+    '''
+    Return the cache folder. Set with `cache_dir`, otherwise the
+    QUICKLOOK_SMA_CACHE_DIR environment variable, otherwise
+    ~/.cache/quicklook_sma.
+    '''
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+
+    return cache_dir
+
+
+def get_cache_max_bytes(max_size_mb=None):
+    '''
+    Return the size cap for the cache folder in bytes.
+    '''
+
+    if max_size_mb is None:
+        max_size_mb = float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_CACHE_MAX_MB))
+
+    return int(max_size_mb * 1024**2)
+
+
+def _entry_dirname(filename, cache_dir):
+    '''
+    Cache entry folder for the txt file `filename`.
+    '''
+
+    key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+
+    return os.path.join(cache_dir, key)
+
+
+def sampled_hash(filename, block_bytes=SAMPLE_BLOCK_BYTES):
+    '''
+    BLAKE2 hash of the first and last `block_bytes` of the file.
+    '''
+
+    this_hash = hashlib.blake2b(digest_size=16)
+
+    with open(filename, 'rb') as f:
+        this_hash.update(f.read(block_bytes))
+
+        size = f.seek(0, os.SEEK_END)
+
+        if size > block_bytes:
+            f.seek(max(size - block_bytes, block_bytes))
+            this_hash.update(f.read(block_bytes))
+
+    return this_hash.hexdigest()
+
+
+def load_cached_columns(filename, cache_dir=None, mmap_mode=None):
+    '''
+    Return the cached ({colname: array}, meta_dict) for `filename`, or None
+    if there is no valid entry.
+
+    With `mmap_mode='r'`, the arrays are read-only memory maps of the cached
+    files and no data is copied into memory.
+    '''
+
+    cache_dir = get_cache_dir(cache_dir)
+
+    entry_dir = _entry_dirname(filename, cache_dir)
+    info_name = os.path.join(entry_dir, _INFO_NAME)
+
+    if not os.path.exists(info_name):
+        return None
+
+    try:
+        with open(info_name, 'r') as f:
+            info = json.load(f)
+
+        if not _is_entry_valid(filename, info):
+            return None
+
+        columns = {name: np.load(os.path.join(entry_dir, f"col{ii}.npy"),
+                                 mmap_mode=mmap_mode, allow_pickle=False)
+                   for ii, name in enumerate(info['colnames'])}
+
+    except (OSError, ValueError, KeyError) as exc:
+        warnings.warn(f"Unable to read cache entry for {filename}: {exc}")
+        return None
+
+    # Mark as recently used for the LRU eviction.
+    try:
+        os.utime(info_name)
+    except FileNotFoundError:
+        # Evicted by another process since it was read.
+        pass
+
+    return columns, info['meta']
+
+
+def load_cached_table(filename, cache_dir=None, mmap_mode=None):
+    '''
+    Return the cached (Table, meta_dict) for `filename`, or None if there is
+    no valid entry. With `mmap_mode='r'`, the Table columns are views on
+    memory maps of the cached files.
+    '''
+
+    out = load_cached_columns(filename, cache_dir=cache_dir, mmap_mode=mmap_mode)
+
+    if out is None:
+        return None
+
+    columns, meta_dict = out
+
+    tab = Table(list(columns.values()), names=list(columns.keys()), copy=False)
+
+    return tab, meta_dict
+
+
+def _is_entry_valid(filename, info):
+    '''
+    Check the cache entry `info` against the current state of `filename`.
+    '''
+
+    stat = os.stat(filename)
+
+    if info['source'] != os.path.abspath(filename):
+        return False
+
+    if stat.st_size != info['size'] or stat.st_mtime_ns != info['mtime_ns']:
+        return False
+
+    return sampled_hash(filename) == info.get('sampled_hash')
+
+
+def save_cached_table(filename, tab, meta_dict, cache_dir=None, max_size_mb=None):
+    '''
+    Write the Table and meta_dict for `filename` to the cache.
+    '''
+
+    cache_dir = get_cache_dir(cache_dir)
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    stat = os.stat(filename)
+
+    info = {'source': os.path.abspath(filename),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sampled_hash': sampled_hash(filename),
+            'colnames': list(tab.colnames),
+            'meta': meta_dict}
+
+    entry_dir = _entry_dirname(filename, cache_dir)
+
+    # Write to a temporary folder first so readers never see a partial entry.
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp-")
+
+    entry_size = 0
+
+    try:
+        for ii, name in enumerate(tab.colnames):
+            col_name = os.path.join(tmp_dir, f"col{ii}.npy")
+            np.save(col_name, np.asarray(tab[name]), allow_pickle=False)
+            entry_size += os.path.getsize(col_name)
+
+        with open(os.path.join(tmp_dir, _INFO_NAME), 'w') as f:
+            json.dump(info, f)
+
+        # A folder cannot be replaced in one step. Move any old entry out of
+        # the way first. Open memory maps of the old files stay valid.
+        if os.path.exists(entry_dir):
+            old_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".old-")
+            os.replace(entry_dir, os.path.join(old_dir, "entry"))
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+        os.replace(tmp_dir, entry_dir)
+
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _add_to_cache_size(cache_dir, entry_size, max_size_mb=max_size_mb)
+
+
+def _add_to_cache_size(cache_dir, size, max_size_mb=None):
+    '''
+    Add a new entry of `size` bytes to the estimated size of `cache_dir`
+    and evict when it passes the cap. The folder is only listed the first
+    time in each process and when evicting.
+    '''
+
+    if cache_dir not in _CACHE_SIZES:
+        _CACHE_SIZES[cache_dir] = sum(entry[1] for entry in _list_entries(cache_dir))
+    else:
+        _CACHE_SIZES[cache_dir] += size
+
+    max_bytes = get_cache_max_bytes(max_size_mb)
+
+    if _CACHE_SIZES[cache_dir] > max_bytes:
+        _CACHE_SIZES[cache_dir] = evict_cache(cache_dir=cache_dir,
+                                              max_size_mb=EVICT_TO_FRACTION * max_bytes / 1024**2)
+
+
+def _list_entries(cache_dir):
+    '''
+    Return (name, size, last access) for all entries in the cache folder.
+    '''
+
+    entries = []
+
+    if not os.path.exists(cache_dir):
+        return entries
+
+    for dir_entry in os.scandir(cache_dir):
+        # Skip temporary folders that are being written or removed.
+        if dir_entry.name.startswith(".") or not dir_entry.is_dir():
+            continue
+
+        try:
+            last_access = os.stat(os.path.join(dir_entry.path, _INFO_NAME)).st_mtime
+            size = sum(file_entry.stat().st_size
+                       for file_entry in os.scandir(dir_entry.path))
+        except FileNotFoundError:
+            continue
+
+        entries.append((dir_entry.path, size, last_access))
+
+    return entries
+
+
+def evict_cache(cache_dir=None, max_size_mb=None):
+    '''
+    Remove the least recently used entries until the cache folder is
+    below the size cap. Returns the size left in bytes.
+    '''
+
+    cache_dir = get_cache_dir(cache_dir)
+    max_bytes = get_cache_max_bytes(max_size_mb)
+
+    entries = sorted(_list_entries(cache_dir), key=lambda entry: entry[2])
+
+    total_size = sum(entry[1] for entry in entries)
+
+    for entry_dir, size, _ in entries:
+        if total_size <= max_bytes:
+            break
+
+        # Open memory maps of the removed files stay valid. Another process
+        # may also remove it at the same time.
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+        total_size -= size
+
+    return total_size
+
+
+def clear_cache(cache_dir=None):
+    '''
+    Remove all entries in the cache folder.
+    '''
+
+    cache_dir = get_cache_dir(cache_dir)
+
+    for entry_dir, _, _ in _list_entries(cache_dir):
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+    _CACHE_SIZES.pop(cache_dir, None)
+
+
+def cache_info(cache_dir=None):
+    '''
+    Number of entries and total size (in bytes) of the cache folder.
+    '''
+
+    cache_dir = get_cache_dir(cache_dir)
+
+    entries = _list_entries(cache_dir)
+
+    return {'cache_dir': cache_dir,
+            'num_entries': len(entries),
+            'size_bytes': sum(entry[1] for entry in entries)}
+
+
+def main(args=None):
+
+    parser = argparse.ArgumentParser(description="Manage the quicklook_sma table cache.")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Cache folder. Defaults to $QUICKLOOK_SMA_CACHE_DIR or"
+                             " ~/.cache/quicklook_sma.")
+    parser.add_argument("--clear", action="store_true",
+                        help="Remove all cached tables.")
+    parser.add_argument("--max-mb", type=float, default=None,
+                        help="Evict least recently used tables down to this size.")
+
+    args = parser.parse_args(args)
+
+    if args.clear:
+        clear_cache(args.cache_dir)
+    elif args.max_mb is not None:
+        evict_cache(args.cache_dir, max_size_mb=args.max_mb)
+
+    info = cache_info(args.cache_dir)
+    print(f"{info['cache_dir']}: {info['num_entries']} tables,"
+          f" {info['size_bytes'] / 1024**2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
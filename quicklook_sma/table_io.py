@@ -0,0 +1,542 @@
+
+'''
+Reading the plotms txt layout and the binary (npz) format for the exported
+QA tables.
+
+The txt tables can also be gzip (".txt.gz") or zstd (".txt.zst") compressed.
+`open_table_text` opens these as text streams that are decompressed as they
+are read.
+
+Each plotms txt column is stored as one array in the npz file. The header
+metadata (the "# key: value" lines of the txt layout) is kept as a JSON
+string under `NPZ_META_KEY`. This module does not depend on astropy or
+qaplotter so it can be used from the CASA export side.
+'''
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+NPZ_META_KEY = '__meta__'
+
+# Compressed txt tables. zstd needs the optional `zstandard` package.
+COMPRESSED_EXTENSIONS = ['txt.gz', 'txt.zst']
+
+TABLE_EXTENSIONS = ['txt'] + COMPRESSED_EXTENSIONS + ['npz']
+
+# Level 9 is ~3x slower to write with no real size gain for these tables.
+GZIP_LEVEL = 6
+
+
+def make_meta_dict(meta_lines):
+    '''
+    Convert the meta lines into something nice.
+    '''
+
+    data_dict = {}
+
+    for line in meta_lines:
+
+        # Skip "# "
+        line = line[2:]
+
+        # Some plotms output will have multiple name:value pairs
+        num_names = len(line.split(": ")) // 2
+
+        for ii in range(num_names):
+
+            name, value = line.split(": ")[2*ii:2*(ii)+2]
+
+            name = name.strip(" ")
+            value = value.strip(" ")
+            value = value.strip("\n")
+
+            data_dict[name] = value
+
+    return data_dict
+
+
+def _read_header_lines(f, filename):
+    '''
+    Read the metadata lines from the open file `f` up to and including
+    the "From plot 0" line. The file is left positioned at the column
+    names line.
+    '''
+    search_str = "# From plot 0"
+
+    # Should be close to ~10 or below, I think
+    # This just stops reading too far if something
+    # goes wrong.
+    max_line = 50
+
+    meta_lines = []
+
+    # Use readline rather than iterating so `f.tell` remains usable.
+    for i in range(max_line + 2):
+        line = f.readline()
+
+        if not line:
+            break
+
+        if search_str in line:
+            return meta_lines
+
+        meta_lines.append(line)
+
+    raise ValueError(f"Could not find header in {filename}")
+
+
+def _column_kind(token):
+    '''
+    Classify a single data token as 'int', 'float' or 'str'.
+    '''
+
+    try:
+        int(token)
+        return 'int'
+    except ValueError:
+        pass
+
+    try:
+        float(token)
+        return 'float'
+    except ValueError:
+        return 'str'
+
+
+def read_txt_columns(f, colnames, num_sample_rows=1000):
+    '''
+    Parse the data block of a plotms txt file with `numpy.loadtxt`, starting
+    from the current position of the open file `f`.
+
+    The column types are set from the first `num_sample_rows` data rows and
+    the whole block is then tokenized in one pass into a structured array.
+    String columns are read with a fixed width that is checked for
+    truncation afterwards.
+
+    Returns {colname: array}.
+    '''
+
+    data_pos = f.tell()
+
+    sample_lines = _read_sample_lines(f, num_sample_rows)
+
+    col_kinds, str_widths = _sample_column_kinds(sample_lines, colnames)
+
+    f.seek(data_pos)
+
+    try:
+        data = np.loadtxt(f, dtype=_make_dtype(colnames, col_kinds, str_widths),
+                          comments="#", ndmin=1)
+    except ValueError:
+        # An integer-like column has non-integer values further down.
+        # Parse all numeric columns as floats and convert back after.
+        f.seek(data_pos)
+        data = np.loadtxt(f, dtype=_make_dtype(colnames, col_kinds, str_widths,
+                                               allow_int=False),
+                          comments="#", ndmin=1)
+
+    return columns_from_structured(data, col_kinds)
+
+
+def _read_sample_lines(f, num_sample_rows):
+    '''
+    Read up to `num_sample_rows` data rows from the current position of `f`.
+    '''
+
+    sample_lines = []
+
+    for _ in range(num_sample_rows):
+        line = f.readline()
+        if not line:
+            break
+        if line.strip() and not line.startswith("#"):
+            sample_lines.append(line)
+
+    return sample_lines
+
+
+def _sample_column_kinds(sample_lines, colnames, min_str_width=8):
+    '''
+    Find the type of each column and the width for string columns from
+    a sample of data rows.
+    '''
+
+    if len(sample_lines) == 0:
+        raise ValueError("No data rows found.")
+
+    sample_tokens = [line.split() for line in sample_lines]
+
+    for tokens in sample_tokens:
+        if len(tokens) != len(colnames):
+            raise ValueError(f"Found {len(tokens)} values in a row for"
+                             f" {len(colnames)} columns.")
+
+    col_kinds = []
+    str_widths = []
+
+    for ii in range(len(colnames)):
+
+        kinds = set(_column_kind(tokens[ii]) for tokens in sample_tokens)
+
+        if 'str' in kinds:
+            col_kinds.append('str')
+        elif 'float' in kinds:
+            col_kinds.append('float')
+        else:
+            col_kinds.append('int')
+
+        # Leave room for longer values than seen in the sample.
+        max_len = max(len(tokens[ii]) for tokens in sample_tokens)
+        str_widths.append(max(min_str_width, 2 * max_len))
+
+    return col_kinds, str_widths
+
+
+def _make_dtype(colnames, col_kinds, str_widths, allow_int=True):
+    '''
+    Structured dtype for the data block.
+    '''
+
+    fields = []
+
+    for name, kind, width in zip(colnames, col_kinds, str_widths):
+
+        if kind == 'str':
+            fields.append((name, f"U{width}"))
+        elif kind == 'int' and allow_int:
+            fields.append((name, np.int64))
+        else:
+            fields.append((name, np.float64))
+
+    return np.dtype(fields)
+
+
+def columns_from_structured(data, col_kinds):
+    '''
+    Split the structured array into {colname: array}, restoring the column
+    types from `col_kinds`.
+    '''
+
+    names = data.dtype.names
+
+    columns = {}
+
+    for name, kind in zip(names, col_kinds):
+
+        col = data[name]
+
+        if kind == 'str':
+            width = col.dtype.itemsize // 4
+            max_len = np.char.str_len(col).max() if col.size > 0 else 1
+
+            if max_len >= width:
+                raise ValueError(f"String column {name} may be truncated.")
+
+            col = col.astype(f"U{max(max_len, 1)}")
+
+        elif kind == 'int' and col.dtype.kind == 'f':
+            # Restore int columns that were parsed as float.
+            if np.all(np.mod(col, 1) == 0):
+                col = col.astype(np.int64)
+            else:
+                col = col.copy()
+        else:
+            col = col.copy()
+
+        columns[name] = col
+
+    del data
+
+    return columns
+
+
+def is_npz_table(filename):
+    return filename.endswith('.npz')
+
+
+def is_compressed_table(filename):
+    return filename.endswith('.gz') or filename.endswith('.zst')
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("zstandard is required for .zst tables. Install with"
+                          " `pip install zstandard`.")
+
+    return zstandard
+
+
+class _ZstdReader(io.RawIOBase):
+    '''
+    Seekable stream of a zstd file. Seeking backwards restarts the
+    decompression from the start of the file, so only short backward seeks
+    (e.g., after sampling the first rows) should be used.
+    '''
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._open()
+
+    def _open(self):
+        zstandard = _import_zstandard()
+
+        self._fh = open(self._filename, 'rb')
+        self._reader = zstandard.ZstdDecompressor().stream_reader(self._fh,
+                                                                  read_across_frames=True)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._reader.read(len(buffer))
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Cannot seek from the end of a zstd stream.")
+
+        if offset < self._pos:
+            self._close_handles()
+            self._open()
+
+        while self._pos < offset:
+            if len(self.read(min(offset - self._pos, 2**20))) == 0:
+                break
+
+        return self._pos
+
+    def _close_handles(self):
+        self._reader.close()
+        self._fh.close()
+
+    def close(self):
+        if not self.closed:
+            self._close_handles()
+        super().close()
+
+
+def open_table_text(filename, mode='r'):
+    '''
+    Open a txt table for reading ('r') or writing ('w') as text. gzip and
+    zstd files are decompressed or compressed on the fly.
+    '''
+
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't', encoding='utf-8', compresslevel=GZIP_LEVEL)
+
+    if filename.endswith('.zst'):
+        if mode == 'r':
+            return io.TextIOWrapper(io.BufferedReader(_ZstdReader(filename)),
+                                    encoding='utf-8')
+
+        zstandard = _import_zstandard()
+
+        return zstandard.open(filename, mode + 't', encoding='utf-8')
+
+    return open(filename, mode)
+
+
+def uncompressed_size(filename):
+    '''
+    Size of the decompressed contents of a txt table. Estimated when the
+    compressed format does not record it.
+    '''
+
+    size = os.path.getsize(filename)
+
+    if filename.endswith('.gz'):
+        # The last 4 bytes hold the size modulo 2**32.
+        with open(filename, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            isize = int.from_bytes(f.read(4), 'little')
+
+        # Add the wraps for files above 4 GB. Text compresses by at most ~1000x.
+        while isize < size:
+            isize += 2**32
+
+        return isize
+
+    if filename.endswith('.zst'):
+        zstandard = _import_zstandard()
+
+        with open(filename, 'rb') as f:
+            content_size = zstandard.frame_content_size(f.read(18))
+
+        # Not recorded when written as a stream.
+        if content_size > 0:
+            return content_size
+
+        return 5 * size
+
+    return size
+
+
+def compress_file(filename, out_filename, remove_input=True):
+    '''
+    Compress `filename` to `out_filename` (".gz" or ".zst").
+    '''
+
+    out_dir = os.path.dirname(os.path.abspath(out_filename))
+    suffix = os.path.splitext(out_filename)[1]
+
+    fd, tmp_name = tempfile.mkstemp(dir=out_dir, prefix=".tmp-", suffix=suffix)
+    os.close(fd)
+
+    try:
+        with open(filename, 'rb') as f_in:
+            if out_filename.endswith('.gz'):
+                with gzip.open(tmp_name, 'wb', compresslevel=GZIP_LEVEL) as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            else:
+                zstandard = _import_zstandard()
+                with open(tmp_name, 'wb') as f_out:
+                    zstandard.ZstdCompressor().copy_stream(f_in, f_out)
+
+        os.replace(tmp_name, out_filename)
+
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+    if remove_input:
+        os.remove(filename)
+
+
+def plotms_output_name(filename):
+    '''
+    plotms only writes plain txt tables. Return the name to give plotms for
+    the table `filename`, which is then passed to `finalize_plotms_output`.
+    '''
+
+    if is_npz_table(filename) or is_compressed_table(filename):
+        return f"{filename}.tmp.txt"
+
+    return filename
+
+
+def finalize_plotms_output(plotfile, filename):
+    '''
+    Convert the plotms output `plotfile` to the table format of `filename`.
+    '''
+
+    if plotfile == filename:
+        return
+
+    if is_npz_table(filename):
+        convert_txt_to_npz(plotfile, filename)
+    else:
+        compress_file(plotfile, filename)
+
+
+def write_npz_table(filename, columns, meta_dict, compress=True):
+    '''
+    Write the columns and header metadata of a QA table to an npz file.
+
+    Parameters
+    ----------
+    filename : str
+        Output name. Should end in ".npz".
+    columns : dict
+        {colname: array}, in the column order of the table.
+    meta_dict : dict
+        Header metadata. Values are stored as strings, as they are read from
+        the txt header.
+    compress : bool, optional
+        Use `numpy.savez_compressed`.
+    '''
+
+    info = {'colnames': list(columns.keys()),
+            'meta': {str(key): str(value) for key, value in meta_dict.items()}}
+
+    arrays = {f"col{ii}": np.asarray(value) for ii, value in enumerate(columns.values())}
+    arrays[NPZ_META_KEY] = np.array(json.dumps(info))
+
+    save_func = np.savez_compressed if compress else np.savez
+
+    # Write next to the final name so a partial file is never read.
+    out_dir = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=out_dir, prefix=".tmp-", suffix=".npz")
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save_func(f, **arrays)
+
+        os.replace(tmp_name, filename)
+
+    except Exception:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def read_npz_meta(filename):
+    '''
+    Read only the (colnames, meta_dict) of an npz table.
+    '''
+
+    with np.load(filename, allow_pickle=False) as data:
+        info = json.loads(str(data[NPZ_META_KEY]))
+
+    return info['colnames'], info['meta']
+
+
+def read_npz_table(filename):
+    '''
+    Read an npz table written by `write_npz_table`.
+
+    Returns
+    -------
+    columns : dict
+        {colname: array} in the column order of the table.
+    meta_dict : dict
+        Header metadata.
+    '''
+
+    with np.load(filename, allow_pickle=False) as data:
+        info = json.loads(str(data[NPZ_META_KEY]))
+
+        columns = {name: data[f"col{ii}"] for ii, name in enumerate(info['colnames'])}
+
+    return columns, info['meta']
+
+
+def convert_txt_to_npz(txt_filename, npz_filename, remove_txt=True):
+    '''
+    Convert a plotms txt export to an npz table.
+    '''
+
+    with open_table_text(txt_filename) as f:
+
+        meta_lines = _read_header_lines(f, txt_filename)
+
+        # After the plot 0 line: one for column names, another for units.
+        colnames = f.readline().lstrip("#").split()
+        f.readline()
+
+        columns = read_txt_columns(f, colnames)
+
+    write_npz_table(npz_filename, columns, make_meta_dict(meta_lines))
+
+    if remove_txt:
+        os.remove(txt_filename)
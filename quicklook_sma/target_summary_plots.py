@@ -0,0 +1,123 @@
+'''
+Summary figures of all target fields.
+
+`target_summary_amptime_figure` takes the same arguments as the qaplotter
+function of the same name, which reads the amp-time tables from the
+folder. Here the tables already loaded by `track_set.make_field_plots` can
+be passed in with `amp_time_tables` so they are not read again.
+'''
+
+import numpy as np
+import plotly.graph_objects as go
+from astropy.time import Time
+
+from quicklook_sma.read_data_sma import read_field_data_tables
+
+
+# Marker for each correlation. Others use circles.
+CORR_SYMBOLS = {'XX': 'circle', 'YY': 'diamond', 'RR': 'circle', 'LL': 'diamond',
+                'XY': 'cross', 'YX': 'x', 'RL': 'cross', 'LR': 'x'}
+
+
+def spw_label(spw, spw_dict=None):
+    '''
+    Label of an SPW in the legend. With `spw_dict`, the SPW's 'label'
+    (e.g., "continuum" or the line names) is added.
+    '''
+
+    if spw_dict is None or spw not in spw_dict:
+        return f"SPW {spw}"
+
+    return f"SPW {spw} ({spw_dict[spw]['label']})"
+
+
+def target_summary_amptime_figure(target_fields, folder, corrs=['XX', 'YY'],
+                                  spw_dict=None, show_linesonly=False,
+                                  telescope='sma', amp_time_tables=None):
+    '''
+    Amplitude vs. time of all target fields in one figure, with one trace
+    per field, SPW and correlation.
+
+    Parameters
+    ----------
+    target_fields : list
+        Names of the target fields.
+    folder : str
+        Folder with the QA tables. Only read for fields missing from
+        `amp_time_tables`.
+    corrs : list, optional
+        Correlations to show.
+    spw_dict : dict, optional
+        {SPW number: {'label': ...}} labelling the SPWs with their lines.
+        SPWs not in `spw_dict` are shown with their number only.
+    show_linesonly : bool, optional
+        With `spw_dict`, only show the SPWs whose label is not "continuum".
+    telescope : str, optional
+        Shown in the title.
+    amp_time_tables : dict, optional
+        {field name: amp_time Table} already read with
+        `read_data_sma.read_field_data_tables`.
+
+    Returns
+    -------
+    fig : `plotly.graph_objects.Figure`
+    '''
+
+    if amp_time_tables is None:
+        amp_time_tables = {}
+
+    fig = go.Figure()
+
+    for field in target_fields:
+
+        if field in amp_time_tables:
+            tab = amp_time_tables[field]
+        else:
+            # Only the amp_time table is read.
+            table_dict = read_field_data_tables(field, folder, lazy=True)[0]
+
+            if 'amp_time' not in table_dict:
+                continue
+
+            tab = table_dict['amp_time']
+
+        corr_col = np.asarray(tab['corr']).astype(str)
+        spw_col = np.asarray(tab['spw'])
+
+        # plotms times are MJD in seconds.
+        times = Time(np.asarray(tab['time'], dtype=float) / 86400., format='mjd').datetime
+
+        for spw in np.unique(spw_col):
+
+            if show_linesonly and spw_dict is not None:
+                if spw not in spw_dict or "continuum" in spw_dict[spw]['label']:
+                    continue
+
+            this_label = spw_label(spw, spw_dict)
+
+            for corr in corrs:
+
+                rows = np.flatnonzero((corr_col == corr) & (spw_col == spw))
+
+                if len(rows) == 0:
+                    continue
+
+                hovertext = [f"Field: {field}<br>{this_label}<br>Scan: {scan}<br>Corr: {corr}"
+                             for scan in np.asarray(tab['scan'])[rows]]
+
+                fig.add_trace(go.Scattergl(x=times[rows],
+                                           y=np.asarray(tab['y'])[rows],
+                                           mode='markers',
+                                           marker=dict(symbol=CORR_SYMBOLS.get(corr, 'circle'),
+                                                       size=5),
+                                           name=f"{field} {this_label} {corr}",
+                                           legendgroup=field,
+                                           hovertext=hovertext,
+                                           hoverinfo='text+y'))
+
+    fig.update_layout(title=f"{telescope.upper()} target fields: amplitude vs. time",
+                      xaxis_title='Time (UTC)',
+                      yaxis_title='Amplitude',
+                      hovermode='closest')
+
+    return fig
@@ -0,0 +1,221 @@
+'''
+Synthetic plotms txt exports for the tests and benchmarks.
+'''
+
+import numpy as np
+
+from quicklook_sma.table_io import open_table_text
+
+
+PLOTMS_COLNAMES = ['x', 'y', 'chan', 'scan', 'field', 'ant1', 'ant2', 'ant1name',
+                   'ant2name', 'time', 'freq', 'spw', 'corr', 'obs']
+
+PLOTMS_UNITS = ['MJD(seconds)', 'None', 'None', 'None', 'None', 'None', 'None', 'None',
+                'None', 'MJD(seconds)', 'GHz', 'None', 'None', 'None']
+
+PLOTMS_META_LINES = ["# vis: track.ms\n",
+                     "# scan: \n",
+                     "# field: 3c279\n",
+                     "# avgchannel: 16384\n",
+                     "# From plot 0, iteration 0: amp vs time\n"]
+
+
+def synthetic_plotms_columns(num_rows, seed=0, num_ant=8, num_spw=4, num_scan=20,
+                             yaxis='amp'):
+    '''
+    Columns of a plotms export of `num_rows` rows, with integration times
+    increasing through the scans. With `yaxis='phase'` the y values are in
+    degrees and wrap at +/-180.
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    ant_names = np.array([f"Ant{ii}" for ii in range(num_ant)] + ['*'])
+
+    time = 5.0e9 + np.sort(rng.uniform(0, 3.6e4, num_rows))
+    scan = 1 + np.floor((time - time[0]) / (np.ptp(time) + 1.) * num_scan).astype(np.int64)
+
+    ant1 = rng.integers(0, num_ant - 1, num_rows)
+    ant2 = np.minimum(ant1 + rng.integers(1, num_ant, num_rows), num_ant - 1)
+
+    if yaxis == 'phase':
+        yvals = (rng.normal(175., 5., num_rows) + 180.) % 360. - 180.
+    else:
+        yvals = rng.lognormal(0., 0.3, num_rows)
+
+    spw = rng.integers(0, num_spw, num_rows)
+    chan = rng.integers(0, 128, num_rows)
+
+    return {'x': time,
+            'y': yvals,
+            'chan': chan,
+            'scan': scan,
+            'field': np.full(num_rows, 2),
+            'ant1': ant1,
+            'ant2': ant2,
+            'ant1name': ant_names[ant1],
+            'ant2name': ant_names[ant2],
+            'time': time,
+            'freq': 230. + spw * 2. + chan * 1e-3,
+            'spw': spw,
+            'corr': np.where(rng.random(num_rows) < 0.5, 'XX', 'YY'),
+            'obs': np.zeros(num_rows, dtype=np.int64)}
+
+
+def write_plotms_txt(filename, columns, meta_lines=PLOTMS_META_LINES):
+    '''
+    Write `columns` in the plotms txt layout. Names ending in ".gz" or
+    ".zst" are compressed.
+    '''
+
+    fmts = ['%.12g', '%.8g', '%d', '%d', '%d', '%d', '%d', '%s', '%s',
+            '%.3f', '%.9f', '%d', '%s', '%d']
+
+    col_list = [columns[colname] for colname in PLOTMS_COLNAMES]
+
+    with open_table_text(filename, 'w') as f:
+
+        f.writelines(meta_lines)
+        f.write("# " + " ".join(PLOTMS_COLNAMES) + "\n")
+        f.write("# " + " ".join(PLOTMS_UNITS) + "\n")
+
+        # Write in blocks so large benchmark files are not built in memory.
+        block = 100000
+
+        for start in range(0, len(col_list[0]), block):
+            rows = zip(*[col[start:start + block] for col in col_list])
+
+            f.write("".join(" ".join(fmt % val for fmt, val in zip(fmts, row)) + "\n"
+                            for row in rows))
+
+
+def make_plotms_txt(filename, num_rows, seed=0, yaxis='amp', **kwargs):
+    '''
+    Write a synthetic plotms export of `num_rows` rows to `filename` and
+    return its columns.
+    '''
+
+    columns = synthetic_plotms_columns(num_rows, seed=seed, yaxis=yaxis, **kwargs)
+
+    write_plotms_txt(filename, columns)
+
+    return columns
+
+
+def make_synthetic_ms(num_ant=5, num_scans=4, times_per_scan=6, num_spw=2, num_chan=32,
+                      corr_types=[9, 12], field_names=['3c279', 'target'],
+                      flux=1.0, offset_arcsec=(0., 0.), corr_gains=None,
+                      model_scale=None, flag_frac=0., ref_freq=230e9, chan_width=2e6,
+                      integration=30., autocorr=False, seed=0):
+    '''
+    Main table and subtables of a small MS of a point source, in the layout
+    of `ms_export.DictTableBackend`.
+
+    Scans alternate between the fields. Every row has all SPWs (one
+    DATA_DESC_ID each) and all baselines.
+
+    Parameters
+    ----------
+    flux : float
+        Point source flux in Jy.
+    offset_arcsec : tuple
+        Offset of the source east and north of the phase centre.
+    corr_gains : list, optional
+        Complex factor applied to each correlation.
+    model_scale : float, optional
+        Add a MODEL_DATA column of `model_scale` times the data.
+    flag_frac : float, optional
+        Fraction of samples flagged at random. Flagged samples are set to a
+        large value so any leak into an average is obvious.
+    autocorr : bool, optional
+        Include the autocorrelation rows.
+
+    Returns
+    -------
+    main : dict
+        Main table columns in the casatools layout (rows last).
+    subtables : dict
+        {subtable name: {colname: list of row values}}.
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    num_corr = len(corr_types)
+
+    if corr_gains is None:
+        corr_gains = np.ones(num_corr)
+
+    # Antennas within ~100 m, in metres east and north.
+    ant_pos = rng.uniform(-60., 60., (num_ant, 2))
+
+    baselines = [(ii, jj) for ii in range(num_ant) for jj in range(ii, num_ant)
+                 if autocorr or ii != jj]
+
+    chan_freqs = [ref_freq + (spw * num_chan + np.arange(num_chan)) * chan_width
+                  for spw in range(num_spw)]
+
+    rows = {key: [] for key in ['TIME', 'FIELD_ID', 'SCAN_NUMBER', 'DATA_DESC_ID',
+                                'ANTENNA1', 'ANTENNA2']}
+    uvw = []
+
+    for scan in range(num_scans):
+        for tt in range(times_per_scan):
+
+            time = 5.0e9 + (scan * (times_per_scan + 2) + tt) * integration
+
+            # Hour angle for the earth rotation of the baselines.
+            hour_angle = 2 * np.pi * (time - 5.0e9) / 86400. - 0.3
+
+            for ddid in range(num_spw):
+                for ant1, ant2 in baselines:
+                    east, north = ant_pos[ant2] - ant_pos[ant1]
+
+                    uvw.append([east * np.cos(hour_angle) - north * np.sin(hour_angle),
+                                east * np.sin(hour_angle) + north * np.cos(hour_angle),
+                                0.])
+
+                    rows['TIME'].append(time)
+                    rows['FIELD_ID'].append(scan % len(field_names))
+                    rows['SCAN_NUMBER'].append(scan + 1)
+                    rows['DATA_DESC_ID'].append(ddid)
+                    rows['ANTENNA1'].append(ant1)
+                    rows['ANTENNA2'].append(ant2)
+
+    main = {key: np.array(value) for key, value in rows.items()}
+    main['OBSERVATION_ID'] = np.zeros(len(main['TIME']), dtype=int)
+
+    uvw = np.array(uvw).T
+    main['UVW'] = uvw
+
+    num_rows = uvw.shape[1]
+
+    freqs = np.array(chan_freqs)[main['DATA_DESC_ID']]
+
+    l_rad, m_rad = np.deg2rad(np.array(offset_arcsec) / 3600.)
+
+    phase = -2 * np.pi * (uvw[0][:, None] * l_rad + uvw[1][:, None] * m_rad) * freqs / 2.99792458e8
+
+    # (row, chan) -> (corr, chan, row)
+    vis = flux * np.exp(1j * phase).T[None, :, :] * np.asarray(corr_gains)[:, None, None]
+
+    flags = rng.random(vis.shape) < flag_frac
+
+    data = np.where(flags, 1e3, vis).astype(np.complex64)
+
+    main['DATA'] = data
+    main['CORRECTED_DATA'] = data.copy()
+    main['FLAG'] = flags
+    main['WEIGHT'] = np.ones((num_corr, num_rows), dtype=np.float32)
+
+    if model_scale is not None:
+        main['MODEL_DATA'] = (model_scale * vis).astype(np.complex64)
+
+    subtables = {'DATA_DESCRIPTION': {'SPECTRAL_WINDOW_ID': list(range(num_spw)),
+                                      'POLARIZATION_ID': [0] * num_spw},
+                 'SPECTRAL_WINDOW': {'CHAN_FREQ': chan_freqs},
+                 'POLARIZATION': {'CORR_TYPE': [np.array(corr_types)]},
+                 'ANTENNA': {'NAME': [f"ant{ii}" for ii in range(num_ant)]},
+                 'FIELD': {'NAME': list(field_names),
+                           'PHASE_DIR': [np.array([[3.4, -0.1]])] * len(field_names)}}
+
+    return main, subtables
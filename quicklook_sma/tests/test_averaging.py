@@ -0,0 +1,130 @@
+import numpy as np
+
+from quicklook_sma.averaging import (channel_sums, scalar_channel_sums, channel_bin_centers,
+                                     time_bin_ids, baseline_sums, group_sums, finish_mean,
+                                     vector_amp_phase, circular_mean_deg)
+
+
+def test_channel_sums_flag_weighted():
+
+    # 2 rows, 5 channels, 1 corr. Bins of 2 leave a partial last bin.
+    values = np.arange(10, dtype=float).reshape(2, 5, 1)
+    good = np.ones_like(values, dtype=bool)
+    good[0, 1, 0] = False
+    # A flagged sample with a huge value must not leak into the sum.
+    values[0, 1, 0] = 1e6
+
+    sums, counts = channel_sums(values, good, 2)
+
+    assert sums.shape == counts.shape == (2, 3, 1)
+    np.testing.assert_array_equal(counts[..., 0], [[1, 2, 1], [2, 2, 1]])
+
+    means = finish_mean(sums, counts)
+    np.testing.assert_allclose(means[..., 0], [[0., 2.5, 4.], [5.5, 7.5, 9.]])
+
+
+def test_channel_sums_complex():
+
+    values = np.exp(1j * np.deg2rad([[[10.], [30.]]]))
+    good = np.ones(values.shape, dtype=bool)
+
+    sums, counts = channel_sums(values, good, 2)
+
+    assert np.iscomplexobj(sums)
+    np.testing.assert_allclose(np.rad2deg(np.angle(sums[0, 0, 0])), 20.)
+
+
+def test_finish_mean_all_flagged():
+
+    values = np.ones((1, 4, 2))
+    good = np.ones_like(values, dtype=bool)
+    good[0, :2, 1] = False
+
+    sums, counts = channel_sums(values, good, 2)
+
+    means = finish_mean(sums, counts)
+
+    assert np.isnan(means[0, 0, 1])
+    np.testing.assert_allclose(means[0, 1], 1.)
+    np.testing.assert_allclose(means[0, :, 0], 1.)
+
+
+def test_channel_bin_centers():
+
+    np.testing.assert_allclose(channel_bin_centers(np.arange(5), 2), [0.5, 2.5, 4.])
+
+
+def test_group_sums():
+
+    keys = [np.array([1, 0, 1, 0]), np.array([2, 2, 2, 3])]
+    vis = np.array([1 + 1j, 2., 3 - 1j, 4.])
+    counts = np.array([1., 1., 1., 1.])
+
+    out_keys, (vis_sum, count_sum), first = group_sums(keys, [vis, counts],
+                                                       return_first=True)
+
+    np.testing.assert_array_equal(out_keys[0], [0, 0, 1])
+    np.testing.assert_array_equal(out_keys[1], [2, 3, 2])
+    np.testing.assert_allclose(vis_sum, [2., 4., 4.])
+    np.testing.assert_allclose(count_sum, [1., 1., 2.])
+    np.testing.assert_array_equal(first, [1, 3, 0])
+
+
+def test_circular_mean_deg_wrap():
+
+    phases = np.array([170., -170., 175., -165., 10., 20.])
+    group_ids = np.array([0, 0, 1, 1, 2, 2])
+
+    unique_ids, means = circular_mean_deg(phases, group_ids)
+
+    np.testing.assert_array_equal(unique_ids, [0, 1, 2])
+    # The mean of 170 and -170 is 180, not 0.
+    np.testing.assert_allclose(np.abs(means[0]), 180., atol=1e-8)
+    np.testing.assert_allclose(means[1], -175., atol=1e-8)
+    np.testing.assert_allclose(means[2], 15., atol=1e-8)
+
+
+def test_vector_vs_scalar_average():
+
+    # Opposite phases cancel in the vector average but not the scalar one.
+    vis = np.array([[[1 + 0j], [-1 + 0j], [2j], [2j]]])
+    good = np.ones(vis.shape, dtype=bool)
+
+    vec_sums, counts = channel_sums(vis, good, 2)
+    amp, phase = vector_amp_phase(vec_sums, counts)
+
+    np.testing.assert_allclose(amp[0, :, 0], [0., 2.], atol=1e-12)
+    np.testing.assert_allclose(phase[0, 1, 0], 90.)
+
+    scalar_sums, counts = scalar_channel_sums(vis, good, 2)
+    np.testing.assert_allclose(finish_mean(scalar_sums, counts)[0, :, 0], [1., 2.])
+
+
+def test_time_bin_ids_scan_and_interval():
+
+    times = np.array([0., 10., 20., 30., 100., 110., 125.])
+    scans = np.array([1, 1, 1, 1, 2, 2, 2])
+
+    np.testing.assert_array_equal(time_bin_ids(times, scans), [0, 0, 0, 0, 1, 1, 1])
+
+    # 20 s bins starting at the first time of each scan.
+    np.testing.assert_array_equal(time_bin_ids(times, scans, interval=20.),
+                                  [0, 0, 1, 1, 2, 2, 3])
+
+    # Without scans, all rows are one scan.
+    np.testing.assert_array_equal(time_bin_ids(times, interval=60.),
+                                  [0, 0, 0, 0, 1, 1, 2])
+
+
+def test_baseline_sums():
+
+    # 3 baselines at two integrations, 1 bin, 1 corr.
+    sums = np.arange(6, dtype=float).reshape(6, 1, 1)
+    counts = np.array([2, 2, 0, 1, 1, 1]).reshape(6, 1, 1)
+    times = np.array([5., 5., 5., 7., 7., 7.])
+
+    unique_times, time_sums, time_counts = baseline_sums(sums, counts, times)
+
+    np.testing.assert_array_equal(unique_times, [5., 7.])
+    np.testing.assert_allclose(time_sums[:, 0, 0], [3., 12.])
+    np.testing.assert_array_equal(time_counts[:, 0, 0], [4, 3])
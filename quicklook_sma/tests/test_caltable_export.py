@@ -0,0 +1,79 @@
+import numpy as np
+
+from quicklook_sma.export_casa_tables.caltable_export import (caltable_columns,
+                                                              receptor_names,
+                                                              iteration_values)
+from quicklook_sma.export_casa_tables.ms_export import TXT_COLNAMES
+
+
+BP_VALUES = {'x': 'freq', 'y': 'phase', 'iter': 'spw'}
+
+
+def _cal_data(num_pol=2, num_chan=3, num_ant=4, pol_names=['X', 'Y']):
+
+    spw_data = {}
+
+    for spw in range(2):
+        # Phase of 10 deg for the first pol and -20 deg for the second.
+        phases = np.deg2rad([10., -20.][:num_pol])
+        cparam = np.exp(1j * phases)[:, None, None] * np.ones((num_pol, num_chan, num_ant))
+
+        flag = np.zeros((num_pol, num_chan, num_ant), dtype=bool)
+        # Flag the second pol of the first antenna.
+        flag[-1, :, 0] = True
+
+        spw_data[spw] = {'TIME': np.full(num_ant, 5.0e9),
+                         'FIELD_ID': np.zeros(num_ant, dtype=int),
+                         'SCAN_NUMBER': np.ones(num_ant, dtype=int),
+                         'OBSERVATION_ID': np.zeros(num_ant, dtype=int),
+                         'ANTENNA1': np.arange(num_ant),
+                         'ANTENNA2': np.full(num_ant, -1),
+                         'FLAG': flag,
+                         'CPARAM': cparam}
+
+    return {'spw': spw_data,
+            'param': 'CPARAM',
+            'chan_freq': {spw: 230e9 + spw * 1e9 + np.arange(num_chan) * 1e6
+                          for spw in spw_data},
+            'ant_names': np.array([f"ant{ii}" for ii in range(num_ant)]),
+            'pol_names': pol_names}
+
+
+def test_receptor_names():
+    assert receptor_names(['XX', 'YY']) == ['X', 'Y']
+    assert receptor_names(['RR', 'RL', 'LR', 'LL']) == ['R', 'L']
+    assert receptor_names(['I']) == []
+
+
+def test_caltable_columns_corr_names():
+
+    cal_data = _cal_data()
+
+    assert iteration_values(cal_data, 'spw') == [0, 1]
+    assert iteration_values(cal_data, 'ant') == [0, 1, 2, 3]
+
+    columns = caltable_columns(cal_data, BP_VALUES, 1)
+
+    assert list(columns) == TXT_COLNAMES
+
+    # 4 antennas x 3 channels x 2 pols, less the flagged pol of antenna 0.
+    assert len(columns['y']) == 4 * 3 * 2 - 3
+    assert np.all(columns['spw'] == 1)
+
+    assert set(columns['corr']) == {'X', 'Y'}
+    np.testing.assert_allclose(columns['y'][columns['corr'] == 'X'], 10.)
+    np.testing.assert_allclose(columns['y'][columns['corr'] == 'Y'], -20.)
+
+    assert not np.any((columns['ant1'] == 0) & (columns['corr'] == 'Y'))
+    assert np.all(columns['ant2name'] == '*')
+
+
+def test_caltable_columns_no_pol_names():
+
+    cal_data = _cal_data(pol_names=[])
+
+    columns = caltable_columns(cal_data, {'x': 'time', 'y': 'amp', 'iter': 'ant'}, 2)
+
+    assert set(columns['corr']) == {'0', '1'}
+    np.testing.assert_allclose(columns['y'], 1.)
+    np.testing.assert_array_equal(columns['x'], columns['time'])
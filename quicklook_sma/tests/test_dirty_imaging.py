@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from quicklook_sma.dirty_imaging import compute_dirty_image, dirty_image_to_fits, fit_beam
+from quicklook_sma.export_casa_tables.ms_export import DictTableBackend
+from quicklook_sma.tests.synthetic import make_synthetic_ms
+
+
+FLUX = 1.5
+# Source offset east and north of the phase centre.
+OFFSET = (4., 3.)
+
+CELL = 0.5
+IMSIZE = 64
+
+
+@pytest.fixture(scope='module')
+def point_source_ms():
+    main, subtables = make_synthetic_ms(num_ant=8, num_scans=6, times_per_scan=20,
+                                        num_chan=16, flux=FLUX, offset_arcsec=OFFSET,
+                                        integration=120.)
+    return DictTableBackend(main, subtables)
+
+
+def _beam_area(beam):
+    return beam[0] * beam[1]
+
+
+def test_point_source_weightings(point_source_ms):
+
+    centre = IMSIZE // 2
+
+    beams = {}
+
+    for weighting, robust in [('natural', 0.), ('briggs', 2.), ('briggs', 0.),
+                              ('uniform', 0.)]:
+
+        image, psf, ref_freq = compute_dirty_image(point_source_ms, 1, [0, 1], CELL, IMSIZE,
+                                                   weighting=weighting, robust=robust,
+                                                   chunk_rows=500)
+
+        # The peak of a point source is its flux for any weighting.
+        yy, xx = np.unravel_index(np.argmax(image), image.shape)
+        np.testing.assert_allclose(image[yy, xx], FLUX, rtol=1e-3)
+
+        # RA increases to the left.
+        assert xx == centre - OFFSET[0] / CELL
+        assert yy == centre + OFFSET[1] / CELL
+
+        np.testing.assert_allclose(psf[centre, centre], 1., rtol=1e-4)
+        assert 230e9 < ref_freq < 230e9 + 64 * 2e6
+
+        beams[(weighting, robust)] = fit_beam(psf, CELL)
+
+    # Uniform weighting gives the smallest beam and Briggs sits between
+    # uniform and natural. A large robust value is close to natural.
+    assert (_beam_area(beams[('uniform', 0.)]) < _beam_area(beams[('briggs', 0.)]) <
+            _beam_area(beams[('natural', 0.)]))
+    np.testing.assert_allclose(beams[('briggs', 2.)], beams[('natural', 0.)], rtol=0.02)
+
+
+@pytest.mark.parametrize('bpa', [30., -60.])
+def test_fit_beam(bpa):
+
+    bmaj, bmin = 3., 2.
+    cell = 0.2
+    size = 64
+    centre = size // 2
+
+    yy, xx = np.mgrid[:size, :size]
+    east = -(xx - centre) * cell
+    north = (yy - centre) * cell
+
+    # Offsets along the major and minor axes.
+    pa = np.deg2rad(bpa)
+    major = east * np.sin(pa) + north * np.cos(pa)
+    minor = east * np.cos(pa) - north * np.sin(pa)
+
+    to_sigma = 2 * np.sqrt(2 * np.log(2))
+    psf = np.exp(-0.5 * ((major / (bmaj / to_sigma))**2 + (minor / (bmin / to_sigma))**2))
+
+    fit = fit_beam(psf, cell)
+
+    np.testing.assert_allclose(fit[:2], (bmaj, bmin), rtol=1e-3)
+    np.testing.assert_allclose(fit[2], bpa, atol=0.1)
+
+
+def test_dirty_image_to_fits(point_source_ms, tmp_path):
+
+    from astropy.io import fits
+    from astropy.wcs import WCS
+    from astropy.coordinates import SkyCoord
+    import astropy.units as u
+
+    fitsname = str(tmp_path / "target.fits")
+
+    beam = dirty_image_to_fits('track.ms', 'target', '0~1', f'{CELL}arcsec', IMSIZE,
+                               fitsname, weighting='natural', backend=point_source_ms)
+
+    with fits.open(fitsname) as hdulist:
+        header = hdulist[0].header
+        image = hdulist[0].data[0, 0]
+
+    assert image.shape == (IMSIZE, IMSIZE)
+    assert header['OBJECT'] == 'target'
+    np.testing.assert_allclose(header['BMAJ'] * 3600., beam[0])
+
+    yy, xx = np.unravel_index(np.argmax(image), image.shape)
+    np.testing.assert_allclose(image[yy, xx], FLUX, rtol=1e-3)
+
+    # The peak is at the source position on the sky.
+    source = WCS(header).celestial.pixel_to_world(xx, yy)
+    phase_centre = SkyCoord(3.4 * u.rad, -0.1 * u.rad, frame=source.frame)
+
+    offsets = phase_centre.spherical_offsets_to(source)
+    np.testing.assert_allclose([offset.to_value(u.arcsec) for offset in offsets], OFFSET,
+                               atol=1e-3)
@@ -0,0 +1,28 @@
+import os
+
+from quicklook_sma.export_casa_tables.manifest import ms_stamp
+
+
+def test_ms_stamp_ignores_lock(tmp_path):
+
+    vis = tmp_path / "track.ms"
+    vis.mkdir()
+
+    for name in ["table.dat", "table.f0", "table.f1", "table.info", "table.lock"]:
+        (vis / name).write_text("")
+
+    os.utime(vis / "table.dat", ns=(1000, 1000))
+    os.utime(vis / "table.f0", ns=(3000, 3000))
+    os.utime(vis / "table.f1", ns=(2000, 2000))
+    os.utime(vis / "table.info", ns=(5000, 5000))
+    # Rewritten whenever casacore locks or unlocks the table.
+    os.utime(vis / "table.lock", ns=(9000, 9000))
+
+    stamp = ms_stamp(str(vis))
+
+    assert stamp['vis'] == str(vis)
+    assert stamp['modified_ns'] == 3000
+
+    # A change to the data files changes the stamp.
+    os.utime(vis / "table.f1", ns=(4000, 4000))
+    assert ms_stamp(str(vis))['modified_ns'] == 4000
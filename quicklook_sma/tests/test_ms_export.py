@@ -0,0 +1,268 @@
+import numpy as np
+import pytest
+
+from quicklook_sma.table_io import (open_table_text, make_meta_dict, read_txt_columns,
+                                    _read_header_lines)
+from quicklook_sma.export_casa_tables.ms_export import (DictTableBackend, compute_field_products,
+                                                         export_field_tables, TXT_COLNAMES)
+from quicklook_sma.export_casa_tables.qa_plot_tools import QA_TABLE_MAPPING
+from quicklook_sma.tests.synthetic import make_synthetic_ms
+
+
+NUM_ANT = 5
+NUM_BL = NUM_ANT * (NUM_ANT - 1) // 2
+NUM_SPW = 2
+NUM_CHAN = 32
+TIMES_PER_SCAN = 6
+
+YY_PHASE = 30.
+
+
+@pytest.fixture
+def synthetic_ms():
+    return make_synthetic_ms(num_ant=NUM_ANT, num_spw=NUM_SPW, num_chan=NUM_CHAN,
+                             times_per_scan=TIMES_PER_SCAN, flux=2.,
+                             corr_gains=[1., np.exp(1j * np.deg2rad(YY_PHASE))],
+                             model_scale=0.5, flag_frac=0.2)
+
+
+def _rows(columns, **selection):
+    keep = np.ones(len(columns['y']), dtype=bool)
+    for name, value in selection.items():
+        keep &= columns[name] == value
+    return keep
+
+
+def test_compute_field_products(synthetic_ms):
+
+    main, subtables = synthetic_ms
+    backend = DictTableBackend(main, subtables)
+
+    out = compute_field_products(backend, 0, QA_TABLE_MAPPING, chanavg_vs_time=16384,
+                                 chanavg_vs_chan=4, chunk_rows=37)
+
+    assert set(out) == set(QA_TABLE_MAPPING)
+
+    for columns in out.values():
+        assert list(columns) == TXT_COLNAMES
+        assert set(columns['corr']) == {'XX', 'YY'}
+        assert np.all(columns['field'] == 0)
+
+    # Field 0 is observed in scans 1 and 3.
+    num_scans = 2
+
+    # Per integration, averaged over baselines and all channels.
+    amp_time = out['amp_time']
+    assert len(amp_time['y']) == num_scans * TIMES_PER_SCAN * NUM_SPW * 2
+    np.testing.assert_allclose(amp_time['y'], 2., rtol=1e-5)
+    assert set(amp_time['x']) <= set(main['TIME'])
+    np.testing.assert_array_equal(amp_time['x'], amp_time['time'])
+    assert np.all(amp_time['ant1'] == -1)
+    assert np.all(amp_time['ant1name'] == '*')
+
+    phase_time = out['phase_time']
+    np.testing.assert_allclose(phase_time['y'][phase_time['corr'] == 'XX'], 0., atol=1e-3)
+    np.testing.assert_allclose(phase_time['y'][phase_time['corr'] == 'YY'], YY_PHASE,
+                               atol=1e-3)
+
+    # Per scan, averaged over baselines, in bins of 4 channels.
+    amp_chan = out['amp_chan']
+    num_bins = NUM_CHAN // 4
+    assert len(amp_chan['y']) == num_scans * num_bins * NUM_SPW * 2
+    assert set(amp_chan['scan']) == {1, 3}
+    np.testing.assert_array_equal(np.unique(amp_chan['chan']), 1.5 + 4 * np.arange(num_bins))
+    np.testing.assert_allclose(amp_chan['y'], 2., rtol=1e-5)
+
+    chan_freq = subtables['SPECTRAL_WINDOW']['CHAN_FREQ'][1]
+    these = _rows(amp_chan, spw=1, chan=1.5)
+    np.testing.assert_allclose(amp_chan['freq'][these], np.mean(chan_freq[:4]) / 1e9)
+
+    # Per scan and baseline.
+    amp_uvdist = out['amp_uvdist']
+    assert len(amp_uvdist['y']) == num_scans * NUM_BL * NUM_SPW * 2
+
+    # The uv-distance is weighted by the unflagged channels of each row.
+    in_row = ((main['FIELD_ID'] == 0) & (main['SCAN_NUMBER'] == 3) &
+              (main['DATA_DESC_ID'] == 1) & (main['ANTENNA1'] == 1) & (main['ANTENNA2'] == 3))
+    counts = (~main['FLAG'][1][:, in_row]).sum(axis=0)
+    uvdist = np.hypot(main['UVW'][0, in_row], main['UVW'][1, in_row])
+
+    these = _rows(amp_uvdist, scan=3, spw=1, ant1=1, ant2=3, corr='YY')
+    assert these.sum() == 1
+    np.testing.assert_allclose(amp_uvdist['x'][these], np.sum(uvdist * counts) / counts.sum())
+    assert amp_uvdist['ant1name'][these][0] == 'ant1'
+    assert amp_uvdist['ant2name'][these][0] == 'ant3'
+
+    # |corrected| - |model| with the model at half the flux.
+    np.testing.assert_allclose(out['ampresid_uvwave']['y'], 1., rtol=1e-5)
+
+    amp_ant1 = out['amp_ant1']
+    np.testing.assert_array_equal(amp_ant1['x'], amp_ant1['ant1'])
+
+
+def test_compute_field_products_all_flagged(synthetic_ms):
+
+    main, subtables = synthetic_ms
+
+    # Flag all of SPW 1 in scan 3.
+    main['FLAG'][..., (main['SCAN_NUMBER'] == 3) & (main['DATA_DESC_ID'] == 1)] = True
+
+    backend = DictTableBackend(main, subtables)
+
+    products = {key: QA_TABLE_MAPPING[key] for key in ['amp_time', 'amp_chan']}
+
+    out = compute_field_products(backend, 0, products, chanavg_vs_chan=4)
+
+    for columns in out.values():
+        assert not np.any(_rows(columns, scan=3, spw=1))
+        assert np.any(_rows(columns, scan=3, spw=0))
+        assert np.all(np.isfinite(columns['y']))
+
+
+def _read_txt(filename):
+
+    with open_table_text(filename) as f:
+        meta_dict = make_meta_dict(_read_header_lines(f, filename))
+        colnames = f.readline().lstrip("#").split()
+        units = f.readline().lstrip("#").split()
+        columns = read_txt_columns(f, colnames)
+
+    return columns, meta_dict, units
+
+
+@pytest.mark.parametrize('ext', ['txt', 'txt.gz'])
+def test_export_field_tables_txt(synthetic_ms, tmp_path, ext):
+
+    main, subtables = synthetic_ms
+    backend = DictTableBackend(main, subtables)
+
+    products = {key: QA_TABLE_MAPPING[key] for key in ['amp_time', 'phase_uvdist']}
+    filenames = {key: str(tmp_path / f"field_3c279_{key}.{ext}") for key in products}
+
+    export_field_tables(backend, 0, '3c279', products, filenames, chanavg_vs_chan=4,
+                        vis='track.ms')
+
+    expected = compute_field_products(backend, 0, products, chanavg_vs_chan=4)
+
+    for key in products:
+        columns, meta_dict, units = _read_txt(filenames[key])
+
+        assert list(columns) == TXT_COLNAMES
+        assert meta_dict['vis'] == 'track.ms'
+        assert meta_dict['field'] == '3c279'
+        assert meta_dict['avgchannel'] == '16384'
+
+        for name in TXT_COLNAMES:
+            if expected[key][name].dtype.kind in 'US':
+                np.testing.assert_array_equal(columns[name], expected[key][name])
+            else:
+                np.testing.assert_allclose(columns[name], expected[key][name],
+                                           rtol=1e-7, atol=1e-3)
+
+    assert _read_txt(filenames['amp_time'])[2][0] == 'MJD(seconds)'
+    assert _read_txt(filenames['phase_uvdist'])[2][:2] == ['m', 'deg']
+
+
+def test_compute_field_products_scan_stats(synthetic_ms):
+
+    from quicklook_sma.export_casa_tables.ms_export import SCAN_STATS_KEY
+    from quicklook_sma.export_casa_tables.scan_stats import SCAN_STATS_COLNAMES
+
+    main, subtables = synthetic_ms
+    backend = DictTableBackend(main, subtables)
+
+    products = {'amp_time': QA_TABLE_MAPPING['amp_time']}
+
+    # The partial statistics of the chunks are merged as they are read, so
+    # the result does not depend on the chunk size.
+    stats = compute_field_products(backend, 0, products, chunk_rows=37,
+                                   scan_stats=True)[SCAN_STATS_KEY]
+    stats_one = compute_field_products(backend, 0, products, chunk_rows=10**6,
+                                       scan_stats=True)[SCAN_STATS_KEY]
+
+    assert list(stats) == SCAN_STATS_COLNAMES
+
+    # 2 scans, 2 SPWs, 2 corrs and all antennas.
+    assert len(stats['scan']) == 2 * NUM_SPW * 2 * NUM_ANT
+    assert set(stats['scan']) == {1, 3}
+
+    for name in SCAN_STATS_COLNAMES:
+        if stats[name].dtype.kind in 'US':
+            np.testing.assert_array_equal(stats[name], stats_one[name])
+        else:
+            np.testing.assert_allclose(stats[name], stats_one[name])
+
+    # Each antenna is in NUM_ANT - 1 baselines.
+    np.testing.assert_array_equal(stats['npts'], TIMES_PER_SCAN * (NUM_ANT - 1))
+
+    np.testing.assert_allclose(stats['amp_median'], 2., rtol=1e-5)
+    np.testing.assert_allclose(stats['amp_min'], 2., rtol=1e-5)
+    np.testing.assert_allclose(stats['phase_median'][stats['corr'] == 'YY'], YY_PHASE,
+                               atol=1e-3)
+    assert np.all((stats['flag_frac'] > 0.) & (stats['flag_frac'] < 0.5))
+    assert np.all(stats['time_min'] <= stats['time_max'])
+
+
+def test_scan_stats_sample_cap():
+
+    from quicklook_sma.export_casa_tables.scan_stats import (partial_scan_stats,
+                                                             merge_scan_stats,
+                                                             reduce_scan_stats)
+
+    rng = np.random.default_rng(1)
+
+    def chunk(num):
+        samples = {'scan': np.ones(num, dtype=int),
+                   'ant': np.zeros(num, dtype=int),
+                   'corr': np.zeros(num, dtype=int),
+                   'amp': rng.uniform(0., 2., num),
+                   'phase': rng.uniform(-10., 10., num)}
+        flags = {'scan': np.ones(num, dtype=int),
+                 'ant': np.zeros(num, dtype=int),
+                 'corr': np.zeros(num, dtype=int),
+                 'time': np.arange(num, dtype=float),
+                 'nflag': np.zeros(num),
+                 'ntotal': np.ones(num)}
+        return samples, flags
+
+    stats = None
+    for _ in range(5):
+        partial = partial_scan_stats(*chunk(4000), 2, 1, max_samples=500, rng=rng)
+        stats = partial if stats is None else merge_scan_stats([stats, partial],
+                                                               max_samples=500)
+
+    # Only the capped number of samples is held.
+    assert len(stats['samples']['amp']) == 500
+
+    reduced = reduce_scan_stats(stats, 2, 1)
+
+    # The counts and extremes are exact, the median is from the subset.
+    assert reduced['npts'][0] == 20000
+    assert reduced['amp_min'][0] < 0.01
+    assert reduced['amp_max'][0] > 1.99
+    np.testing.assert_allclose(reduced['amp_median'][0], 1., atol=0.15)
+    np.testing.assert_allclose(reduced['phase_median'][0], 0., atol=1.5)
+
+
+def test_compute_field_products_memory_flat():
+
+    import tracemalloc
+
+    # Baseline-averaged products, so the output size does not change with
+    # the number of baselines while the rows read do.
+    products = {key: QA_TABLE_MAPPING[key] for key in ['amp_time', 'amp_chan']}
+
+    peaks = []
+
+    for num_ant in [6, 24]:
+        main, subtables = make_synthetic_ms(num_ant=num_ant, num_spw=1, num_chan=256,
+                                            times_per_scan=10)
+        backend = DictTableBackend(main, subtables)
+
+        tracemalloc.start()
+        compute_field_products(backend, 0, products, chanavg_vs_chan=1, chunk_rows=100)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    # ~18x more rows, but the memory only follows chunk_rows.
+    assert peaks[1] < 1.2 * peaks[0]
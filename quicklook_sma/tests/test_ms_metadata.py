@@ -0,0 +1,52 @@
+import numpy as np
+
+from quicklook_sma.export_casa_tables.ms_export import DictTableBackend
+from quicklook_sma.ms_metadata import (compute_ms_metadata, compute_flag_digests,
+                                       flag_row_summary)
+from quicklook_sma.tests.synthetic import make_synthetic_ms
+
+
+def _backend(flag_frac=0.1):
+
+    main, subtables = make_synthetic_ms(num_ant=4, num_scans=4, num_chan=16,
+                                        flag_frac=flag_frac)
+    main['STATE_ID'] = np.zeros(len(main['TIME']), dtype=np.int64)
+
+    return main, DictTableBackend(main, subtables)
+
+
+def test_flag_row_summary():
+
+    # 1 corr, 4 chans, 3 rows.
+    flags = np.zeros((1, 4, 3), dtype=bool)
+    flags[0, 1:3, 1] = True
+    flags[0, 3, 2] = True
+
+    np.testing.assert_array_equal(flag_row_summary(flags),
+                                  [[0, 0, 3], [2, 1, 2], [1, 3, 3]])
+
+
+def test_flag_digests_in_metadata_pass():
+
+    main, backend = _backend()
+
+    metadata = compute_ms_metadata(backend, chunk_rows=7, flag_digests=True)
+    digests = metadata.pop('flag_digests')
+
+    assert metadata == compute_ms_metadata(backend)
+    assert sorted(digests) == ['0:0', '0:1', '1:0', '1:1']
+
+    # Independent of the chunk size.
+    assert compute_flag_digests(backend, chunk_rows=1000) == digests
+
+    # Flagging one more channel of one row of field 1 only changes its
+    # digest for that data description.
+    row = np.flatnonzero((main['FIELD_ID'] == 1) & (main['DATA_DESC_ID'] == 0))[0]
+    chan = np.flatnonzero(~main['FLAG'][0, :, row])[0]
+    main['FLAG'][0, chan, row] = True
+
+    new_digests = compute_flag_digests(backend)
+
+    assert new_digests['1:0'] != digests['1:0']
+    assert {key: val for key, val in new_digests.items() if key != '1:0'} == \
+        {key: val for key, val in digests.items() if key != '1:0'}
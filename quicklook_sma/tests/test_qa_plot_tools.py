@@ -0,0 +1,63 @@
+import os
+
+from quicklook_sma.export_casa_tables.manifest import ExportManifest
+from quicklook_sma.export_casa_tables.qa_plot_tools import (_finish_job, _remove_old_output,
+                                                            _plotms_succeeded)
+
+
+class _Log(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def post(self, message, origin=None):
+        self.messages.append(message)
+
+
+def test_failed_export_not_recorded(tmp_path):
+
+    filename = str(tmp_path / "field_3c279_amp_time.txt.gz")
+    plotfile = filename + ".tmp.txt"
+    params = {'table': 'amp_time', 'ms_modified_ns': 1}
+
+    # An old export, recorded in the manifest, and a leftover plotms file.
+    with open(filename, 'w') as f:
+        f.write("old")
+    with open(plotfile, 'w') as f:
+        f.write("partial")
+
+    manifest = ExportManifest(str(tmp_path))
+    manifest.record(filename, params)
+    assert manifest.is_current(filename, params)
+
+    # Re-export with new params. The entry is dropped first, as in
+    # `make_qa_tables`, then the old output is removed before plotms runs.
+    new_params = dict(params, ms_modified_ns=2)
+    manifest.remove(filename)
+    _remove_old_output(filename)
+
+    assert not os.path.exists(filename)
+    assert not os.path.exists(plotfile)
+
+    # plotms returns False on failure and writes nothing.
+    assert not _plotms_succeeded(False, plotfile)
+
+    job = {'filenames': {'amp_time': filename}, 'params': {'amp_time': new_params}}
+    casalog = _Log()
+    _finish_job(casalog, manifest, job, ([("plotms failed", 'make_qa_tables')], []))
+
+    assert casalog.messages == ["plotms failed"]
+    assert not manifest.is_current(filename, new_params)
+    assert not manifest.is_current(filename, params)
+    assert ExportManifest(str(tmp_path)).entries == {}
+
+    # A successful export is recorded.
+    with open(filename, 'w') as f:
+        f.write("new")
+
+    assert _plotms_succeeded(True, filename)
+    # Only an explicit False counts as a failure.
+    assert _plotms_succeeded(None, filename)
+
+    _finish_job(casalog, manifest, job, ([], ['amp_time']))
+    assert ExportManifest(str(tmp_path)).is_current(filename, new_params)
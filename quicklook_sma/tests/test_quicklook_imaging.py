@@ -0,0 +1,33 @@
+import os
+
+from quicklook_sma.quicklook_imaging import imaging_fingerprint
+
+
+def test_imaging_fingerprint_follows_ms_writes(tmp_path):
+
+    vis = tmp_path / "track.ms"
+    vis.mkdir()
+    for name in ["table.dat", "table.f0"]:
+        (vis / name).write_text("")
+        os.utime(vis / name, ns=(1000, 1000))
+
+    job = {'vis': str(vis), 'field': 'target', 'spw': '0~1', 'cell': '0.5arcsec',
+           'imsize': [256, 256], 'niter': 0, 'nsigma': 3., 'nmajor': 1,
+           'pblimit': 0.5, 'export_fits': True, 'engine': 'tclean'}
+
+    metadata = {'fields': {'names': ['target']}, 'spws': {'ddid_spw': [0, 1]}}
+    flag_digests = {'0:0': 'a', '0:1': 'b'}
+
+    fingerprint = imaging_fingerprint(job, flag_digests, metadata)
+
+    assert imaging_fingerprint(job, flag_digests, metadata) == fingerprint
+
+    # E.g., applycal rewriting CORRECTED_DATA with the same flags.
+    os.utime(vis / "table.f0", ns=(2000, 2000))
+
+    assert imaging_fingerprint(job, flag_digests, metadata) != fingerprint
+
+    # A flag change also changes it.
+    new_fingerprint = imaging_fingerprint(job, flag_digests, metadata)
+    assert imaging_fingerprint(job, dict(flag_digests, **{'0:1': 'c'}),
+                               metadata) != new_fingerprint
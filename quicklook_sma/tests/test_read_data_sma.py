@@ -0,0 +1,255 @@
+import numpy as np
+import pytest
+
+from quicklook_sma.read_data_sma import read_casa_txt
+from quicklook_sma.tests.synthetic import make_plotms_txt
+
+
+@pytest.mark.parametrize('num_rows', [1, 2500])
+def test_read_casa_txt_engines_match(tmp_path, num_rows):
+
+    filename = str(tmp_path / "field_3c279_amp_time.txt")
+    make_plotms_txt(filename, num_rows)
+
+    tab_np, meta_np = read_casa_txt(filename, engine='numpy', use_cache=False)
+    tab_ap, meta_ap = read_casa_txt(filename, engine='astropy', use_cache=False)
+
+    assert meta_np == meta_ap
+    assert meta_np['field'] == '3c279'
+    assert meta_np['scan'] == ''
+
+    assert tab_np.colnames == tab_ap.colnames
+    assert len(tab_np) == len(tab_ap) == num_rows
+
+    for name in tab_np.colnames:
+        assert tab_np[name].dtype.kind == tab_ap[name].dtype.kind, name
+        np.testing.assert_array_equal(tab_np[name], tab_ap[name])
+
+    assert tab_np['corr'].dtype.kind == 'U'
+    assert set(tab_np['corr']) <= {'XX', 'YY'}
+    assert tab_np['scan'].dtype.kind == 'i'
+
+
+def test_read_casa_txt_engines_match_gz(tmp_path):
+
+    txt_name = str(tmp_path / "field_3c279_amp_time.txt")
+    gz_name = txt_name + ".gz"
+
+    make_plotms_txt(txt_name, 500)
+    make_plotms_txt(gz_name, 500)
+
+    tab_txt = read_casa_txt(txt_name, engine='numpy', use_cache=False)[0]
+    tab_gz = read_casa_txt(gz_name, engine='astropy', use_cache=False)[0]
+
+    for name in tab_txt.colnames:
+        np.testing.assert_array_equal(tab_txt[name], tab_gz[name])
+
+
+def test_downsampled_mean_keeps_ids(tmp_path):
+
+    from quicklook_sma.read_data_sma import read_casa_txt_downsampled
+
+    filename = str(tmp_path / "field_3c279_phase_time.txt")
+    # One baseline and SPW so each bin averages many rows.
+    columns = make_plotms_txt(filename, 20000, yaxis='phase', num_ant=2, num_spw=1,
+                              num_scan=4)
+
+    tab = read_casa_txt_downsampled(filename, 2000, method='mean', chunk_rows=5000,
+                                    phase_cols=['y'])[0]
+
+    assert tab.meta['downsample']['factor'] > 1
+    assert len(tab) <= 2000 + 4 * 2 * 4
+
+    for name in ['scan', 'ant1', 'ant2', 'spw', 'obs']:
+        assert tab[name].dtype.kind == 'i', name
+        assert set(tab[name]) <= set(columns[name])
+
+    # Bins do not cross a scan, so the mean times stay inside the scan.
+    for scan in set(tab['scan']):
+        scan_times = columns['time'][columns['scan'] == scan]
+        out_times = tab['time'][tab['scan'] == scan]
+        assert out_times.min() >= scan_times.min()
+        assert out_times.max() <= scan_times.max()
+
+    # The phases are all close to +/-180 deg. A linear mean would give
+    # values near 0.
+    assert np.all(np.abs(tab['y']) > 150.)
+
+    tab_linear = read_casa_txt_downsampled(filename, 2000, method='mean',
+                                           chunk_rows=5000)[0]
+    assert np.any(np.abs(tab_linear['y']) < 150.)
+
+
+def test_downsampled_mean_npz(tmp_path):
+
+    from quicklook_sma.read_data_sma import read_casa_txt_downsampled
+    from quicklook_sma.table_io import write_npz_table
+    from quicklook_sma.tests.synthetic import synthetic_plotms_columns
+
+    columns = synthetic_plotms_columns(5000, yaxis='phase', num_ant=2, num_spw=1)
+
+    filename = str(tmp_path / "field_3c279_phase_time.npz")
+    write_npz_table(filename, columns, {'field': '3c279'})
+
+    tab = read_casa_txt_downsampled(filename, 500, method='mean', phase_cols=['y'])[0]
+
+    assert tab['scan'].dtype.kind == 'i'
+    assert np.all(np.abs(tab['y']) > 150.)
+
+
+def test_find_field_names(tmp_path):
+
+    from quicklook_sma.read_data_sma import find_field_names
+
+    for name in ["field_3c279_amp_time.txt", "field_3c279_phase_time.txt.gz",
+                 "field_my_target_amp_chan.npz", "field_my_target_amp_uvdist.npz",
+                 "field_other_ampresid_uvwave.txt.zst",
+                 # Not per-field QA tables.
+                 "field_skipped_scan_stats.npz", "export_manifest.json",
+                 "field_skipped_amp_time.json"]:
+        (tmp_path / name).write_text("")
+
+    assert find_field_names(str(tmp_path)) == ['3c279', 'my_target', 'other']
+
+
+def test_read_field_data_tables_gz(tmp_path):
+
+    from quicklook_sma.read_data_sma import find_field_names, read_field_data_tables
+    from quicklook_sma.target_summary_plots import target_summary_amptime_figure
+    from quicklook_sma.export_casa_tables.ms_export import (DictTableBackend,
+                                                             export_field_tables)
+    from quicklook_sma.export_casa_tables.qa_plot_tools import QA_TABLE_MAPPING
+    from quicklook_sma.tests.synthetic import make_synthetic_ms
+
+    main, subtables = make_synthetic_ms(model_scale=0.5)
+    backend = DictTableBackend(main, subtables)
+
+    # Only gzipped tables in the folder.
+    for field_id, field_name in enumerate(['3c279', 'target']):
+        filenames = {key: str(tmp_path / f"field_{field_name}_{key}.txt.gz")
+                     for key in QA_TABLE_MAPPING}
+        export_field_tables(backend, field_id, field_name, QA_TABLE_MAPPING, filenames,
+                            chanavg_vs_chan=4, vis='track.ms')
+
+    assert find_field_names(str(tmp_path)) == ['3c279', 'target']
+
+    table_dict, meta_dict = read_field_data_tables('target', str(tmp_path))
+
+    assert set(table_dict) == set(QA_TABLE_MAPPING)
+    assert meta_dict['amp_time']['field'] == 'target'
+    assert len(table_dict['amp_time']) > 0
+
+    fig = target_summary_amptime_figure(['target'], str(tmp_path),
+                                        amp_time_tables={'target': table_dict['amp_time']})
+    # 2 SPWs and 2 corrs.
+    assert len(fig.data) == 4
+
+    # Without the loaded tables, they are read from the folder.
+    fig_folder = target_summary_amptime_figure(['target'], str(tmp_path))
+    assert [trace.name for trace in fig_folder.data] == [trace.name for trace in fig.data]
+
+    # Re-binned on read: 32 channels in bins of 4, then 2 per bin.
+    rebinned, _ = read_field_data_tables('target', str(tmp_path), chanavg=2, timebin='scan')
+
+    assert len(rebinned['amp_chan']) == len(table_dict['amp_chan']) // 2
+    assert rebinned['amp_chan'].meta['chanavg'] == 2
+    assert len(rebinned['amp_time']) == len(np.unique(table_dict['amp_time']['scan'])) * 4
+    assert len(rebinned['amp_uvdist']) == len(table_dict['amp_uvdist'])
+
+
+@pytest.mark.parametrize('ext', ['txt', 'npz'])
+def test_read_field_data_tables_lazy(tmp_path, ext):
+
+    from quicklook_sma.read_data_sma import read_field_data_tables, LazyTableDict
+    from quicklook_sma.table_io import write_npz_table
+    from quicklook_sma.tests.synthetic import synthetic_plotms_columns, write_plotms_txt
+
+    for ii, tab_type in enumerate(['amp_time', 'amp_chan', 'amp_uvdist']):
+        filename = str(tmp_path / f"field_3c279_{tab_type}.{ext}")
+        columns = synthetic_plotms_columns(100 * (ii + 1), seed=ii)
+        if ext == 'npz':
+            write_npz_table(filename, columns, {'field': '3c279'})
+        else:
+            write_plotms_txt(filename, columns)
+
+    table_dict, meta_dict = read_field_data_tables('3c279', str(tmp_path), lazy=True)
+
+    assert isinstance(table_dict, LazyTableDict)
+
+    # The keys and headers come without reading any table.
+    assert sorted(table_dict) == ['amp_chan', 'amp_time', 'amp_uvdist']
+    assert len(table_dict) == 3
+    assert 'amp_chan' in table_dict
+    assert meta_dict['amp_time']['field'] == '3c279'
+    assert table_dict.loaded == []
+
+    # Only the indexed table is read.
+    assert len(table_dict['amp_chan']) == 200
+    assert table_dict.loaded == ['amp_chan']
+
+    table_dict.load()
+    assert sorted(table_dict.loaded) == ['amp_chan', 'amp_time', 'amp_uvdist']
+
+    table_dict.release('amp_time')
+    assert 'amp_time' not in table_dict.loaded
+
+    table_dict.release()
+    assert table_dict.loaded == []
+
+
+def test_lazy_table_dict_reads_on_access():
+
+    from quicklook_sma.read_data_sma import LazyTableDict
+
+    calls = []
+
+    def read_func(key):
+        def func():
+            calls.append(key)
+            return key.upper(), {}
+        return func
+
+    table_dict = LazyTableDict({key: read_func(key) for key in ['a', 'b']})
+
+    assert list(table_dict) == ['a', 'b']
+    assert calls == []
+
+    assert table_dict['a'] == 'A'
+    assert table_dict['a'] == 'A'
+    assert calls == ['a']
+
+    # Without keep_tables, every access reads again.
+    table_dict = LazyTableDict({key: read_func(key) for key in ['a', 'b']},
+                               keep_tables=False)
+    table_dict['b']
+    table_dict['b']
+    assert calls == ['a', 'b', 'b']
+    assert table_dict.loaded == []
+
+
+def test_rebin_table_channels_and_time():
+
+    from astropy.table import Table
+
+    from quicklook_sma.read_data_sma import rebin_table_channels, rebin_table_time
+
+    tab = Table({'x': np.arange(8, dtype=float),
+                 'y': np.array([170., -170., 10., 20., 170., -170., 10., 20.]),
+                 'chan': np.arange(8) % 4,
+                 'time': np.array([0., 0., 0., 0., 40., 40., 40., 40.]),
+                 'scan': np.ones(8, dtype=int),
+                 'corr': np.full(8, 'XX')})
+
+    chan_tab = rebin_table_channels(tab, 2, phase_cols=['y'])
+
+    assert len(chan_tab) == 2
+    assert chan_tab.meta['chanavg'] == 2
+    np.testing.assert_allclose(np.abs(chan_tab['y']), [180., 15.], atol=1e-8)
+    np.testing.assert_allclose(chan_tab['chan'], [0.5, 2.5])
+
+    scan_tab = rebin_table_time(tab)
+    assert len(scan_tab) == 4
+    np.testing.assert_allclose(scan_tab['time'], 20.)
+
+    # 30 s bins keep the two integrations apart.
+    assert len(rebin_table_time(tab, interval=30.)) == 8
@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+from astropy.table import Table
+
+from quicklook_sma import table_cache
+
+
+def _write_txt(filename, size):
+    with open(filename, 'w') as f:
+        f.write("x" * size)
+
+
+def _table(num_rows=1000):
+    return Table([np.arange(num_rows, dtype=float), np.full(num_rows, 'XX')],
+                 names=['x', 'corr'])
+
+
+def test_cache_roundtrip_and_invalidation(tmp_path):
+
+    cache_dir = str(tmp_path / "cache")
+    filename = str(tmp_path / "field_a_amp_time.txt")
+    _write_txt(filename, 100)
+
+    tab = _table()
+    table_cache.save_cached_table(filename, tab, {'field': 'a'}, cache_dir=cache_dir)
+
+    cached_tab, meta = table_cache.load_cached_table(filename, cache_dir=cache_dir)
+
+    assert meta == {'field': 'a'}
+    np.testing.assert_array_equal(cached_tab['x'], tab['x'])
+    np.testing.assert_array_equal(cached_tab['corr'], tab['corr'])
+
+    # A touched file with the same size is treated as changed.
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert table_cache.load_cached_table(filename, cache_dir=cache_dir) is None
+
+
+def test_cache_same_size_and_mtime_rewrite(tmp_path):
+
+    cache_dir = str(tmp_path / "cache")
+    filename = str(tmp_path / "field_a_amp_time.txt")
+
+    # Larger than the two sampled blocks.
+    size = 3 * table_cache.SAMPLE_BLOCK_BYTES
+    _write_txt(filename, size)
+
+    table_cache.save_cached_table(filename, _table(), {}, cache_dir=cache_dir)
+    assert table_cache.load_cached_table(filename, cache_dir=cache_dir) is not None
+
+    stat = os.stat(filename)
+
+    # Rewrite the last rows with the same size and modification time.
+    with open(filename, 'w') as f:
+        f.write("x" * (size - 10) + "y" * 10)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert os.stat(filename).st_size == stat.st_size
+    assert table_cache.load_cached_table(filename, cache_dir=cache_dir) is None
+
+
+def test_cache_evicts_only_past_the_cap(tmp_path, monkeypatch):
+
+    cache_dir = str(tmp_path / "cache")
+
+    num_listings = []
+    list_entries = table_cache._list_entries
+
+    def counting_list_entries(this_dir):
+        num_listings.append(this_dir)
+        return list_entries(this_dir)
+
+    monkeypatch.setattr(table_cache, '_list_entries', counting_list_entries)
+    monkeypatch.setattr(table_cache, '_CACHE_SIZES', {})
+
+    tab = _table()
+    entry_size = sum(arr.nbytes for arr in [np.asarray(tab['x']), np.asarray(tab['corr'])])
+
+    # Room for ~10 entries.
+    max_size_mb = 10.5 * entry_size / 1024**2
+
+    for ii in range(10):
+        filename = str(tmp_path / f"field_{ii}_amp_time.txt")
+        _write_txt(filename, 10)
+        table_cache.save_cached_table(filename, tab, {}, cache_dir=cache_dir,
+                                      max_size_mb=max_size_mb)
+
+    # Only listed on the first save.
+    assert len(num_listings) == 1
+    assert len(os.listdir(cache_dir)) == 10
+    assert table_cache.cache_info(cache_dir)['num_entries'] == 10
+
+    filename = str(tmp_path / "field_10_amp_time.txt")
+    _write_txt(filename, 10)
+    table_cache.save_cached_table(filename, tab, {}, cache_dir=cache_dir,
+                                  max_size_mb=max_size_mb)
+
+    # Listed again to evict.
+    assert len(num_listings) == 3
+
+    info = table_cache.cache_info(cache_dir)
+
+    assert info['size_bytes'] <= table_cache.EVICT_TO_FRACTION * max_size_mb * 1024**2
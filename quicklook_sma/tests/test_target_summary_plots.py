@@ -0,0 +1,46 @@
+import numpy as np
+from astropy.table import Table
+
+from quicklook_sma.target_summary_plots import target_summary_amptime_figure
+from quicklook_sma.tests.synthetic import synthetic_plotms_columns
+
+
+def _tables():
+    return {field: Table(synthetic_plotms_columns(200, seed=seed, num_spw=2))
+            for seed, field in enumerate(['target1', 'target2'])}
+
+
+def test_target_summary_amptime_figure():
+
+    tables = _tables()
+
+    fig = target_summary_amptime_figure(['target1', 'target2'], 'unused',
+                                        corrs=['XX', 'YY', 'LL'],
+                                        amp_time_tables=tables)
+
+    # One trace per field, SPW and correlation with data.
+    assert [trace.name for trace in fig.data] == ['target1 SPW 0 XX', 'target1 SPW 0 YY',
+                                                  'target1 SPW 1 XX', 'target1 SPW 1 YY',
+                                                  'target2 SPW 0 XX', 'target2 SPW 0 YY',
+                                                  'target2 SPW 1 XX', 'target2 SPW 1 YY']
+
+    tab = tables['target1']
+    these = (tab['corr'] == 'XX') & (tab['spw'] == 0)
+    np.testing.assert_allclose(fig.data[0].y, tab['y'][these])
+
+
+def test_target_summary_amptime_figure_spw_dict():
+
+    spw_dict = {0: {'label': 'continuum'}, 1: {'label': 'CO(2-1)'}}
+
+    fig = target_summary_amptime_figure(['target1'], 'unused', corrs=['XX'],
+                                        spw_dict=spw_dict, amp_time_tables=_tables())
+
+    assert [trace.name for trace in fig.data] == ['target1 SPW 0 (continuum) XX',
+                                                  'target1 SPW 1 (CO(2-1)) XX']
+
+    fig = target_summary_amptime_figure(['target1'], 'unused', corrs=['XX'],
+                                        spw_dict=spw_dict, show_linesonly=True,
+                                        amp_time_tables=_tables())
+
+    assert [trace.name for trace in fig.data] == ['target1 SPW 1 (CO(2-1)) XX']
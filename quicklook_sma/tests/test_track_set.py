@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+
+from quicklook_sma.read_data_sma import find_field_names, read_field_data_tables
+from quicklook_sma.table_io import write_npz_table
+from quicklook_sma.export_casa_tables.ms_export import DictTableBackend, export_field_tables
+from quicklook_sma.export_casa_tables.qa_plot_tools import QA_TABLE_MAPPING
+from quicklook_sma.tests.synthetic import make_synthetic_ms
+
+
+CONFIG = """[SMA-Pipe]
+myvis = track.ms
+manual_flag_file = none
+restart_pipeline = False
+interactive_on = False
+flux = 3c279
+bpcal = 3c279
+pcal1 = 3c279
+pcal2 = 3c279
+science_fields = target
+is_mosaic = False
+"""
+
+
+def _write_field_tables(folder, ext):
+
+    main, subtables = make_synthetic_ms(model_scale=0.5)
+    backend = DictTableBackend(main, subtables)
+
+    for field_id, field_name in enumerate(['3c279', 'target']):
+
+        products = {key: product for key, product in QA_TABLE_MAPPING.items()
+                    if field_name == '3c279' or not product['calibrator_only']}
+        filenames = {key: os.path.join(folder, f"field_{field_name}_{key}.{ext}")
+                     for key in products}
+
+        export_field_tables(backend, field_id, field_name, products, filenames,
+                            chanavg_vs_chan=4, vis='track.ms')
+
+    # Other files in the folder that are not per-field QA tables.
+    write_npz_table(os.path.join(folder, "field_target_scan_stats.npz"),
+                    {'scan': np.array([1])}, {'field': 'target'})
+
+    with open(os.path.join(folder, "export_manifest.json"), 'w') as f:
+        f.write("{}")
+
+
+@pytest.mark.parametrize('ext', ['npz', 'txt.gz', 'txt.zst'])
+def test_field_tables_folder(tmp_path, ext):
+
+    # The tables make_field_plots finds and reads from an export folder.
+    _write_field_tables(str(tmp_path), ext)
+
+    assert find_field_names(str(tmp_path)) == ['3c279', 'target']
+
+    assert len(read_field_data_tables('3c279', str(tmp_path))[0]) == 10
+    assert len(read_field_data_tables('target', str(tmp_path))[0]) == 3
+
+
+@pytest.mark.parametrize('ext', ['npz', 'txt.gz', 'txt.zst'])
+def test_make_field_plots(tmp_path, ext):
+
+    # track_set makes the figures with qaplotter.
+    pytest.importorskip("qaplotter.field_plots")
+
+    from quicklook_sma.track_set import make_field_plots
+
+    folder = tmp_path / "tables"
+    folder.mkdir()
+
+    _write_field_tables(str(folder), ext)
+
+    config_filename = tmp_path / "track.cfg"
+    config_filename.write_text(CONFIG)
+
+    output_folder = tmp_path / "pages"
+
+    make_field_plots(str(config_filename), str(folder), str(output_folder),
+                     save_fieldnames=True)
+
+    assert (output_folder / "fieldnames.txt").read_text().split() == ['3c279', 'target']
+
+    for name in ["3c279_plotly_interactive.html", "target_plotly_interactive.html",
+                 "target_amptime_summary_plotly_interactive.html"]:
+        assert (output_folder / name).exists(), name
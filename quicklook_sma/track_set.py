@@ -8,8 +8,7 @@ import numpy as np
 
 from qaplotter.field_plots import target_scan_figure, calibrator_scan_figure
 
-from qaplotter.target_summary_plots import (target_summary_ampfreq_figure,
-                                            target_summary_amptime_figure)
+from qaplotter.target_summary_plots import target_summary_ampfreq_figure
 
 from qaplotter.quicklook_target_imaging import make_quicklook_figures
 
@@ -30,6 +29,8 @@ from quicklook_sma.html_linking import (make_all_html_links, make_html_homepage,
 from quicklook_sma.utilities import read_config, get_calfields, get_field_intents
 
 from quicklook_sma.read_data_sma import (read_field_data_tables,
+                                find_field_names,
+                                build_caltable_index,
                                 read_bpcal_data_tables,
                                 read_BPinitialgain_data_tables,
                                 read_phaseshortgaincal_data_tables,
@@ -40,14 +41,20 @@ from quicklook_sma.read_data_sma import (read_field_data_tables,
 
 from quicklook_sma.sma_flux_vals import plot_all_calfluxes
 
+from quicklook_sma.target_summary_plots import target_summary_amptime_figure
 
-def make_all_cal_plots(folder, output_folder):
+
+def make_all_cal_plots(folder, output_folder, workers=1):
 
     fig_names = {}
 
+    # Parse the caltable txt filenames once for all the readers below.
+    caltable_index = build_caltable_index(folder)
+
     # Bandpass plots
 
-    table_dict, meta_dict = read_bpcal_data_tables(folder)
+    table_dict, meta_dict = read_bpcal_data_tables(folder, index=caltable_index,
+                                                   workers=workers)
 
     # Check if files exist. If not, skip.
     key0 = list(table_dict.keys())[0]
@@ -72,7 +79,8 @@ def make_all_cal_plots(folder, output_folder):
             fig_names[f"{label} {i+1}"] = out_html_name
 
     # Phase gain cal
-    table_dict, meta_dict = read_phasegaincal_data_tables(folder)
+    table_dict, meta_dict = read_phasegaincal_data_tables(folder, index=caltable_index,
+                                                          workers=workers)
 
     key0 = list(table_dict.keys())[0]
     if len(table_dict[key0]) > 0:
@@ -90,7 +98,8 @@ def make_all_cal_plots(folder, output_folder):
             fig_names[f"{label} {i+1}"] = out_html_name
 
     # Amp gain cal time
-    table_dict, meta_dict = read_ampgaincal_time_data_tables(folder)
+    table_dict, meta_dict = read_ampgaincal_time_data_tables(folder, index=caltable_index,
+                                                             workers=workers)
 
     key0 = list(table_dict.keys())[0]
     if len(table_dict[key0]) > 0:
@@ -108,7 +117,8 @@ def make_all_cal_plots(folder, output_folder):
             fig_names[f"{label} {i+1}"] = out_html_name
 
     # Amp gain cal freq
-    table_dict, meta_dict = read_ampgaincal_freq_data_tables(folder)
+    table_dict, meta_dict = read_ampgaincal_freq_data_tables(folder, index=caltable_index,
+                                                             workers=workers)
 
     key0 = list(table_dict.keys())[0]
     if len(table_dict[key0]) > 0:
@@ -125,7 +135,7 @@ def make_all_cal_plots(folder, output_folder):
             fig_names[f"{label} {i+1}"] = out_html_name
 
     # BLcal
-    # table_dict, meta_dict = read_blcal_freq_data_tables(folder)
+    # table_dict, meta_dict = read_blcal_freq_data_tables(folder, index=caltable_index)
 
     # # Check if files exist. If not, skip.
     # key0 = list(table_dict.keys())[0]
@@ -145,7 +155,8 @@ def make_all_cal_plots(folder, output_folder):
     # phase short gain cal
 
     # Check if files exist. If not, skip.
-    table_dict, meta_dict = read_phaseshortgaincal_data_tables(folder)
+    table_dict, meta_dict = read_phaseshortgaincal_data_tables(folder, index=caltable_index,
+                                                               workers=workers)
 
     key0 = list(table_dict.keys())[0]
     if len(table_dict[key0]) > 0:
@@ -163,7 +174,8 @@ def make_all_cal_plots(folder, output_folder):
             fig_names[f"{label} {i+1}"] = out_html_name
 
     # BP init phase
-    table_dict, meta_dict = read_BPinitialgain_data_tables(folder)
+    table_dict, meta_dict = read_BPinitialgain_data_tables(folder, index=caltable_index,
+                                                           workers=workers)
 
     # Check if files exist. If not, skip.
     key0 = list(table_dict.keys())[0]
@@ -187,30 +199,40 @@ def make_all_cal_plots(folder, output_folder):
 
 
 
+def _get_field_intent(field, config):
+    '''
+    Return the intent of `field` from the config, or an empty string if it
+    cannot be determined.
+    '''
+
+    try:
+        return get_field_intents(field, config)
+    except Exception as exc:
+        warnings.warn(f"Unable to find field intent. Raise exception: {exc}")
+        return ''
+
+
 def make_field_plots(config_filename, folder, output_folder,
                      save_fieldnames=False,
-                     corrs=['XX', 'YY']):
+                     corrs=['XX', 'YY'],
+                     workers=1,
+                     max_points=None):
     '''
     Make all scan plots into an HTML for each target.
+
+    `max_points` reduces each table to roughly that many rows while it is
+    read (see `read_data_sma.read_casa_txt_downsampled`).
     '''
 
     this_config = read_config(config_filename)
 
-    # Grab all text files.
-    txt_files = glob(f"{folder}/*.txt")
+    # Fields with tables in any of the exported formats.
+    fieldnames = find_field_names(folder)
 
     # Make output folder if it doesn't exist
     if not os.path.exists(output_folder):
         os.mkdir(output_folder)
 
-    def get_fieldname(filename):
-        return "_".join(os.path.basename(filename).split("_")[1:-2])
-
-    fieldnames = [get_fieldname(filename) for filename in txt_files]
-
-    # Get unique names only
-    fieldnames = sorted(list(set(fieldnames)))
-
     if save_fieldnames:
         field_txtfilename = f"{output_folder}/fieldnames.txt"
 
@@ -222,23 +244,39 @@ def make_field_plots(config_filename, folder, output_folder,
             for field in fieldnames:
                 f.write(f"{field}\n")
 
-    meta_dict_0 = read_field_data_tables(fieldnames[0], folder)[1]['amp_time']
+    # The intents only depend on the config. Find them once for all fields.
+    field_intents = {field: _get_field_intent(field, this_config)
+                     for field in fieldnames}
+
+    target_fields = [field for field in fieldnames
+                     if "target" in field_intents[field].lower()]
+
+    meta_dict_0 = None
 
-    field_intents = {}
+    # amp-time tables of the target fields, kept for the summary figure.
+    summary_tables = {}
 
+    # Each field's tables are loaded once, used for its figure and then
+    # released before the next field is loaded. Only the headers are read
+    # until the figure is made, so a field with the wrong set of tables is
+    # rejected without parsing any of them.
     for i, field in enumerate(fieldnames):
 
-        table_dict, meta_dict = read_field_data_tables(field, folder)
+        table_dict, meta_dict = read_field_data_tables(field, folder, max_points=max_points,
+                                                       lazy=True)
 
-        try:
-            field_intent = get_field_intents(field, this_config)
-        except Exception as exc:
-            warnings.warn(f"Unable to find field intent. Raise exception: {exc}")
-            field_intent = ''
+        if meta_dict_0 is None:
+            meta_dict_0 = meta_dict['amp_time']
 
-        meta_dict['intent'] = field_intent
+        meta_dict['intent'] = field_intents[field]
+
+        # 3 tables for a target. 10 for a calibrator with amp/phase versus
+        # ant 1, 8 without.
+        if len(table_dict.keys()) not in [3, 8, 10]:
+            raise ValueError(f"Found {len(table_dict.keys())} tables for {field} instead of 3 or 10.")
 
-        field_intents[field] = field_intent
+        # The figures use every table. Parse them at once with `workers`.
+        table_dict.load(workers=workers)
 
         # Target
         if len(table_dict.keys()) == 3:
@@ -247,45 +285,33 @@ def make_field_plots(config_filename, folder, output_folder,
                                      spw_dict=None,
                                      show_linesonly=False)
 
-        # 10 with amp/phase versus ant 1. 8 without.
-        elif len(table_dict.keys()) == 10 or len(table_dict.keys()) == 8:
+        else:
 
             fig = calibrator_scan_figure(table_dict, meta_dict, show=False, corrs=corrs,
                                          spw_dict=None)
 
-        else:
-            raise ValueError(f"Found {len(table_dict.keys())} tables for {field} instead of 3 or 10.")
-
         out_html_name = f"{field}_plotly_interactive.html"
         fig.write_html(f"{output_folder}/{out_html_name}")
 
-    # Create summary tables using all target fields
-    target_fields = []
-
-    for i, field in enumerate(fieldnames):
-
-        table_dict, meta_dict = read_field_data_tables(field, folder)
+        if field in target_fields and 'amp_time' in table_dict:
+            summary_tables[field] = table_dict['amp_time']
 
-        try:
-            field_intent = get_field_intents(field, this_config)
-        except Exception as exc:
-            warnings.warn(f"Unable to find field intent. Raise exception: {exc}")
-            field_intent = ''
+        table_dict.release()
 
-        if "target" in field_intent.lower():
-            target_fields.append(field)
+        del table_dict, fig
 
-    # Create target field summary plots
+    # Create target field summary plots from the tables loaded above.
     # First check that there were target fields.
 
-    if len(target_fields) > 0:
+    if len(summary_tables) > 0:
 
         try:
             fig_summ_time = target_summary_amptime_figure(target_fields, folder,
-                                                        corrs=corrs,
-                                                        spw_dict=None,
-                                                        show_linesonly=False,
-                                                        telescope='sma')
+                                                          corrs=corrs,
+                                                          spw_dict=None,
+                                                          show_linesonly=False,
+                                                          telescope='sma',
+                                                          amp_time_tables=summary_tables)
             out_html_name = f"target_amptime_summary_plotly_interactive.html"
             fig_summ_time.write_html(f"{output_folder}/{out_html_name}")
         except Exception as exc:
@@ -339,7 +365,9 @@ def make_all_plots(config_filename=None,
                    corrs=['XX', 'YY'],
                    logfile_name='casa_reduction.log',
                    flagfile_name='manual_flags.txt',
-                   script_name='casa_reduction_script.py'
+                   script_name='casa_reduction_script.py',
+                   workers=1,
+                   max_points=None,
                    ):
     '''
 
@@ -356,6 +384,11 @@ def make_all_plots(config_filename=None,
     corrs : list, optional
         Give which correlations to show in the plots. Default is ['XX', 'YY']. To show
         the cross terms, give: ['LL', 'RR', 'LR', 'RL'].
+    workers : int or None, optional
+        Number of processes used to parse the txt tables. `None` uses all CPUs.
+    max_points : int, optional
+        Reduce each per-field table to roughly this many rows while reading.
+        Useful for the full-resolution amp vs. channel tables.
     '''
 
     ms_info_dict = {}
@@ -396,11 +429,13 @@ def make_all_plots(config_filename=None,
 
     make_field_plots(config_filename, folder_fields, output_folder_fields,
                      save_fieldnames=save_fieldnames,
-                     corrs=corrs)
+                     corrs=corrs,
+                     workers=workers,
+                     max_points=max_points)
 
     if os.path.exists(folder_cals):
         # Calibration plots
-        make_all_cal_plots(folder_cals, output_folder_cals)
+        make_all_cal_plots(folder_cals, output_folder_cals, workers=workers)
 
     else:
         print("No cal plot txt files were found. Skipping.")